@@ -1,261 +1,55 @@
 import streamlit as st
-import pandas as pd
 import xml.etree.ElementTree as ET
 import base64
-from datetime import datetime
-import io
-from io import BytesIO
-import re
+import os
+import shutil
+import sqlite3
+import time
+from nfe_batch import convert_files, default_workers, new_rows
+from nfe_catalog import load_ean_index
+from nfe_dedup import ALREADY_CONVERTED, INDEX_PATH, KeyIndex, access_key, split_duplicates
+from nfe_export import PARQUET_AVAILABLE, parquet_bytes, write_xlsx_frames, xlsx_bytes
+from nfe_lazy import lazy_import
+from nfe_metrics import Metrics, stage
+from nfe_profiles import get_profile, profile_names
+from nfe_spill import BUFFER_SHARE, DEFAULT_BUDGET_MB, MB, SpillStore
 
-def parse_nfe_xml(xml_content):
+# Importados só quando usados: o perfil do cliente é carregado ao ser selecionado
+pd = lazy_import('pandas')
+xmlLABORLOG = lazy_import('xmlLABORLOG')
+xmlCARGILL = lazy_import('xmlCARGILL')
+
+DOWNLOAD_LABELS = {
+    'csv': "Download CSV File",
+    'xlsx': "Download Excel File",
+    'parquet': "Download Parquet File",
+}
+MIME_TYPES = {
+    'csv': "text/csv",
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'parquet': "application/vnd.apache.parquet",
+}
+
+def parse_nfe_xml(xml_content, streaming=False):
     """
-    Parse NFe XML content and extract relevant data.
+    Parse NFe XML content and extract relevant data (see xmlLABORLOG.parse_nfe_xml).
+    Errors are shown with st.error and None is returned.
     """
-    # Define namespace
-    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-    
-    # Parse XML content
     try:
-        root = ET.fromstring(xml_content)
+        return xmlLABORLOG.parse_nfe_xml(xml_content, streaming=streaming)
     except ET.ParseError:
         st.error("Invalid XML format")
         return None
-    
-    # Find NFe element
-    if 'nfeProc' in root.tag:
-        nfe = root.find('.//nfe:NFe', ns)
-    else:
-        nfe = root if 'NFe' in root.tag else None
-    
-    if nfe is None:
-        st.error("NFe not found in XML")
-        return None
-    
-    # Extract infNFe data
-    inf_nfe = nfe.find('.//nfe:infNFe', ns)
-    if inf_nfe is None:
-        st.error("infNFe not found in XML")
+    except ValueError as e:
+        st.error(str(e))
         return None
-    
-    # Extract general invoice information
-    ide = inf_nfe.find('.//nfe:ide', ns)
-    emit = inf_nfe.find('.//nfe:emit', ns)  # Fornecedor (emitente)
-    dest = inf_nfe.find('.//nfe:dest', ns)
-    total = inf_nfe.find('.//nfe:total/nfe:ICMSTot', ns)
 
-    # Extract supplier (fornecedor) information
-    forn_razao = emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else ""
-    forn_cnpj = emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else ""
-    forn_ie = emit.find('nfe:IE', ns).text if emit.find('nfe:IE', ns) is not None else ""
-    forn_endereco = emit.find('.//nfe:enderEmit/nfe:xLgr', ns).text if emit.find('.//nfe:enderEmit/nfe:xLgr', ns) is not None else ""
-    forn_bairro = emit.find('.//nfe:enderEmit/nfe:xBairro', ns).text if emit.find('.//nfe:enderEmit/nfe:xBairro', ns) is not None else ""
-    forn_cidade = emit.find('.//nfe:enderEmit/nfe:xMun', ns).text if emit.find('.//nfe:enderEmit/nfe:xMun', ns) is not None else ""
-    forn_uf = emit.find('.//nfe:enderEmit/nfe:UF', ns).text if emit.find('.//nfe:enderEmit/nfe:UF', ns) is not None else ""
-    forn_cep = emit.find('.//nfe:enderEmit/nfe:CEP', ns).text if emit.find('.//nfe:enderEmit/nfe:CEP', ns) is not None else ""
-
-    # Get emission date and time
-    dhEmi = ide.find('nfe:dhEmi', ns).text if ide.find('nfe:dhEmi', ns) is not None else ""
-    dt_emissao = ""
-    hora_emissao = ""
-    if dhEmi:
-        try:
-            dt_obj = datetime.fromisoformat(dhEmi.replace('Z', '+00:00'))
-            dt_emissao = dt_obj.strftime('%Y-%m-%d')
-            hora_emissao = dt_obj.strftime('%H:%M:%S')
-        except ValueError:
-            dt_emissao = dhEmi.split('T')[0] if 'T' in dhEmi else ""
-            hora_emissao = dhEmi.split('T')[1].split('-')[0] if 'T' in dhEmi else ""
-    
-    # Create general invoice data
-    invoice_data = {
-        'nf_numnota': ide.find('nfe:nNF', ns).text if ide.find('nfe:nNF', ns) is not None else "",
-        'nf_serie': ide.find('nfe:serie', ns).text if ide.find('nfe:serie', ns) is not None else "",
-        'nf_dt_emissao': "",  # Ensure empty
-        'nf_hora': "",        # Ensure empty
-        'nf_dt_entrada': "",  # Ensure empty
-        'nf_horaentrada': "", # Ensure empty
-        'nf_cfop': "",        # Will be filled from items
-        'nf_obs': "",
-        'nf_base_icms': total.find('nfe:vBC', ns).text if total.find('nfe:vBC', ns) is not None else "0",
-        'nf_valor_icms': total.find('nfe:vICMS', ns).text if total.find('nfe:vICMS', ns) is not None else "0",
-        'nf_valor_total': total.find('nfe:vNF', ns).text if total.find('nfe:vNF', ns) is not None else "0",
-        'nf_valor_total_prod': total.find('nfe:vProd', ns).text if total.find('nfe:vProd', ns) is not None else "0",
-        
-        # Client information
-        'cli_razao': "",      # Ensure empty
-        'cli_cnpj': "",       # Ensure empty
-        'cli_ie': "",         # Ensure empty
-        'cli_endereco': "",   # Ensure empty
-        'cli_bairro': "",     # Ensure empty
-        'cli_cidade': "",     # Ensure empty
-        'cli_uf': "",         # Ensure empty
-        'cli_cep': "",        # Ensure empty
-
-        # Supplier (fornecedor) information
-        'forn_razao': forn_razao,
-        'forn_cnpj': forn_cnpj,
-        'forn_ie': forn_ie,
-        'forn_endereco': forn_endereco,
-        'forn_bairro': forn_bairro,
-        'forn_cidade': forn_cidade,
-        'forn_uf': forn_uf,
-        'forn_cep': forn_cep,
-    }
-    
-    # Extract items
-    items = []
-    for det in inf_nfe.findall('.//nfe:det', ns):
-        prod = det.find('nfe:prod', ns)
-        imposto = det.find('nfe:imposto', ns)
-        
-        # Get ICMS data
-        icms_tag = imposto.find('.//nfe:ICMS', ns)
-        icms_values = {}
-        if icms_tag is not None:
-            # Try different ICMS types
-            for icms_type in ['ICMS00', 'ICMS10', 'ICMS20', 'ICMS30', 'ICMS40', 'ICMS51', 'ICMS60', 'ICMS70', 'ICMS90']:
-                icms_specific = icms_tag.find(f'nfe:{icms_type}', ns)
-                if icms_specific is not None:
-                    icms_values['vICMS'] = icms_specific.find('nfe:vICMS', ns).text if icms_specific.find('nfe:vICMS', ns) is not None else "0"
-                    icms_values['pICMS'] = icms_specific.find('nfe:pICMS', ns).text if icms_specific.find('nfe:pICMS', ns) is not None else "0"
-                    break
-        
-        # Get IPI data
-        ipi_tag = imposto.find('.//nfe:IPI', ns)
-        ipi_values = {"vIPI": "0", "pIPI": "0"}
-        if ipi_tag is not None:
-            # Try different IPI types
-            for ipi_type in ['IPITrib']:
-                ipi_specific = ipi_tag.find(f'nfe:{ipi_type}', ns)
-                if ipi_specific is not None:
-                    ipi_values['vIPI'] = ipi_specific.find('nfe:vIPI', ns).text if ipi_specific.find('nfe:vIPI', ns) is not None else "0"
-                    ipi_values['pIPI'] = ipi_specific.find('nfe:pIPI', ns).text if ipi_specific.find('nfe:pIPI', ns) is not None else "0"
-                    break
-        
-        # Get item lot information
-        rastro = prod.find('nfe:rastro', ns)
-        lote = ""
-        if rastro is not None:
-            lote = rastro.find('nfe:nLote', ns).text if rastro.find('nfe:nLote', ns) is not None else ""
-        
-        # CFOP for invoice
-        cfop = prod.find('nfe:CFOP', ns).text if prod.find('nfe:CFOP', ns) is not None else ""
-        if cfop and not invoice_data['nf_cfop']:
-            invoice_data['nf_cfop'] = cfop
-        
-        # Extrair o código EAN do produto
-        ean = prod.find('nfe:cEAN', ns).text if prod.find('nfe:cEAN', ns) is not None else ""
-        
-        # Extract product data
-        item = {
-            'item_codigo': prod.find('nfe:cProd', ns).text if prod.find('nfe:cProd', ns) is not None else "",
-            'item_ean': ean,  # Armazenar o EAN para uso posterior no PROCV
-            'item_descricao': prod.find('nfe:xProd', ns).text if prod.find('nfe:xProd', ns) is not None else "",
-            'item_ncm': prod.find('nfe:NCM', ns).text if prod.find('nfe:NCM', ns) is not None else "",
-            'item_un': prod.find('nfe:uCom', ns).text if prod.find('nfe:uCom', ns) is not None else "",
-            'item_qtde': prod.find('nfe:qCom', ns).text if prod.find('nfe:qCom', ns) is not None else "0",
-            'item_lote': lote,
-            'item_serial': "",     # Ensure empty
-            'item_modelo': "",     # Ensure empty
-            'item_valor_unit': prod.find('nfe:vUnCom', ns).text if prod.find('nfe:vUnCom', ns) is not None else "0",
-            'item_valor_total': prod.find('nfe:vProd', ns).text if prod.find('nfe:vProd', ns) is not None else "0",
-            'item_valor_icms': "", # Ensure empty
-            'item_valor_ipi': "",  # Ensure empty
-            'item_aliq_icms': "",  # Ensure empty
-            'item_aliq_ipi': "",   # Ensure empty
-        }
-        
-        items.append({**invoice_data, **item})
-    
-    return items
-
-def generate_csv(data):
-    """
-    Convert parsed data to CSV format with specific column order.
-    """
-    if not data:
-        return None
-    
-    df = pd.DataFrame(data)
-    
-    # Select only the specified columns
-    columns = [
-        'nf_numnota',      # Número da Nota Fiscal
-        'nf_serie',        # Série da Nota Fiscal
-        'nf_dt_emissao',   # Data de Emissão
-        'nf_hora',         # Hora de Emissão
-        'nf_dt_entrada',   # Data de Entrada
-        'nf_horaentrada',  # Hora de Entrada
-        'nf_cfop',         # CFOP
-        'nf_obs',          # Observações
-        'nf_base_icms',    # Base ICMS
-        'nf_valor_icms',   # Valor ICMS
-        'nf_valor_total',  # Valor Total
-        'nf_valor_total_prod', # Valor Total dos Produtos
-        'cli_razao',       # Razão Social do Cliente
-        'cli_cnpj',        # CNPJ do Cliente
-        'cli_ie',          # Inscrição Estadual do Cliente
-        'cli_endereco',    # Endereço do Cliente
-        'cli_bairro',      # Bairro do Cliente
-        'cli_cidade',      # Cidade do Cliente
-        'cli_uf',          # UF do Cliente
-        'cli_cep',         # CEP do Cliente
-        'forn_razao',      # Razão Social do Fornecedor
-        'forn_cnpj',       # CNPJ do Fornecedor
-        'forn_ie',         # Inscrição Estadual do Fornecedor
-        'forn_endereco',   # Endereço do Fornecedor
-        'forn_bairro',     # Bairro do Fornecedor
-        'forn_cidade',     # Cidade do Fornecedor
-        'forn_uf',         # UF do Fornecedor
-        'forn_cep',        # CEP do Fornecedor
-        'item_codigo',     # Código do Item
-        'item_descricao',  # Descrição do Item
-        'item_ncm',        # NCM do Item
-        'item_un',         # Unidade do Item
-        'item_qtde',       # Quantidade do Item
-        'item_lote',       # Lote do Item
-        'item_serial',     # Serial do Item
-        'item_modelo',     # Modelo do Item
-        'item_valor_unit', # Valor Unitário do Item
-        'item_valor_total',# Valor Total do Item
-        'item_valor_icms', # Valor ICMS do Item
-        'item_valor_ipi',  # Valor IPI do Item
-        'item_aliq_icms',  # Alíquota ICMS do Item
-        'item_aliq_ipi'    # Alíquota IPI do Item
-    ]
-    
-    # Ensure all columns exist (with empty values if needed)
-    for col in columns:
-        if col not in df.columns:
-            df[col] = ""
-    
-    # Reorder columns to ensure they appear in the CSV in the correct order
-    df = df[columns]
-    
-    # Ensure specific columns are treated as text
-    text_columns = [
-        'forn_razao', 
-        'forn_endereco', 'forn_bairro', 'forn_cidade', 
-        'item_descricao', 'cli_razao', 'cli_cnpj', 'cli_ie', 
-        'cli_endereco', 'cli_bairro', 'cli_cidade'
-    ]
-    for col in text_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-    
-    # Format numeric columns to replace '.' with ',' for decimal separator
-    numeric_columns = [
-        'nf_base_icms', 'nf_valor_icms', 'nf_valor_total', 
-        'nf_valor_total_prod', 'item_valor_unit', 'item_valor_total', 
-        'item_qtde', 'item_valor_icms', 'item_valor_ipi', 
-        'item_aliq_icms', 'item_aliq_ipi'
-    ]
-    for col in numeric_columns:
-        if col in df.columns:
-            # Replace '.' with ',' without changing the structure of the number
-            df[col] = df[col].astype(str).str.replace('.', ',', regex=False)
-    
-    return df
+def generate_csv(data):
+    """
+    Convert parsed data to CSV format with specific column order (see
+    xmlLABORLOG.generate_csv; kept here for existing imports).
+    """
+    return xmlLABORLOG.generate_csv(data)
 
 def create_download_link(df, filename="nfe_data.csv"):
     """
@@ -281,6 +75,343 @@ def show_column_mapping(columns):
     
     return mapping
 
+def open_key_index():
+    """
+    Index of the access keys already converted, or None (with a warning) if it cannot be opened.
+    """
+    try:
+        return KeyIndex(INDEX_PATH)
+    except sqlite3.Error as e:
+        st.warning(f"Índice de notas convertidas indisponível ({INDEX_PATH}): {str(e)}")
+        return None
+
+def skip_duplicates(cliente, files, use_index):
+    """
+    Pre-scan the access keys and drop repeated invoices (and, with use_index,
+    the ones converted before). Returns the files to convert and their keys.
+    """
+    keyed_files = [(name, access_key(payload)) for name, payload in files]
+    # Keys recorded by this session come back on every rerun and are not duplicates
+    session_keys = st.session_state.setdefault('chaves_convertidas', {}).setdefault(cliente, set())
+
+    index = open_key_index() if use_index else None
+    try:
+        keep, skipped = split_duplicates(cliente, keyed_files, index, converted=session_keys)
+    finally:
+        if index is not None:
+            index.close()
+
+    if skipped:
+        with st.expander(f"{len(skipped)} arquivo(s) ignorado(s): notas repetidas ou já convertidas"):
+            skipped_df = pd.DataFrame(skipped)
+            st.dataframe(skipped_df)
+            st.download_button(
+                label="Baixar relatório de arquivos ignorados",
+                data=skipped_df.to_csv(index=False, sep=';', encoding='utf-8-sig'),
+                file_name="arquivos_ignorados.csv",
+                mime="text/csv"
+            )
+            already = [entry['chave'] for entry in skipped if entry['motivo'] == ALREADY_CONVERTED]
+            if already and st.button(f"Converter novamente as {len(already)} nota(s) já convertidas"):
+                # Chaves desta sessão não são tiradas do índice (ver split_duplicates)
+                session_keys.update(already)
+                st.rerun()
+    return [files[position] for position in keep], [keyed_files[position][1] for position in keep]
+
+def record_converted(cliente, entries, use_index):
+    """
+    Remember the (key, file) pairs converted by this session and, with use_index, in the index.
+    """
+    entries = [(key, name) for key, name in entries if key]
+    st.session_state['chaves_convertidas'][cliente].update(key for key, _ in entries)
+    if use_index and entries:
+        index = open_key_index()
+        if index is not None:
+            with index:
+                index.add(cliente, entries)
+
+def convert_uploads(cliente, uploaded_files, workers, metrics=None, use_index=False):
+    """
+    Parse the uploaded files for a client in parallel (see nfe_batch).
+    Returns all rows in upload order; files that fail are reported with st.error.
+    Invoices repeated in the upload (or already in the index, with use_index)
+    are skipped; None is returned when no file is left to convert.
+    """
+    with stage(metrics, 'read') as record:
+        files = [(uploaded_file.name, uploaded_file.read()) for uploaded_file in uploaded_files]
+        record['rows'] = len(files)
+
+    with stage(metrics, 'dedup') as record:
+        files, keys = skip_duplicates(cliente, files, use_index)
+        record['rows'] = len(files)
+    if not files:
+        st.info("Todas as notas enviadas já foram convertidas; nenhum arquivo novo para processar.")
+        return None
+
+    with st.spinner(f"Processando {len(files)} arquivo(s) para {cliente}..."):
+        with stage(metrics, 'convert') as record:
+            results = convert_files(cliente, files, workers, metrics=metrics)
+            record['rows'] = len(results)
+
+    all_data = new_rows(cliente)
+    converted = []
+    for (name, parsed_data, error), key in zip(results, keys):
+        if parsed_data:
+            all_data.extend(parsed_data)
+            converted.append((key, name))
+        else:
+            show_parse_error(name, error)
+    record_converted(cliente, converted, use_index)
+    return all_data
+
+def show_parse_error(name, error):
+    """
+    Report a file that could not be converted.
+    """
+    if error:
+        st.error(error)
+    st.error(f"Falha ao analisar o arquivo {name}. Verifique se é um arquivo XML de NFe válido.")
+
+def payload_groups(files, keys, max_bytes):
+    """
+    Split (name, payload) pairs and their keys into consecutive groups of at
+    most max_bytes of payload (a larger file makes a group of its own).
+    """
+    group = []
+    size = 0
+    for (name, payload), key in zip(files, keys):
+        if group and size + len(payload) > max_bytes:
+            yield group
+            group = []
+            size = 0
+        group.append((name, payload, key))
+        size += len(payload)
+    if group:
+        yield group
+
+def convert_uploads_spilling(cliente, uploaded_files, workers, store, metrics=None, use_index=False):
+    """
+    Limited-memory version of convert_uploads: the rows go to store (a
+    nfe_spill.SpillStore), which spills them to disk past its budget.
+    The files are read and converted in groups of a share of the budget;
+    the dedup pre-scan reads views of the upload buffers, without copies.
+    Returns False when no file is left to convert.
+    """
+    with stage(metrics, 'read') as record:
+        files = [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in uploaded_files]
+        record['rows'] = len(files)
+
+    with stage(metrics, 'dedup') as record:
+        files, keys = skip_duplicates(cliente, files, use_index)
+        record['rows'] = len(files)
+    if not files:
+        st.info("Todas as notas enviadas já foram convertidas; nenhum arquivo novo para processar.")
+        return False
+
+    converted = []
+    with st.spinner(f"Processando {len(files)} arquivo(s) para {cliente} com memória limitada..."):
+        for group in payload_groups(files, keys, store.budget_bytes // BUFFER_SHARE):
+            with stage(metrics, 'convert') as record:
+                # The pool pickles the payloads: only this group is copied to bytes.
+                # No parse cache: its rows would be held outside the budget
+                results = convert_files(cliente, [(name, bytes(payload)) for name, payload, _ in group],
+                                        workers, cache=False, metrics=metrics)
+                record['rows'] = len(results)
+            with stage(metrics, 'spill') as record:
+                for (name, parsed_data, error), (_, _, key) in zip(results, group):
+                    if parsed_data:
+                        store.add(parsed_data)
+                        converted.append((key, name))
+                    else:
+                        show_parse_error(name, error)
+                record['rows'] = len(store)
+    record_converted(cliente, converted, use_index)
+    return True
+
+def load_catalog(profile, metrics=None):
+    """
+    EAN catalog of the profile for the PROCV, with status messages; empty if
+    it cannot be loaded.
+    """
+    try:
+        # Índice EAN -> código do catálogo (PROCV), refeito só quando a planilha muda
+        with stage(metrics, 'catalog') as record:
+            ean_to_codigo, registros = load_ean_index(profile.catalog)
+            record['rows'] = len(ean_to_codigo)
+        st.success(f"Arquivo {profile.catalog} carregado com sucesso. {registros} registros encontrados.")
+
+        st.info(f"Mapeamento de {len(ean_to_codigo)} códigos EAN para {profile.catalog_code} preparado.")
+        return ean_to_codigo
+
+    except Exception as e:
+        st.error(f"Erro ao carregar {profile.catalog}: {str(e)}")
+        st.warning(f"O mapeamento EAN para {profile.catalog_code} não estará disponível.")
+        return {}
+
+def show_unmatched_eans(profile, eans_faltando):
+    """
+    Report of the EANs missing from the catalog of the profile, with a download button.
+    """
+    with st.expander(f"{len(eans_faltando)} códigos EAN não encontrados no {profile.catalog}"):
+        st.dataframe(eans_faltando)
+        st.download_button(
+            label="Baixar relatório de EANs não encontrados",
+            data=eans_faltando.to_csv(index=False, sep=';', encoding='utf-8-sig'),
+            file_name="eans_nao_encontrados.csv",
+            mime="text/csv"
+        )
+
+def show_file_download(path, formato, filename):
+    """
+    Download button for a file written to disk. Streamlit keeps the whole
+    file in memory to serve it (see export_spilled).
+    """
+    with open(path, 'rb') as f:
+        st.download_button(label=DOWNLOAD_LABELS[formato], data=f, file_name=filename, mime=MIME_TYPES[formato])
+
+def export_spilled(profile, store, catalog, metrics=None, output_dir=None):
+    """
+    Preview and downloads of the rows in store, written in one streaming pass
+    over its chunks: each chunk goes through the profile's build_table and is
+    appended to the CSV (and the Excel file, when the profile offers it).
+    The files are the same as in the normal mode; Parquet is not offered,
+    since Arrow would type each chunk on its own.
+    Writing the files is bounded by the budget, but a download button holds
+    its whole file in memory; with output_dir the files are moved to that
+    folder instead, without ever being loaded.
+    """
+    columns = profile.output_columns(store.present_columns())
+    csv_path = store.path(profile.file_name('csv'))
+    excel_path = store.path(profile.file_name('xlsx')) if 'xlsx' in profile.downloads else None
+    reports = []
+
+    inicio = time.perf_counter()
+    with stage(metrics, 'export') as record, open(csv_path, 'w', encoding='utf-8', newline='') as csv_out:
+        def frames():
+            # Cada bloco vai para o CSV e para a planilha antes do próximo ser lido
+            header = True
+            for table in store.chunks():
+                df, report = profile.build_table(table, catalog, metrics)
+                if df is None:
+                    continue
+                df = df.reindex(columns=columns)
+                csv_out.write(df.to_csv(index=False, sep=';', header=header))
+                header = False
+                reports.append(report)
+                yield df
+        if excel_path:
+            write_xlsx_frames(frames(), excel_path, columns)
+        else:
+            for _ in frames():
+                pass
+        record['rows'] = len(store)
+
+    if catalog and profile.merge_reports is not None:
+        eans_faltando = profile.merge_reports(reports)
+        if not eans_faltando.empty:
+            show_unmatched_eans(profile, eans_faltando)
+
+    st.subheader("Visualização dos Dados Convertidos")
+    preview, _ = profile.build_table(store.head(10), catalog)
+    st.dataframe(preview.reindex(columns=columns))
+
+    st.subheader("Download")
+    st.caption(f"Arquivos gerados em {time.perf_counter() - inicio:.2f} s ({len(store)} linhas; "
+               f"{store.spilled} bloco(s) gravado(s) em disco durante a conversão)")
+    paths = {'csv': csv_path, 'xlsx': excel_path}
+    files = [(formato, paths[formato]) for formato in profile.downloads if paths.get(formato)]
+
+    if output_dir:
+        # Movidos para a pasta sem passar pela memória do app
+        os.makedirs(output_dir, exist_ok=True)
+        for formato, path in files:
+            destino = os.path.join(output_dir, profile.file_name(formato))
+            shutil.move(path, destino)
+            st.success(f"Arquivo {formato.upper()} gravado em {destino}")
+        return
+
+    tamanho_mb = max(os.path.getsize(path) for _, path in files) / MB
+    st.warning(f"O botão de download carrega o arquivo inteiro na memória do app (até {tamanho_mb:.1f} MB "
+               "aqui), fora do orçamento. Para arquivos maiores que a memória disponível, informe "
+               "\"Salvar arquivos na pasta\" na barra lateral.")
+    for formato, path in files:
+        show_file_download(path, formato, profile.file_name(formato))
+
+def process_spilling(profile, uploaded_files, workers, budget_mb, catalog, metrics=None, use_index=False,
+                     output_dir=None):
+    """
+    Limited-memory mode: convert into a SpillStore of budget_mb and export
+    from its chunks (to output_dir when given, see export_spilled). The
+    temporary chunk and output files are removed before returning, also on
+    errors.
+    """
+    with SpillStore(profile.new_table, budget_mb * MB) as store:
+        if not convert_uploads_spilling(profile.name, uploaded_files, workers, store, metrics, use_index):
+            return
+        if not len(store):
+            st.error("Nenhum dado válido foi extraído dos arquivos XML.")
+        else:
+            export_spilled(profile, store, catalog, metrics, output_dir)
+
+def show_parquet_download(profile, final_df, metrics=None):
+    """
+    Download the table as Parquet with typed columns (only when pyarrow is installed).
+    """
+    if not PARQUET_AVAILABLE:
+        return
+    with stage(metrics, 'export_parquet') as record:
+        parquet_data = parquet_bytes(profile.typed_table(final_df))
+        record['rows'] = len(final_df)
+    st.download_button(
+        label=DOWNLOAD_LABELS['parquet'],
+        data=parquet_data,
+        file_name=profile.file_name('parquet'),
+        mime=MIME_TYPES['parquet'],
+        help="Colunas numéricas tipadas, para análise (pandas, Power BI, DuckDB)."
+    )
+
+def show_downloads(profile, final_df, metrics=None):
+    """
+    Download buttons for the output formats of the profile, in its order.
+    """
+    for formato in profile.downloads:
+        if formato == 'parquet':
+            show_parquet_download(profile, final_df, metrics)
+            continue
+
+        inicio = time.perf_counter()
+        with stage(metrics, 'export_' + formato) as record:
+            if formato == 'xlsx':
+                data = xlsx_bytes(final_df)
+            else:
+                data = final_df.to_csv(index=False, sep=';', encoding='utf-8-sig')
+            record['rows'] = len(final_df)
+        if formato == 'xlsx':
+            st.caption(f"Excel gerado em {time.perf_counter() - inicio:.2f} s ({len(final_df)} linhas)")
+
+        st.download_button(
+            label=DOWNLOAD_LABELS[formato],
+            data=data,
+            file_name=profile.file_name(formato),
+            mime=MIME_TYPES[formato]
+        )
+
+def show_metrics(metrics):
+    """
+    Sidebar panel with the time, rows and peak memory of each stage and file.
+    """
+    st.sidebar.subheader("Métricas de desempenho")
+    st.sidebar.dataframe(pd.DataFrame(metrics.summary()), hide_index=True)
+    if metrics.files:
+        with st.sidebar.expander(f"Por arquivo ({len(metrics.files)})"):
+            st.dataframe(pd.DataFrame(metrics.files).sort_values('seconds', ascending=False), hide_index=True)
+    st.sidebar.download_button(
+        label="Baixar métricas (JSON)",
+        data=metrics.to_json(),
+        file_name="metricas_conversao.json",
+        mime="application/json"
+    )
+
 def main():
     # Set page configuration with logo and new title
     st.set_page_config(
@@ -292,14 +423,62 @@ def main():
     # Add logo to the sidebar
     st.sidebar.image("Logo Solution.png", use_container_width=True)
     
+    # Number of worker processes used to parse the uploaded files
+    workers = st.sidebar.number_input(
+        "Processos paralelos",
+        min_value=1,
+        max_value=max(default_workers(), os.cpu_count() or 1),
+        value=default_workers(),
+        help="Quantidade de processos usados para converter os arquivos XML em paralelo."
+    )
+
+    # Instrumentation is off by default: without it no stage is measured
+    metrics = None
+    if st.sidebar.checkbox("Métricas de desempenho", help="Tempo, linhas e pico de memória por etapa e por arquivo."):
+        trace_memory = st.sidebar.checkbox(
+            "Medir memória por etapa",
+            help="Usa tracemalloc: mede o pico de cada etapa, mas deixa a conversão mais lenta."
+        )
+        metrics = Metrics(trace_memory=trace_memory)
+
+    # Notas repetidas no envio são sempre ignoradas; as de envios anteriores, só com o índice
+    use_index = st.sidebar.checkbox(
+        "Ignorar notas já convertidas",
+        value=False,
+        help="Guarda as chaves de acesso convertidas por cliente e ignora as notas reenviadas "
+             "(que podem ser convertidas de novo pela lista de arquivos ignorados)."
+    )
+
+    # Envios muito grandes: além do orçamento, as linhas convertidas vão para blocos em disco
+    budget_mb = None
+    output_dir = None
+    if st.sidebar.checkbox(
+        "Memória limitada",
+        help="Para envios muito grandes: grava as linhas convertidas em disco além do orçamento "
+             "e gera os arquivos lendo um bloco por vez (sem Parquet)."
+    ):
+        budget_mb = st.sidebar.number_input(
+            "Orçamento de memória (MB)",
+            min_value=16,
+            value=DEFAULT_BUDGET_MB,
+            step=64,
+            help="Memória aproximada para as linhas convertidas e os arquivos em processamento. "
+                 "Não inclui o botão de download, que carrega o arquivo inteiro."
+        )
+        output_dir = st.sidebar.text_input(
+            "Salvar arquivos na pasta",
+            help="Pasta do servidor onde o CSV e o Excel são gravados, sem passar pela memória do app. "
+                 "Vazio: botões de download."
+        ).strip() or None
+    
     # Update the title
     st.title("Conversor XML-CSV Solution")
     st.write("Faça upload de arquivos XML de Nota Fiscal Eletrônica (NFe) para convertê-los para CSV em formato tabular.")
 
-    # Dropdown de seleção de cliente
+    # Dropdown de seleção de cliente (os perfis registrados em nfe_profiles)
     cliente = st.selectbox(
         "Selecione o cliente:",
-        ["Laborlog", "Cargill"],
+        profile_names(),
         help="Selecione o cliente para o qual deseja processar os arquivos XML."
     )
 
@@ -307,129 +486,30 @@ def main():
     uploaded_files = st.file_uploader("Escolha os arquivos XML", type="xml", accept_multiple_files=True)
     
     if uploaded_files:
+        # Perfil do cliente: colunas, parser, pós-processamento e formatos de saída
+        profile = get_profile(cliente)
         try:
             all_data = []  # List to store data from all XML files
 
-            if cliente == "Laborlog":
-                # Carregar o arquivo laborlog.xlsx
-                laborlog_path = "laborlog.xlsx"
-                try:
-                    # Carregar a planilha laborlog.xlsx explicitamente definindo os tipos de coluna
-                    laborlog_df = pd.read_excel(laborlog_path, dtype={'EAN': str, 'CÓD. LABORLOG': str})
-                    st.success(f"Arquivo laborlog.xlsx carregado com sucesso. {len(laborlog_df)} registros encontrados.")
+            # Catálogo do PROCV, para os perfis que usam um (ex.: laborlog.xlsx)
+            catalog = load_catalog(profile, metrics) if profile.catalog else None
 
-                    # Criar um dicionário para o PROCV: EAN -> CÓD. LABORLOG
-                    ean_to_codigo = {}
-                    for index, row in laborlog_df.iterrows():
-                        if pd.notna(row['EAN']) and pd.notna(row['CÓD. LABORLOG']):
-                            ean_to_codigo[str(row['EAN']).strip()] = str(row['CÓD. LABORLOG']).strip()
-
-                    st.info(f"Mapeamento de {len(ean_to_codigo)} códigos EAN para CÓD. LABORLOG preparado.")
-
-                except Exception as e:
-                    st.error(f"Erro ao carregar laborlog.xlsx: {str(e)}")
-                    st.warning("O mapeamento EAN para CÓD. LABORLOG não estará disponível.")
-                    ean_to_codigo = {}
-
-                # Processar arquivos XML para Laborlog
-                for uploaded_file in uploaded_files:
-                    xml_content = uploaded_file.read().decode('utf-8')
-                    xml_content = re.sub(r'^\xef\xbb\xbf', '', xml_content)
-
-                    with st.spinner(f"Processando arquivo {uploaded_file.name}..."):
-                        parsed_data = parse_nfe_xml(xml_content)
-
-                        if parsed_data:
-                            all_data.extend(parsed_data)
-                        else:
-                            st.error(f"Falha ao analisar o arquivo {uploaded_file.name}. Verifique se é um arquivo XML de NFe válido.")
+            if budget_mb:
+                # Memória limitada: conversão, prévia e downloads a partir dos blocos em disco
+                process_spilling(profile, uploaded_files, workers, budget_mb, catalog, metrics, use_index,
+                                 output_dir)
+                all_data = None
+            else:
+                # Processar arquivos XML do cliente
+                all_data = convert_uploads(cliente, uploaded_files, workers, metrics, use_index)
 
                 if all_data:
-                    # Converter dados para DataFrame
-                    df = pd.DataFrame(all_data)
-
-                    # Aplicar o PROCV utilizando o EAN para cada linha
-                    # Adicionar uma coluna para mostrar quais códigos EAN foram encontrados/não encontrados
-                    df['status_procv'] = ''
-
-                    if ean_to_codigo:
-                        for idx, row in df.iterrows():
-                            if 'item_ean' in row and row['item_ean'] and str(row['item_ean']).strip() in ean_to_codigo:
-                                # Se o EAN existe no dicionário, substituir o valor de item_codigo
-                                df.at[idx, 'item_codigo'] = ean_to_codigo[str(row['item_ean']).strip()]
-                                df.at[idx, 'status_procv'] = 'Encontrado'
-                            else:
-                                # Se o EAN não existe ou está vazio, definir como "ERRO"
-                                df.at[idx, 'item_codigo'] = "ERRO"
-                                df.at[idx, 'status_procv'] = 'Não encontrado'
-
-                    # Remover colunas temporárias antes de gerar o CSV final
-                    if 'item_ean' in df.columns:
-                        df = df.drop('item_ean', axis=1)
-                    if 'status_procv' in df.columns:
-                        df = df.drop('status_procv', axis=1)
-
-                    # Gerar CSV com as colunas na ordem especificada
-                    final_df = generate_csv(df.to_dict('records'))
-
-            elif cliente == "Cargill":
-                # Importar funções do xmlCARGILL.py
-                try:
-                    from xmlCARGILL import parse_nfe_xml as parse_cargill_xml
-
-                    # Processar arquivos XML para Cargill
-                    for uploaded_file in uploaded_files:
-                        # Salvar arquivo temporário para processamento
-                        xml_content = uploaded_file.read().decode('utf-8')
-
-                        # Salvar em arquivo temporário
-                        temp_filename = f"temp_{uploaded_file.name}"
-                        with open(temp_filename, 'w', encoding='utf-8') as f:
-                            f.write(xml_content)
-
-                        with st.spinner(f"Processando arquivo {uploaded_file.name} para Cargill..."):
-                            parsed_data = parse_cargill_xml(temp_filename)
-
-                            if parsed_data:
-                                all_data.extend(parsed_data)
-                            else:
-                                st.error(f"Falha ao analisar o arquivo {uploaded_file.name}. Verifique se é um arquivo XML de NFe válido.")
-
-                        # Limpar arquivo temporário
-                        import os
-                        try:
-                            os.remove(temp_filename)
-                        except:
-                            pass
-
-                    if all_data:
-                        # Converter dados para DataFrame
-                        df = pd.DataFrame(all_data)
-
-                        # Definir ordem das colunas (incluindo as novas colunas de infAdic)
-                        colunas_ordenadas = [
-                            'numero_nfe', 'serie', 'data_emissao', 'emit_cnpj', 'emit_nome',
-                            'dest_cnpj', 'dest_nome', 'valor_total_nfe', 'icms_desonerado_total',
-                            'item_nfe', 'codigo_produto', 'descricao_produto', 'ncm', 'cest', 'fci',
-                            'cfop', 'unidade_comercial', 'quantidade_comercial', 'valor_unitario_comercial',
-                            'valor_produto', 'pedido_compra', 'item_pedido',
-                            'infadic_produto', 'infadic_lote', 'infadic_qtd', 'infadic_unidade',
-                            'icms_origem', 'icms_cst', 'icms_desonerado', 'motivo_desoneracao',
-                            'ipi_cst', 'pis_cst', 'pis_base_calculo', 'pis_aliquota', 'pis_valor',
-                            'cofins_cst', 'cofins_base_calculo', 'cofins_aliquota', 'cofins_valor'
-                        ]
-
-                        # Reordenar colunas (apenas as que existem)
-                        colunas_existentes = [col for col in colunas_ordenadas if col in df.columns]
-                        final_df = df[colunas_existentes]
-
-                except ImportError as e:
-                    st.error(f"Erro ao importar o módulo xmlCARGILL.py: {str(e)}")
-                    st.error("Certifique-se de que o arquivo xmlCARGILL.py está no mesmo diretório.")
-                    return
-                except Exception as e:
-                    st.error(f"Erro ao processar arquivos Cargill: {str(e)}")
-                    return
+                    # Pós-processamento do perfil (PROCV, lotes) e colunas na ordem de saída
+                    final_df, eans_faltando = profile.build_table(all_data, catalog, metrics)
+
+                    # Relatório dos EANs que não estão no catálogo
+                    if catalog and eans_faltando is not None and not eans_faltando.empty:
+                        show_unmatched_eans(profile, eans_faltando)
 
             # Mostrar resultados se houver dados
             if all_data:
@@ -437,52 +517,23 @@ def main():
                 st.subheader("Visualização dos Dados Convertidos")
                 st.dataframe(final_df.head(10))
 
-                # Opção de download
+                # Opção de download, nos formatos do perfil
                 st.subheader("Download")
-                if cliente == "Laborlog":
-                    filename = "nfe_data_laborlog.csv"
-                    csv_data = final_df.to_csv(index=False, sep=';', encoding='utf-8-sig')
-                    st.download_button(
-                        label="Download CSV File",
-                        data=csv_data,
-                        file_name=filename,
-                        mime="text/csv"
-                    )
-                else:  # Cargill
-                    # Download Excel
-                    excel_filename = "nfe_data_cargill.xlsx"
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                        final_df.to_excel(writer, index=False, sheet_name='Dados NFe')
-                    excel_data = buffer.getvalue()
-
-                    st.download_button(
-                        label="Download Excel File",
-                        data=excel_data,
-                        file_name=excel_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                    # Também permitir download em CSV
-                    csv_filename = "nfe_data_cargill.csv"
-                    csv_data = final_df.to_csv(index=False, sep=';', encoding='utf-8-sig')
-                    st.download_button(
-                        label="Download CSV File",
-                        data=csv_data,
-                        file_name=csv_filename,
-                        mime="text/csv"
-                    )
-            else:
+                show_downloads(profile, final_df, metrics)
+            elif all_data is not None:
                 st.error("Nenhum dado válido foi extraído dos arquivos XML.")
 
         except Exception as e:
             st.error(f"Erro ao processar os arquivos: {str(e)}")
             import traceback
             st.code(traceback.format_exc())
-            if cliente == "Laborlog":
-                st.write("Certifique-se de que está enviando arquivos XML de NFe válidos e que o arquivo laborlog.xlsx está presente.")
+            if profile.catalog:
+                st.write(f"Certifique-se de que está enviando arquivos XML de NFe válidos e que o arquivo {profile.catalog} está presente.")
             else:
                 st.write("Certifique-se de que está enviando arquivos XML de NFe válidos.")
 
+        if metrics is not None:
+            show_metrics(metrics)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Parallel batch conversion of NFe files.
+
+The raw bytes of each XML are handed to a process pool and the parsed rows
+come back in the original upload order, with one error message per file that
+failed. Used by the Streamlit app for every client; the parser of a client
+comes from its profile (nfe_profiles), so a worker imports only the parser
+of the clients it converts, and never pandas.
+"""
+import os
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import nfe_parse_cache
+from nfe_metrics import Metrics, stage
+from nfe_profiles import get_profile
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def default_workers():
+    """
+    Number of worker processes: NFE_WORKERS environment variable, or one per CPU.
+    """
+    return int(os.environ.get('NFE_WORKERS', 0)) or os.cpu_count() or 1
+
+
+def new_rows(cliente):
+    """
+    Empty container for the rows of a client (an InvoiceTable).
+    """
+    return get_profile(cliente).new_table()
+
+
+def convert_file(cliente, name, payload):
+    """
+    Parse a single file for a client.
+    Returns (name, rows, error) where error is None on success.
+    """
+    try:
+        return name, get_profile(cliente).parse(payload), None
+    except ET.ParseError:
+        return name, None, "Invalid XML format"
+    except Exception as e:
+        return name, None, str(e)
+
+
+def _convert_task(task):
+    return convert_file(*task)
+
+
+def _convert_path_task(task):
+    # The worker reads the file itself, so only the path crosses the pool
+    cliente, path = task
+    try:
+        with open(path, 'rb') as f:
+            payload = f.read()
+    except OSError as e:
+        return path, None, str(e)
+    return convert_file(cliente, path, payload)
+
+
+def _get_pool(workers):
+    """
+    Process pool shared across reruns/sessions, recreated when the size changes.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def convert_files(cliente, files, workers=None, cache=True, metrics=None):
+    """
+    Parse (name, payload) pairs for a client using a process pool.
+
+    Returns a list of (name, rows, error) in the same order as files. A single
+    file or workers=1 runs in-process, without the pool overhead. With cache,
+    files already parsed (same bytes, same client) come from nfe_parse_cache
+    and only the others are sent to the parser. A Metrics object gets one
+    'cache' and one 'parse' record per file.
+    """
+    results = [None] * len(files)
+    tasks = []
+    keys = []
+    for position, (name, payload) in enumerate(files):
+        rows = key = None
+        if cache:
+            with stage(metrics, 'cache', file=name) as record:
+                key = nfe_parse_cache.content_key(cliente, payload)
+                rows = nfe_parse_cache.get(key)
+                record['rows'] = len(rows) if rows is not None else 0
+        if rows is not None:
+            results[position] = (name, rows, None)
+        else:
+            tasks.append((cliente, name, payload))
+            keys.append((position, key))
+
+    parsed = _run(_convert_task, tasks, workers, metrics)
+
+    for (position, key), result in zip(keys, parsed):
+        results[position] = result
+        if cache and result[1]:
+            nfe_parse_cache.put(key, result[1])
+    return results
+
+
+def convert_paths(cliente, paths, workers=None, metrics=None):
+    """
+    Same as convert_files for files on disk; each worker reads its own files.
+    Returns (path, rows, error) in the order of paths.
+    """
+    tasks = [(cliente, path) for path in paths]
+    return _run(_convert_path_task, tasks, workers, metrics)
+
+
+def _run(function, tasks, workers, metrics=None):
+    workers = min(workers or default_workers(), len(tasks))
+    if metrics is not None:
+        # Measured where the file is parsed; the record travels back with the result
+        tasks = [(function, task, metrics.trace_memory) for task in tasks]
+        function = _measured_task
+
+    if workers <= 1:
+        results = [function(task) for task in tasks]
+    else:
+        results = _map(function, tasks, workers)
+
+    if metrics is not None:
+        for _, record in results:
+            metrics.add_file(record)
+        results = [result for result, _ in results]
+    return results
+
+
+def _measured_task(item):
+    function, task, trace_memory = item
+    metrics = Metrics(trace_memory)
+    with metrics.stage('parse', file=task[1]) as record:
+        result = function(task)
+        record['rows'] = len(result[1]) if result[1] else 0
+        if result[2]:
+            record['error'] = result[2]
+    return result, metrics.files[0]
+
+
+def _map(function, tasks, workers):
+    # Several files per task keeps the IPC overhead low on large batches
+    chunksize = max(1, len(tasks) // (workers * 4))
+    try:
+        return list(_get_pool(workers).map(function, tasks, chunksize=chunksize))
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
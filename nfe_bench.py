@@ -0,0 +1,279 @@
+"""
+Benchmarks dos parsers e das etapas de exportação sobre NFe sintéticas.
+
+Gera as notas com o nfe_synthetic.py (mesmas sementes a cada execução) e
+mede, para cada tamanho de nota, o melhor de N repetições de:
+os parsers usados na conversão (xmlLABORLOG.parse_nfe_table e
+xmlCARGILL.parse_nfe_tabela, os ganchos parse dos perfis, em árvore e em
+streaming), parse_lote_info, a distribuição dos lotes em linhas, PROCV,
+generate_csv e a exportação XLSX, e
+compara os backends XML disponíveis (ElementTree e lxml, ver nfe_xml) nos
+mesmos parsers
+e a extração de impostos (uma busca por grupo x despacho em uma passada,
+ver nfe_taxes) sobre notas com todas as variantes de grupo do gerador.
+
+O resultado sai em JSON (stdout ou --saida). Com --comparar, cada medição é
+comparada com um JSON anterior e o código de saída é 1 se alguma ficou mais
+lenta que a tolerância.
+
+    python nfe_bench.py --tamanhos 10,100,1000 --saida bench.json
+    python nfe_bench.py --comparar bench.json
+"""
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import nfe_synthetic
+import nfe_taxes
+import nfe_xml
+import xmlCARGILL
+import xmlLABORLOG
+from nfe_export import write_xlsx
+from nfe_fields import compile_fields, extract_fields, nfe_tag
+
+# 2: parsers medidos pelas funções de produção (parse_nfe_table/parse_nfe_tabela)
+RESULTS_VERSION = 2
+
+# Fração dos EANs do gerador presentes no catálogo do PROCV
+PROCV_HIT_RATE = 0.8
+
+# Lotes no infCpl por produto na medição da distribuição de lotes
+LOTES_POR_PRODUTO = 5
+
+
+def best_time(function, repeat):
+    """
+    Melhor tempo (s) de `repeat` execuções e o resultado da última
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _parse_all(parse, new_table, payloads, **options):
+    # Todas as notas em uma InvoiceTable, como o nfe_batch junta os arquivos
+    table = new_table()
+    for payload in payloads:
+        parse(payload, table, **options)
+    return table
+
+
+def _inf_cpl(payload):
+    text = payload.decode('utf-8')
+    start = text.find('<infCpl>')
+    return text[start + 8:text.find('</infCpl>')] if start >= 0 else ''
+
+
+def _lotes_sinteticos(n_produtos, lotes_por_produto):
+    # Nota com n_produtos itens e lotes_por_produto lotes de cada um no infCpl
+    # (a maioria vira linha extra)
+    nfe_info = {'numero_nfe': '1', 'serie': '1', 'valor_total_nfe': 0.0}
+    itens = [
+        {'item_nfe': str(i + 1), 'codigo_produto': f"{100000000 + i}",
+         'quantidade_comercial': 1.0, 'valor_unitario_comercial': 1.0, 'valor_produto': 1.0}
+        for i in range(n_produtos)
+    ]
+    lote_info = {
+        item['codigo_produto']: [
+            {'lote': f"{52000000 + j:010d}", 'quantidade': 10.0, 'unidade': 'SAC'}
+            for j in range(lotes_por_produto)
+        ]
+        for item in itens
+    }
+    return nfe_info, itens, lote_info
+
+
+def run_size(items, files, repeat, log=sys.stderr):
+    """
+    Medições para notas com `items` itens: lista de dicts (um por benchmark)
+    """
+    payloads = [
+        nfe_synthetic.generate_nfe(seed, items=items).encode('utf-8')
+        for seed in range(files)
+    ]
+    tax_payloads = [
+        nfe_synthetic.generate_nfe(
+            seed, items=items, icms_groups=nfe_synthetic.ICMS_VARIANTS,
+            pis_groups=nfe_synthetic.PIS_VARIANTS, cofins_groups=nfe_synthetic.COFINS_VARIANTS,
+        ).encode('utf-8')
+        for seed in range(files)
+    ]
+    pool = nfe_synthetic.ean_pool()
+    ean_to_codigo = {ean: f"LAB{i:05d}" for i, ean in enumerate(pool[:int(len(pool) * PROCV_HIT_RATE)])}
+
+    results = []
+
+    def measure(name, function):
+        seconds, result = best_time(function, repeat)
+        rows = len(result) if result is not None else 0
+        results.append({
+            'benchmark': name,
+            'items': items,
+            'files': files,
+            'rows': rows,
+            'seconds': round(seconds, 6),
+            'us_per_row': round(seconds / rows * 1e6, 3) if rows else None,
+        })
+        print(f"  {name:<40} {rows:>8} linhas {seconds * 1000:>10.1f} ms", file=log)
+        return result
+
+    laborlog_table = measure('laborlog.parse_nfe_table', lambda: _laborlog(payloads))
+    measure('laborlog.parse_nfe_table[streaming]', lambda: _laborlog(payloads, streaming=True))
+    cargill_table = measure('cargill.parse_nfe_tabela', lambda: _cargill(payloads))
+    measure('cargill.parse_nfe_tabela[streaming]', lambda: _cargill(payloads, streaming=True))
+
+    inf_cpls = [_inf_cpl(payload) for payload in payloads]
+    measure('cargill.parse_lote_info',
+            lambda: [lote for texto in inf_cpls for lotes in xmlCARGILL.parse_lote_info(texto).values() for lote in lotes])
+    nfe_info, itens, lote_info = _lotes_sinteticos(items, LOTES_POR_PRODUTO)
+    measure('cargill.distribuir_lotes',
+            lambda: xmlCARGILL._montar_linhas(nfe_info, itens, lote_info, xmlCARGILL.nova_tabela()))
+
+    frame = pd.DataFrame(laborlog_table.column_data(), columns=list(laborlog_table.columns))
+    measure('laborlog.apply_procv', lambda: xmlLABORLOG.apply_procv(frame.copy(), ean_to_codigo))
+    laborlog_rows = list(laborlog_table)
+    measure('laborlog.generate_csv', lambda: xmlLABORLOG.generate_csv(laborlog_rows))
+
+    cargill_df = xmlCARGILL.montar_dataframe(cargill_table)
+    measure('export.write_xlsx', lambda: _xlsx(cargill_df))
+
+    # Mesmos parsers em cada backend XML; depois volta ao backend do processo
+    current = nfe_xml.backend()
+    planos_grupo = {nfe_tag(grupo): compile_fields(campos) for grupo, campos in xmlCARGILL.CAMPOS_IMPOSTOS.items()}
+    try:
+        for backend in nfe_xml.available_backends():
+            nfe_xml.set_backend(backend)
+            measure(f'laborlog.parse_nfe_table[{backend}]', lambda: _laborlog(payloads))
+            measure(f'laborlog.parse_nfe_table[streaming,{backend}]', lambda: _laborlog(payloads, streaming=True))
+            measure(f'cargill.parse_nfe_tabela[{backend}]', lambda: _cargill(payloads))
+            measure(f'cargill.parse_nfe_tabela[streaming,{backend}]', lambda: _cargill(payloads, streaming=True))
+            impostos = _impostos(tax_payloads)
+            measure(f'taxes.per_group[{backend}]', lambda: _taxes_per_group(impostos, planos_grupo))
+            measure(f'taxes.dispatch[{backend}]', lambda: _taxes_dispatch(impostos))
+    finally:
+        nfe_xml.set_backend(current)
+    return results
+
+
+def _laborlog(payloads, streaming=False):
+    return _parse_all(xmlLABORLOG.parse_nfe_table, xmlLABORLOG.new_table, payloads, streaming=streaming)
+
+
+def _cargill(payloads, streaming=False):
+    return _parse_all(xmlCARGILL.parse_nfe_tabela, xmlCARGILL.nova_tabela, payloads, streaming=streaming)
+
+
+def _impostos(payloads):
+    return [imposto for payload in payloads
+            for imposto in nfe_xml.fromstring(payload).iter(xmlCARGILL.TAG_IMPOSTO)]
+
+
+def _taxes_per_group(impostos, planos):
+    # Forma anterior: um iter() por grupo, achado ou não, e um plano por grupo achado
+    rows = []
+    for imposto in impostos:
+        row = {}
+        for tag, plano in planos.items():
+            grupo = next(imposto.iter(tag), None)
+            if grupo is not None:
+                extract_fields(plano, grupo, row)
+        rows.append(row)
+    return rows
+
+
+def _taxes_dispatch(impostos):
+    return [nfe_taxes.extract_taxes(imposto, xmlCARGILL.TABELA_IMPOSTOS) for imposto in impostos]
+
+
+def _xlsx(df):
+    write_xlsx(df, io.BytesIO())
+    return df
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'xml_backend': nfe_xml.backend(),
+        'lxml': nfe_xml.lxml_etree.__version__ if nfe_xml.LXML_AVAILABLE else None,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def compare(previous, current, tolerance):
+    """
+    Medições mais lentas que previous além da tolerância (fração)
+    """
+    before = {(r['benchmark'], r['items']): r for r in previous['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get((result['benchmark'], result['items']))
+        if old is None or not old['seconds']:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append(dict(result, previous_seconds=old['seconds'], ratio=round(ratio, 3)))
+    return regressions
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks dos parsers de NFe (resultado em JSON).")
+    parser.add_argument('--tamanhos', type=_sizes, default=[10, 100, 1000], help="Itens por nota, separados por vírgula")
+    parser.add_argument('-n', '--arquivos', type=int, default=20, help="Notas por tamanho")
+    parser.add_argument('-r', '--repeticoes', type=int, default=3, help="Repetições (vale o melhor tempo)")
+    parser.add_argument('-o', '--saida', help="Arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Lentidão aceita na comparação (0.2 = 20%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    results = []
+    for items in args.tamanhos:
+        print(f"{args.arquivos} notas com {items} itens:", file=sys.stderr)
+        results.extend(run_size(items, args.arquivos, args.repeticoes))
+
+    report = {
+        'version': RESULTS_VERSION,
+        'environment': environment(),
+        'config': {'sizes': args.tamanhos, 'files': args.arquivos, 'repeat': args.repeticoes},
+        'results': results,
+    }
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            report['regressions'] = compare(json.load(f), report, args.tolerancia)
+        for regression in report['regressions']:
+            print(f"REGRESSÃO {regression['benchmark']} ({regression['items']} itens): "
+                  f"{regression['previous_seconds']:.4f} s -> {regression['seconds']:.4f} s", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
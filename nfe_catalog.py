@@ -0,0 +1,137 @@
+"""
+Cached EAN -> CÓD. LABORLOG index for the catalog workbook (laborlog.xlsx).
+
+The mapping is built once per workbook version and kept:
+  - in memory, shared by every Streamlit session/rerun of the process, with an
+    LRU bounded by the total number of EANs when several catalogs are loaded;
+  - on disk, as JSON next to the workbook (<workbook>.ean-index.json), so
+    new processes skip openpyxl entirely. The file is plain data, never
+    unpickled: whoever can write next to the workbook can change the codes
+    of the PROCV, but not run code in the app, the CLI or the server.
+
+A cached index is reused while the workbook mtime and size are unchanged; when
+they change, the workbook hash decides whether it really has to be rebuilt.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from nfe_lazy import lazy_import
+
+# Only needed (with pandas and openpyxl) when the index has to be rebuilt
+xmlLABORLOG = lazy_import('xmlLABORLOG')
+
+INDEX_SUFFIX = '.ean-index.json'
+INDEX_VERSION = 2
+
+# Upper bound of EANs kept in memory across all loaded catalogs
+MAX_CACHED_EANS = 2_000_000
+
+_cache = OrderedDict()  # absolute path -> index dict
+_cache_lock = threading.Lock()
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_index_file(index_path):
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Anything but the layout written by _write_index_file is rebuilt
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        return None
+    mapping = index.get('mapping')
+    if not isinstance(mapping, dict) or not all(isinstance(codigo, str) for codigo in mapping.values()):
+        return None
+    if not all(isinstance(index.get(name), int) for name in ('mtime_ns', 'size', 'registros')) \
+            or not isinstance(index.get('sha256'), str):
+        return None
+    return index
+
+
+def _write_index_file(index_path, index):
+    # Atomic replace; a read-only folder just means no persisted index
+    temp_path = None
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, index_path)
+    except OSError:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _build_index(path, stat, sha256):
+    laborlog_df = xmlLABORLOG.read_catalog(path)
+    return {
+        'version': INDEX_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+        'registros': len(laborlog_df),
+        'mapping': xmlLABORLOG.ean_mapping(laborlog_df),
+    }
+
+
+def _remember(path, index):
+    with _cache_lock:
+        _cache[path] = index
+        _cache.move_to_end(path)
+        total = sum(len(cached['mapping']) for cached in _cache.values())
+        while len(_cache) > 1 and total > MAX_CACHED_EANS:
+            _, evicted = _cache.popitem(last=False)
+            total -= len(evicted['mapping'])
+
+
+def load_ean_index(path):
+    """
+    EAN -> CÓD. LABORLOG mapping of a catalog workbook and its record count.
+    Returns (ean_to_codigo, registros); errors reading the workbook propagate.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    with _cache_lock:
+        index = _cache.get(path)
+        if index is not None:
+            _cache.move_to_end(path)
+    if index is not None and (index['mtime_ns'], index['size']) == (stat.st_mtime_ns, stat.st_size):
+        return index['mapping'], index['registros']
+
+    index_path = path + INDEX_SUFFIX
+    persisted = _read_index_file(index_path)
+    if persisted is not None and (persisted['mtime_ns'], persisted['size']) == (stat.st_mtime_ns, stat.st_size):
+        _remember(path, persisted)
+        return persisted['mapping'], persisted['registros']
+
+    # mtime/size changed: only rebuild when the content did too
+    sha256 = _file_hash(path)
+    candidate = index or persisted
+    if candidate is not None and candidate['sha256'] == sha256:
+        index = dict(candidate, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    else:
+        index = _build_index(path, stat, sha256)
+
+    _write_index_file(index_path, index)
+    _remember(path, index)
+    return index['mapping'], index['registros']
+
+
+def clear_cache():
+    """
+    Drop the in-memory indexes (the persisted files are kept).
+    """
+    with _cache_lock:
+        _cache.clear()
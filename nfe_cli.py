@@ -0,0 +1,278 @@
+"""
+Conversor de NFe em lote pela linha de comando (sem Streamlit).
+
+Aceita pastas (busca *.xml recursivamente), globs e listas de arquivos
+(@lista.txt, um caminho por linha) e aplica o mesmo tratamento do app:
+PROCV EAN -> CÓD. LABORLOG para Laborlog e expansão de lotes para Cargill.
+
+    python nfe_cli.py --cliente Laborlog -o nfe_data_laborlog.csv xmls/
+    python nfe_cli.py --cliente Cargill -o nfe_data_cargill.xlsx "entrada/**/*.xml" @lista.txt
+
+Notas repetidas (mesma chave de acesso) são convertidas uma vez só; com
+--indice-chaves, as já convertidas em execuções anteriores também são ignoradas.
+Com --banco, as notas, itens e lotes também são gravados em um SQLite para
+consultas (ver nfe_sqlite).
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+
+from nfe_batch import convert_paths, default_workers, new_rows
+from nfe_catalog import load_ean_index
+from nfe_dedup import KeyIndex, read_access_key, split_duplicates
+from nfe_export import write_parquet, write_xlsx
+from nfe_metrics import Metrics, stage
+from nfe_profiles import FORMATS, get_profile, profile_names
+from nfe_sqlite import InvoiceDatabase
+
+# Pasta dos catálogos padrão dos perfis (ex.: laborlog.xlsx)
+PASTA_CATALOGOS = os.path.dirname(os.path.abspath(__file__))
+
+# Arquivos enviados ao pool por vez (progresso e memória dos payloads)
+ARQUIVOS_POR_LOTE = 1000
+
+
+def expand_inputs(entradas):
+    """
+    Lista de arquivos XML a partir de pastas, globs e caminhos, sem repetições
+    """
+    paths = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            encontrados = []
+            for raiz, _, nomes in os.walk(entrada):
+                encontrados.extend(os.path.join(raiz, nome) for nome in nomes if nome.lower().endswith('.xml'))
+            paths.extend(sorted(encontrados))
+        elif any(c in entrada for c in '*?['):
+            paths.extend(sorted(glob.glob(entrada, recursive=True)))
+        else:
+            paths.append(entrada)
+    return list(dict.fromkeys(paths))
+
+
+def load_ean_mapping(catalogo, log=sys.stderr, metrics=None):
+    """
+    Dicionário EAN -> CÓD. LABORLOG; vazio (com aviso) se o catálogo não puder ser lido
+    """
+    try:
+        with stage(metrics, 'catalog') as record:
+            ean_to_codigo = load_ean_index(catalogo)[0]
+            record['rows'] = len(ean_to_codigo)
+        return ean_to_codigo
+    except Exception as e:
+        print(f"Erro ao carregar {catalogo}: {e}", file=log)
+        print("O mapeamento EAN para CÓD. LABORLOG não estará disponível.", file=log)
+        return {}
+
+
+def load_catalog(cliente, catalogo=None, log=sys.stderr, metrics=None):
+    """
+    Catálogo EAN do PROCV do cliente (o arquivo do perfil em PASTA_CATALOGOS,
+    se catalogo não for dado); None se o perfil não usa catálogo
+    """
+    perfil = get_profile(cliente)
+    if perfil.catalog is None:
+        return None
+    return load_ean_mapping(catalogo or os.path.join(PASTA_CATALOGOS, perfil.catalog), log, metrics)
+
+
+def iter_batches(cliente, paths, workers=None, log=sys.stderr, metrics=None, convertidos=None, banco=None):
+    """
+    Converte os arquivos em lotes de ARQUIVOS_POR_LOTE, devolvendo as linhas de cada lote.
+    Os caminhos convertidos com sucesso são acrescentados à lista convertidos.
+    Com banco (nfe_sqlite.InvoiceDatabase), cada lote também é gravado nele.
+    """
+    for inicio in range(0, len(paths), ARQUIVOS_POR_LOTE):
+        lote = paths[inicio:inicio + ARQUIVOS_POR_LOTE]
+        linhas = new_rows(cliente)
+        tabelas = []
+        with stage(metrics, 'convert') as record:
+            for path, parsed_data, error in convert_paths(cliente, lote, workers, metrics):
+                if parsed_data:
+                    linhas.extend(parsed_data)
+                    tabelas.append((parsed_data, path))
+                    if convertidos is not None:
+                        convertidos.append(path)
+                else:
+                    print(f"Falha ao analisar o arquivo {path}: {error or 'nenhum item encontrado'}", file=log)
+            record['rows'] = len(linhas)
+        if banco is not None and tabelas:
+            with stage(metrics, 'sqlite') as record:
+                gravados = banco.add(cliente, tabelas)
+                record['rows'] = gravados['items']
+            if gravados['skipped']:
+                print(f"{gravados['skipped']} nota(s) sem chave de acesso não foram gravadas no banco", file=log)
+        print(f"{min(inicio + ARQUIVOS_POR_LOTE, len(paths))}/{len(paths)} arquivos processados", file=log)
+        yield linhas
+
+
+def convert(cliente, paths, workers=None, catalogo=None, log=sys.stderr, relatorio_ean=None, metrics=None,
+            convertidos=None, banco=None):
+    """
+    Converte os arquivos e devolve o DataFrame final do cliente (None se nada foi extraído).
+    Com relatorio_ean (perfis com catálogo), grava em CSV os EANs que não estão no catálogo.
+    """
+    all_data = new_rows(cliente)
+    for linhas in iter_batches(cliente, paths, workers, log, metrics, convertidos, banco):
+        all_data.extend(linhas)
+
+    if not all_data:
+        return None
+
+    ean_to_codigo = load_catalog(cliente, catalogo, log, metrics)
+    df, eans_faltando = get_profile(cliente).build_table(all_data, ean_to_codigo, metrics)
+    if eans_faltando is not None:
+        _report_unmatched(eans_faltando, relatorio_ean, log)
+    return df
+
+
+def convert_csv(cliente, paths, saida, workers=None, catalogo=None, log=sys.stderr, relatorio_ean=None, metrics=None,
+                convertidos=None, banco=None):
+    """
+    Clientes de layout fixo (perfil com write_csv) direto para CSV: cada lote
+    é gravado assim que é convertido, sem juntar todas as linhas em memória.
+    Devolve o número de linhas gravadas (o arquivo é removido se nenhuma
+    linha foi extraída).
+    """
+    ean_to_codigo = load_catalog(cliente, catalogo, log, metrics)
+    with open(saida, 'w', encoding='utf-8-sig', newline='') as f:
+        linhas, eans_faltando = get_profile(cliente).write_csv(
+            iter_batches(cliente, paths, workers, log, metrics, convertidos, banco), f, ean_to_codigo,
+            report=True, metrics=metrics)
+    if not linhas:
+        os.remove(saida)
+        return 0
+    _report_unmatched(eans_faltando, relatorio_ean, log)
+    return linhas
+
+
+def _report_unmatched(eans_faltando, relatorio_ean, log):
+    if len(eans_faltando):
+        print(f"{len(eans_faltando)} códigos EAN não encontrados no catálogo", file=log)
+    if relatorio_ean:
+        eans_faltando.to_csv(relatorio_ean, index=False, sep=';', encoding='utf-8-sig')
+
+
+def skip_duplicates(cliente, paths, index=None, log=sys.stderr, relatorio=None):
+    """
+    Pré-leitura das chaves de acesso: devolve os caminhos a converter e a
+    chave de cada um. Os ignorados (repetidos ou já no índice) são listados
+    no log e, com relatorio, gravados em CSV.
+    """
+    chaves = [(path, read_access_key(path)) for path in paths]
+    manter, ignorados = split_duplicates(cliente, chaves, index)
+    for item in ignorados:
+        origem = f" ({item['original']})" if item['original'] else ''
+        print(f"Ignorado {item['arquivo']}: nota {item['chave']} {item['motivo']}{origem}", file=log)
+    if ignorados:
+        print(f"{len(ignorados)} arquivo(s) ignorado(s) por chave de acesso repetida", file=log)
+    if relatorio:
+        with open(relatorio, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, ['arquivo', 'chave', 'motivo', 'original'], delimiter=';')
+            writer.writeheader()
+            writer.writerows(ignorados)
+    return [paths[position] for position in manter], dict(chaves)
+
+
+def write_output(df, path, formato=None, cliente=None, metrics=None):
+    """
+    Grava o resultado em CSV (';', utf-8-sig), XLSX (aba 'Dados NFe') ou
+    Parquet (colunas tipadas do cliente)
+    """
+    formato = formato or os.path.splitext(path)[1].lstrip('.').lower()
+    if formato not in FORMATS:
+        raise ValueError(f"Formato de saída não suportado: {formato}")
+
+    with stage(metrics, 'export_' + formato) as record:
+        if formato == 'xlsx':
+            write_xlsx(df, path)
+        elif formato == 'parquet':
+            write_parquet(get_profile(cliente).typed_table(df) if cliente else df, path)
+        else:
+            df.to_csv(path, index=False, sep=';', encoding='utf-8-sig')
+        record['rows'] = len(df)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Converte XMLs de NFe para CSV/XLSX sem a interface Streamlit.",
+        fromfile_prefix_chars='@',
+    )
+    parser.add_argument('entradas', nargs='+', help="Pastas, globs ou arquivos XML (@lista.txt lê os caminhos de um arquivo)")
+    parser.add_argument('-c', '--cliente', choices=sorted(profile_names()), required=True, help="Perfil do cliente")
+    parser.add_argument('-o', '--saida', required=True, help="Arquivo de saída (.csv, .xlsx ou .parquet)")
+    parser.add_argument('-f', '--formato', choices=FORMATS, help="Formato de saída (padrão: extensão do arquivo)")
+    parser.add_argument('-w', '--workers', type=int, default=default_workers(), help="Processos paralelos (padrão: NFE_WORKERS ou nº de CPUs)")
+    parser.add_argument('--catalogo', help="Catálogo EAN usado no PROCV (padrão: o do perfil, ex.: laborlog.xlsx para Laborlog)")
+    parser.add_argument('--relatorio-ean', help="CSV com os EANs não encontrados no catálogo (Laborlog)")
+    parser.add_argument('--indice-chaves', default=os.environ.get('NFE_INDEX_DB'),
+                        help="SQLite com as chaves de acesso já convertidas; essas notas são ignoradas (padrão: NFE_INDEX_DB)")
+    parser.add_argument('--relatorio-duplicadas', help="CSV com os arquivos ignorados por chave de acesso repetida")
+    parser.add_argument('--banco', help="SQLite onde as notas, itens e lotes também são gravados, para consultas (ver nfe_sqlite)")
+    parser.add_argument('--metricas', help="JSON com tempo, linhas e pico de memória por etapa e por arquivo")
+    parser.add_argument('--metricas-memoria', action='store_true', help="Mede o pico de memória de cada etapa com tracemalloc (mais lento)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    paths = expand_inputs(args.entradas)
+    if not paths:
+        print("Nenhum arquivo XML encontrado.", file=sys.stderr)
+        return 1
+
+    metrics = Metrics(trace_memory=args.metricas_memoria) if args.metricas else None
+
+    index = KeyIndex(args.indice_chaves) if args.indice_chaves else None
+    banco = InvoiceDatabase(args.banco) if args.banco else None
+    try:
+        with stage(metrics, 'dedup') as record:
+            paths, chaves = skip_duplicates(args.cliente, paths, index, relatorio=args.relatorio_duplicadas)
+            record['rows'] = len(paths)
+
+        convertidos = []
+        formato = args.formato or os.path.splitext(args.saida)[1].lstrip('.').lower()
+        if not paths:
+            linhas = 0
+        elif formato == 'csv' and get_profile(args.cliente).write_csv is not None:
+            # Layout fixo de colunas: grava lote a lote
+            linhas = convert_csv(args.cliente, paths, args.saida, args.workers, args.catalogo,
+                                 relatorio_ean=args.relatorio_ean, metrics=metrics, convertidos=convertidos,
+                                 banco=banco)
+        else:
+            df = convert(args.cliente, paths, args.workers, args.catalogo,
+                         relatorio_ean=args.relatorio_ean, metrics=metrics, convertidos=convertidos, banco=banco)
+            linhas = 0 if df is None else len(df)
+            if linhas:
+                write_output(df, args.saida, formato, args.cliente, metrics)
+
+        # Só entram no índice as notas que chegaram ao arquivo de saída
+        if index is not None and linhas:
+            index.add(args.cliente, [(chaves[path], path) for path in convertidos])
+    finally:
+        if index is not None:
+            index.close()
+        if banco is not None:
+            banco.close()
+
+    if metrics is not None:
+        with open(args.metricas, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_json() + '\n')
+
+    if not paths:
+        print("Nenhuma nota nova para converter.", file=sys.stderr)
+        return 0
+
+    if not linhas:
+        print("Nenhum dado válido foi extraído dos arquivos XML.", file=sys.stderr)
+        return 1
+
+    print(f"{linhas} linhas gravadas em {args.saida}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Duplicate detection by NFe access key (chave de acesso, infNFe/@Id).
+
+Suppliers resend the same invoice and uploads overlap, so before any parsing
+each file goes through a cheap pre-scan: a regex over the first bytes of the
+XML finds the infNFe Id attribute, which identifies the invoice.
+
+  - a key repeated within a batch keeps only its first file;
+  - with a KeyIndex (a local SQLite file), keys already converted for the
+    same client profile in earlier runs are skipped as well.
+
+Files without a recognizable key are never skipped; the parser decides.
+"""
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+# infNFe opens right after the envelope, well inside this many bytes
+PRESCAN_BYTES = 16384
+
+ACCESS_KEY_RE = re.compile(rb'<(?:[\w.-]+:)?infNFe\b[^>]*?\sId\s*=\s*["\']([^"\']+)["\']')
+
+INDEX_PATH = os.environ.get('NFE_INDEX_DB') or 'nfe_chaves.sqlite'
+
+# Report reasons (shown in the app and in the CLI)
+REPEATED_IN_BATCH = 'repetida no lote'
+ALREADY_CONVERTED = 'já convertida'
+
+# SQLite's default limit of host parameters per statement is 999
+_QUERY_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_keys (
+    profile TEXT NOT NULL,
+    access_key TEXT NOT NULL,
+    source TEXT,
+    converted_at TEXT NOT NULL,
+    PRIMARY KEY (profile, access_key)
+) WITHOUT ROWID
+"""
+
+
+def access_key(payload):
+    """
+    infNFe Id of an XML payload (e.g. 'NFe3519...'), or None.
+    """
+    match = ACCESS_KEY_RE.search(payload, 0, PRESCAN_BYTES) or ACCESS_KEY_RE.search(payload)
+    return match.group(1).decode('ascii', 'replace') if match else None
+
+
+def read_access_key(path):
+    """
+    access_key of a file on disk, reading only its first bytes when possible.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(PRESCAN_BYTES)
+            match = ACCESS_KEY_RE.search(head)
+            if match is None and len(head) == PRESCAN_BYTES:
+                match = ACCESS_KEY_RE.search(head + f.read())
+    except OSError:
+        # Unreadable files go on to the parser, which reports the error
+        return None
+    return match.group(1).decode('ascii', 'replace') if match else None
+
+
+class KeyIndex:
+    """
+    Persistent index of the access keys converted per client profile.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or INDEX_PATH
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        # Readers (the app) and a writer (the CLI) can share the file
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def known(self, profile, keys):
+        """
+        The subset of keys already converted for profile.
+        """
+        keys = list(dict.fromkeys(key for key in keys if key))
+        found = set()
+        for start in range(0, len(keys), _QUERY_CHUNK):
+            chunk = keys[start:start + _QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(key for key, in self.connection.execute(
+                f"SELECT access_key FROM access_keys WHERE profile = ? AND access_key IN ({placeholders})",
+                [profile, *chunk]))
+        return found
+
+    def add(self, profile, entries):
+        """
+        Record (key, source file) pairs as converted for profile.
+        """
+        converted_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO access_keys (profile, access_key, source, converted_at) VALUES (?, ?, ?, ?)",
+                [(profile, key, source, converted_at) for key, source in entries if key])
+
+    def forget(self, profile=None):
+        """
+        Remove the keys of profile (all profiles with None).
+        """
+        with self.connection:
+            if profile is None:
+                self.connection.execute("DELETE FROM access_keys")
+            else:
+                self.connection.execute("DELETE FROM access_keys WHERE profile = ?", (profile,))
+
+
+def split_duplicates(profile, keyed_files, index=None, converted=()):
+    """
+    Split (name, key) pairs into the positions to convert and a report of the
+    skipped files (dicts with arquivo, chave, motivo and original). Keys in
+    `converted` are not taken from the index (e.g. the ones a Streamlit
+    session recorded itself and converts again on every rerun).
+    """
+    known = index.known(profile, [key for _, key in keyed_files]) if index is not None else set()
+    known.difference_update(converted)
+
+    first_file = {}
+    keep = []
+    skipped = []
+    for position, (name, key) in enumerate(keyed_files):
+        if key is None:
+            keep.append(position)
+        elif key in known:
+            skipped.append({'arquivo': name, 'chave': key, 'motivo': ALREADY_CONVERTED, 'original': None})
+        elif key in first_file:
+            skipped.append({'arquivo': name, 'chave': key, 'motivo': REPEATED_IN_BATCH, 'original': first_file[key]})
+        else:
+            first_file[key] = name
+            keep.append(position)
+    return keep, skipped
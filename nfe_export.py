@@ -0,0 +1,108 @@
+"""
+File exports of the converted tables: streaming XLSX and typed Parquet.
+
+write_xlsx streams the rows through openpyxl's write-only mode: each row is
+serialized as soon as it is appended instead of living as cell objects until
+the workbook is saved, so memory does not grow with the row count and large
+exports run several times faster than DataFrame.to_excel. write_xlsx_frames
+does the same over a sequence of DataFrames (e.g. the chunks of nfe_spill).
+
+write_parquet writes a typed columnar file (needs the optional pyarrow):
+typed_columns turns the comma-decimal text columns back into numbers and the
+low-cardinality ones (CNPJ, UF, CFOP...) into Arrow dictionaries.
+"""
+import importlib.util
+import io
+
+from nfe_lazy import lazy_import
+
+# Imported by the first export, not by the modules that only parse
+pd = lazy_import('pandas')
+openpyxl = lazy_import('openpyxl')
+
+SHEET_NAME = 'Dados NFe'
+
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Rows converted from the DataFrame at a time
+ROWS_PER_CHUNK = 10000
+
+
+def write_xlsx(df, target, sheet_name=SHEET_NAME):
+    """
+    Write df to target (path or binary file) with the same sheet, header and
+    cells as df.to_excel(target, index=False, sheet_name=sheet_name).
+    """
+    write_xlsx_frames([df], target, df.columns, sheet_name)
+
+
+def write_xlsx_frames(frames, target, columns, sheet_name=SHEET_NAME):
+    """
+    Write the DataFrames yielded by frames (all with the given columns) to
+    one sheet, one after the other, as write_xlsx of their concatenation.
+    Only the frame being written is held in memory.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append([str(column) for column in columns])
+
+    for df in frames:
+        for start in range(0, len(df), ROWS_PER_CHUNK):
+            chunk = df.iloc[start:start + ROWS_PER_CHUNK]
+            # Missing values become empty cells, as in to_excel
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append(row)
+
+    workbook.save(target)
+
+
+def xlsx_bytes(df, sheet_name=SHEET_NAME):
+    """
+    XLSX file contents for a download button.
+    """
+    buffer = io.BytesIO()
+    write_xlsx(df, buffer, sheet_name)
+    return buffer.getvalue()
+
+
+def typed_columns(df, numeric_columns=(), dictionary_columns=(), decimal_comma=False):
+    """
+    Copy of df for columnar formats: numeric_columns as float64 (empty or
+    invalid values become null) and dictionary_columns as categoricals, which
+    Arrow stores dictionary-encoded. decimal_comma reads '1,5' as 1.5.
+    """
+    df = df.copy()
+    for column in numeric_columns:
+        if column in df.columns:
+            values = df[column]
+            if decimal_comma:
+                values = values.astype(str).str.replace(',', '.', regex=False)
+            df[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+    for column in dictionary_columns:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def write_parquet(df, target):
+    """
+    Write df to target (path or binary file) as Parquet, zstd-compressed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, target, compression='zstd')
+
+
+def parquet_bytes(df):
+    """
+    Parquet file contents for a download button.
+    """
+    buffer = io.BytesIO()
+    write_parquet(df, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,118 @@
+"""
+Declarative field extraction for NFe elements.
+
+A field spec is a list of (column, relative path, type, default) entries, e.g.
+
+    ('item_ncm', 'prod/NCM', str, ""),
+
+compile_fields turns the spec into an extraction plan once (at import time in
+the client modules) and extract_fields applies it to an element with a single
+lookup per field, or a single compiled XPath call on lxml elements (see
+nfe_xml).
+"""
+import xml.etree.ElementTree as ET
+
+import nfe_xml
+
+NFE_NS = '{http://www.portalfiscal.inf.br/nfe}'
+
+
+def nfe_tag(path):
+    """
+    Expand a relative path like 'prod/cProd' to Clark notation in the NFe namespace.
+    """
+    return '/'.join(NFE_NS + part for part in path.split('/'))
+
+
+def compile_fields(spec):
+    """
+    Compile a field spec into an extraction plan.
+
+    Each entry is (column, path, type, default):
+      - path is relative to the element the plan is applied to ('prod/cProd',
+        'enderEmit/xLgr'); None means the column always gets the default
+      - type str keeps the element text as is; any other callable (float)
+        converts it
+      - default is used when the element does not exist
+
+    Intermediate elements are resolved once per extraction and shared by all
+    fields below them, and every lookup uses plain Clark tags so it runs on
+    ElementTree's C fast path instead of ElementPath. For lxml elements the
+    plan also carries one XPath selecting every field (None without lxml).
+    """
+    parents = []        # (index of the parent node, tag)
+    parent_index = {(): 0}
+    fields = []
+    paths = []
+
+    for column, path, type_, default in spec:
+        if path is None:
+            fields.append((column, -1, None, None, default))
+            continue
+
+        parts = tuple(NFE_NS + part for part in path.split('/'))
+        for depth in range(1, len(parts)):
+            key = parts[:depth]
+            if key not in parent_index:
+                parents.append((parent_index[parts[:depth - 1]], parts[depth - 1]))
+                parent_index[key] = len(parents)
+
+        convert = None if type_ is str else type_
+        fields.append((column, parent_index[parts[:-1]], parts[-1], convert, default))
+        paths.append(parts)
+
+    return tuple(parents), tuple(fields), nfe_xml.compile_xpath(paths)
+
+
+def extract_fields(plan, node, row=None):
+    """
+    Apply a compiled plan to an element, filling (and returning) the row dict.
+    """
+    parents, fields, xpath = plan
+    if row is None:
+        row = {}
+
+    if xpath is not None and not isinstance(node, ET.Element):
+        return _extract_xpath(xpath, fields, node, row)
+
+    nodes = [node]
+    for index, tag in parents:
+        parent = nodes[index]
+        nodes.append(parent.find(tag) if parent is not None else None)
+
+    for column, index, tag, convert, default in fields:
+        if index < 0:
+            row[column] = default
+            continue
+        parent = nodes[index]
+        element = parent.find(tag) if parent is not None else None
+        if element is None:
+            row[column] = default
+        elif convert is None:
+            row[column] = element.text
+        else:
+            row[column] = convert(element.text)
+
+    return row
+
+
+def _extract_xpath(xpath, fields, node, row):
+    # lxml element: one XPath call, then each field by its (unique) leaf tag
+    found = {element.tag: element for element in xpath(node)}
+    for column, index, tag, convert, default in fields:
+        element = found.get(tag) if index >= 0 else None
+        if element is None:
+            row[column] = default
+        elif convert is None:
+            row[column] = element.text
+        else:
+            row[column] = convert(element.text)
+    return row
+
+
+def plan_columns(plan):
+    """
+    Column names produced by a compiled plan, in spec order.
+    """
+    return tuple(field[0] for field in plan[1])
+
@@ -0,0 +1,43 @@
+"""
+Deferred imports of the heavy table libraries (pandas, openpyxl).
+
+Importing pandas takes about 0.2 s and openpyxl another 0.1 s, while parsing
+NFe needs neither: the pool workers, the CLI (--help, argument errors, the
+dedup pre-scan) and the HTTP service only use them once a DataFrame is built
+or a workbook is written. Modules bind them with
+
+    pd = lazy_import('pandas')
+
+and the real module is imported on the first attribute access (pd.DataFrame,
+pd.concat...); from then on the attributes are read straight from it.
+"""
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first use.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only reached for attributes not cached on the instance yet
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Module name, imported on the first attribute access.
+    """
+    return LazyModule(name)
@@ -0,0 +1,109 @@
+"""
+Per-stage instrumentation of the conversion pipeline.
+
+A Metrics object records wall time, rows and peak memory for each stage
+(reading, parse, catalog, PROCV, formatting, export...) and for each file of
+the parse stage. Every hook takes an optional metrics argument: with None no
+timer runs, nothing is traced and the batch stage keeps its plain tasks, so
+disabled instrumentation costs nothing.
+
+Peak memory is the tracemalloc peak inside the stage when trace_memory is on
+(precise per stage, but slows allocations down), otherwise the process peak
+RSS at the end of the stage.
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Metrics:
+    """
+    Stage and per-file records of one conversion run.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.files = []
+
+    @contextmanager
+    def stage(self, name, file=None):
+        """
+        Measure the block as stage `name` (per file when file is given).
+        Yields the record; set record['rows'] inside the block.
+        """
+        record = {'stage': name}
+        if file is not None:
+            record['file'] = file
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            if tracing:
+                record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / MB, 2)
+                tracemalloc.stop()
+            else:
+                record['peak_rss_mb'] = _peak_rss_mb()
+            (self.files if file is not None else self.stages).append(record)
+
+    def add_file(self, record):
+        """
+        Add a per-file record measured elsewhere (e.g. in a worker process).
+        """
+        self.files.append(record)
+
+    def summary(self):
+        """
+        One entry per stage: runs, total seconds, rows and the highest peak.
+        """
+        totals = {}
+        for record in self.stages + self.files:
+            name = record['stage']
+            total = totals.setdefault(name, {'stage': name, 'runs': 0, 'seconds': 0.0, 'rows': 0, 'peak_mb': None})
+            total['runs'] += 1
+            total['seconds'] = round(total['seconds'] + record['seconds'], 6)
+            total['rows'] += record.get('rows') or 0
+            peak = record.get('peak_mb', record.get('peak_rss_mb'))
+            if peak is not None and (total['peak_mb'] is None or peak > total['peak_mb']):
+                total['peak_mb'] = peak
+        return list(totals.values())
+
+    def to_dict(self):
+        return {
+            'trace_memory': self.trace_memory,
+            'summary': self.summary(),
+            'stages': self.stages,
+            'files': self.files,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+
+def stage(metrics, name, file=None):
+    """
+    metrics.stage(name), or a no-op context when metrics is None (yielding a
+    new record each time, so values set in one block never leak to another).
+    """
+    if metrics is None:
+        return nullcontext({})
+    return metrics.stage(name, file)
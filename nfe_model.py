@@ -0,0 +1,204 @@
+"""
+Normalized in-memory model of parsed NFe rows.
+
+An output row is an invoice header (supplier, customer, totals...) plus one
+item. Stored as row dicts or full columns, the header is repeated in every
+item row, so a 5,000-item invoice keeps 5,000 references to each supplier
+field. An InvoiceTable keeps one header tuple per invoice and one compact
+tuple per row:
+
+    headers[n] = (header values in header_columns order)
+    items[k]   = (n, item values in item_columns order)
+
+Tables of several files are joined with extend, and the header fields are
+repeated per row only at export time (column_data, or iterating row dicts).
+Header and item columns left out of `columns` (the output order) stay in
+the table for other consumers, e.g. the access key for nfe_sqlite, but are
+never exported.
+
+Item columns listed as shared (low-cardinality codes: CFOP, NCM, CST,
+unit...) have their str values interned, so every row points to one string
+per distinct code instead of its own copy of the element text.
+
+Values a row does not have (e.g. an absent tax group) are stored as MISSING
+and exported as pd.DataFrame does for row dicts without the key: NaN, and a
+column missing from every row is left out.
+"""
+import sys
+
+NAN = float('nan')
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        # Unpickled as the module singleton, so `is MISSING` holds in every process
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+class InvoiceTable:
+    """
+    Parsed rows of one client layout: invoice headers plus item tuples that
+    reference them by index.
+    """
+    __slots__ = ('header_columns', 'item_columns', 'columns', 'headers', 'items', '_shared')
+
+    def __init__(self, header_columns, item_columns, columns=None, shared=()):
+        self.header_columns = tuple(header_columns)
+        self.item_columns = tuple(item_columns)
+        # Output column order (default: header then item columns)
+        self.columns = tuple(columns) if columns is not None else self.header_columns + self.item_columns
+        self.headers = []
+        self.items = []
+        self._shared = tuple(index for index, column in enumerate(self.item_columns) if column in shared)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        # Denormalized row dicts, for callers that still expect records
+        layout = self._layout()
+        headers = self.headers
+        for item in self.items:
+            header = headers[item[0]]
+            row = {}
+            for column, in_header, index in layout:
+                value = header[index] if in_header else item[index]
+                if value is not MISSING:
+                    row[column] = value
+            yield row
+
+    def _layout(self):
+        # (column, comes from the header, index in the header/item tuple)
+        header_index = {column: index for index, column in enumerate(self.header_columns)}
+        item_index = {column: index + 1 for index, column in enumerate(self.item_columns)}
+        return [
+            (column, True, header_index[column]) if column in header_index
+            else (column, False, item_index[column])
+            for column in self.columns
+        ]
+
+    def add_invoice(self, header):
+        """
+        Add an invoice header (dict, or tuple in header_columns order).
+        Returns its index for add_item.
+        """
+        self.headers.append(self._header_tuple(header))
+        return len(self.headers) - 1
+
+    def set_invoice(self, invoice, header):
+        """
+        Replace the header of the invoice at index `invoice` (for parsers that
+        only know it after reading the items).
+        """
+        self.headers[invoice] = self._header_tuple(header)
+
+    def _header_tuple(self, header):
+        if isinstance(header, dict):
+            return tuple([header.get(column, MISSING) for column in self.header_columns])
+        return header
+
+    def add_item(self, invoice, item):
+        """
+        Add a row of the invoice at index `invoice` (dict, or tuple in
+        item_columns order).
+        """
+        if isinstance(item, dict):
+            values = [item.get(column, MISSING) for column in self.item_columns]
+        else:
+            values = list(item)
+        for index in self._shared:
+            value = values[index]
+            if type(value) is str:
+                values[index] = sys.intern(value)
+        self.items.append((invoice, *values))
+
+    def update_item(self, position, changes):
+        """
+        Set some item columns ({column: value}) of the row at `position`.
+        """
+        values = list(self.items[position])
+        for column, value in changes.items():
+            index = self.item_columns.index(column)
+            if index in self._shared and type(value) is str:
+                value = sys.intern(value)
+            values[index + 1] = value
+        self.items[position] = tuple(values)
+
+    def extend(self, rows):
+        """
+        Add the invoices and rows of another InvoiceTable with the same layout.
+        """
+        if not isinstance(rows, InvoiceTable) or rows.columns != self.columns \
+                or rows.header_columns != self.header_columns:
+            raise ValueError("InvoiceTable.extend expects a table with the same columns")
+        offset = len(self.headers)
+        self.headers.extend(rows.headers)
+        if offset:
+            self.items.extend([(item[0] + offset, *item[1:]) for item in rows.items])
+        else:
+            self.items.extend(rows.items)
+
+    def head(self, count):
+        """
+        New table with the first count rows (and only their invoices).
+        """
+        table = InvoiceTable(self.header_columns, self.item_columns, self.columns)
+        table._shared = self._shared
+        remap = {}
+        for item in self.items[:count]:
+            invoice = remap.get(item[0])
+            if invoice is None:
+                invoice = remap[item[0]] = table.add_invoice(self.headers[item[0]])
+            table.items.append((invoice, *item[1:]))
+        return table
+
+    def present_columns(self):
+        """
+        Output columns with a value in at least one row (the ones
+        column_data keeps).
+        """
+        layout = self._layout()
+        headers = self.headers
+        present = set()
+        for column, in_header, index in layout:
+            if in_header:
+                values = (headers[item[0]][index] for item in self.items)
+            else:
+                values = (item[index] for item in self.items)
+            if any(value is not MISSING for value in values):
+                present.add(column)
+        return [column for column in self.columns if column in present]
+
+    def column_data(self):
+        """
+        Denormalized {column: values} in output order, ready for
+        pd.DataFrame. MISSING values become NaN; columns missing from every
+        row are left out.
+        """
+        if not self.items:
+            return {column: [] for column in self.columns}
+
+        items = self.items
+        invoices = [item[0] for item in items]
+        data = {}
+        for column, in_header, index in self._layout():
+            # One column at a time, so only the output lists are ever built
+            if in_header:
+                per_invoice = [header[index] for header in self.headers]
+                values = [per_invoice[invoice] for invoice in invoices]
+            else:
+                values = [item[index] for item in items]
+            if any(value is MISSING for value in values):
+                if all(value is MISSING for value in values):
+                    continue
+                values = [NAN if value is MISSING else value for value in values]
+            data[column] = values
+        return data
@@ -0,0 +1,198 @@
+"""
+Content-addressed cache of parsed NFe rows.
+
+Every Streamlit rerun (changing a widget, clicking a download) reparses the
+uploaded files; with this cache a file already seen costs a sha256 of its
+bytes. Entries are keyed by client profile + content hash and stored:
+  - in memory, pickled, shared by every session of the process, with an LRU
+    bounded by the total pickled size (NFE_CACHE_MB, default 256 MB);
+  - optionally on disk (NFE_CACHE_DIR), one JSON file per entry, so the rows
+    survive process restarts.
+
+The disk files are plain data, never unpickled: whoever can write to the
+cache folder can change the cached rows, but not run code in the app.
+
+Bump CACHE_VERSION whenever a parser changes the rows it returns.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from nfe_model import MISSING, InvoiceTable
+
+CACHE_VERSION = 3
+CACHE_SUFFIX = '.rows.json'
+
+# MISSING on disk: NUL never occurs in XML 1.0 text, so no parsed value is this
+MISSING_TEXT = '\x00'
+
+MAX_CACHE_BYTES = int(os.environ.get('NFE_CACHE_MB', 256)) * 1024 * 1024
+CACHE_DIR = os.environ.get('NFE_CACHE_DIR') or None
+
+_cache = OrderedDict()  # key -> pickled rows
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def content_key(cliente, payload):
+    """
+    Cache key of an XML payload for a client profile.
+    """
+    return f"{cliente}-{CACHE_VERSION}-{hashlib.sha256(payload).hexdigest()}"
+
+
+def configure(max_bytes=None, directory=None):
+    """
+    Change the memory budget and/or the disk tier folder ('' disables it).
+    """
+    global MAX_CACHE_BYTES, CACHE_DIR
+    with _cache_lock:
+        if max_bytes is not None:
+            MAX_CACHE_BYTES = max_bytes
+            _evict()
+        if directory is not None:
+            CACHE_DIR = directory or None
+
+
+def get(key):
+    """
+    Rows cached under key, or None.
+    """
+    with _cache_lock:
+        blob = _cache.get(key)
+        if blob is not None:
+            _cache.move_to_end(key)
+        directory = CACHE_DIR
+
+    if blob is not None:
+        return pickle.loads(blob)
+    if directory:
+        rows = _read_entry(os.path.join(directory, key + CACHE_SUFFIX))
+        if rows is not None:
+            _remember(key, pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+            return rows
+    return None
+
+
+def put(key, rows):
+    """
+    Store the rows of a successfully parsed file.
+    """
+    _remember(key, pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+    directory = CACHE_DIR
+    if directory and isinstance(rows, InvoiceTable):
+        try:
+            data = _encode_table(rows)
+        except (TypeError, ValueError):
+            # A value JSON cannot hold: the entry is only kept in memory
+            return
+        _write_entry(directory, key + CACHE_SUFFIX, data)
+
+
+def clear_cache():
+    """
+    Drop the in-memory entries (the disk tier is kept).
+    """
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def _remember(key, blob):
+    global _cache_bytes
+    if len(blob) > MAX_CACHE_BYTES:
+        return
+    with _cache_lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= len(previous)
+        _cache[key] = blob
+        _cache_bytes += len(blob)
+        _evict()
+
+
+def _evict():
+    # Caller holds the lock
+    global _cache_bytes
+    while _cache and _cache_bytes > MAX_CACHE_BYTES:
+        _, evicted = _cache.popitem(last=False)
+        _cache_bytes -= len(evicted)
+
+
+def _missing_default(value):
+    if value is MISSING:
+        return MISSING_TEXT
+    raise TypeError(f"Cannot cache a value of type {type(value).__name__}")
+
+
+def _encode_table(table):
+    """
+    JSON document with the layout, headers and items of an InvoiceTable.
+    """
+    return json.dumps({
+        'version': CACHE_VERSION,
+        'header_columns': table.header_columns,
+        'item_columns': table.item_columns,
+        'columns': table.columns,
+        'shared': [table.item_columns[index] for index in table._shared],
+        'headers': table.headers,
+        'items': table.items,
+    }, default=_missing_default, separators=(',', ':')).encode('utf-8')
+
+
+def _decode_table(data):
+    """
+    InvoiceTable of a document written by _encode_table; ValueError if it
+    does not have that layout.
+    """
+    document = json.loads(data)
+    if not isinstance(document, dict) or document.get('version') != CACHE_VERSION:
+        raise ValueError("Not a cache entry of this version")
+    layout = [document.get(name) for name in ('header_columns', 'item_columns', 'columns', 'shared')]
+    if not all(isinstance(columns, list) and all(isinstance(column, str) for column in columns)
+               for columns in layout):
+        raise ValueError("Invalid cache entry columns")
+    table = InvoiceTable(*layout[:3], shared=layout[3])
+
+    def values(row, size):
+        if not isinstance(row, list) or len(row) != size \
+                or any(isinstance(value, (list, dict)) for value in row):
+            raise ValueError("Invalid cache entry row")
+        return [MISSING if value == MISSING_TEXT else value for value in row]
+
+    for header in document.get('headers', ()):
+        table.add_invoice(tuple(values(header, len(table.header_columns))))
+    for item in document.get('items', ()):
+        invoice, *item = values(item, len(table.item_columns) + 1)
+        if type(invoice) is not int or not 0 <= invoice < len(table.headers):
+            raise ValueError("Invalid cache entry invoice")
+        table.add_item(invoice, item)
+    return table
+
+
+def _read_entry(path):
+    # Unreadable or invalid entries are misses; the file is parsed again
+    try:
+        with open(path, 'rb') as f:
+            return _decode_table(f.read())
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _write_entry(directory, name, blob):
+    # Atomic replace; an unwritable folder just means no disk tier
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(temp_path, os.path.join(directory, name))
+    except OSError:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,94 @@
+"""
+Registry of client profiles: how the NFe of each client are parsed, turned
+into the final table and exported.
+
+Each client module defines a PROFILE (a ClientProfile with its columns,
+parser, post-processing and output defaults), and PROFILE_MODULES maps the
+client name to that module. The module is imported only when the client is
+first selected, so listing the clients (the app's selectbox, --cliente
+choices) imports no parser, and a worker process only imports the parser of
+the client it converts.
+
+The app, the CLI, the watcher, the HTTP service, the batch pool and the
+SQLite sink read everything client-specific from the profile. Adding a
+client means writing its module with a PROFILE and adding it here.
+"""
+import importlib
+
+# Client name -> module defining its PROFILE, in the order the app lists them
+PROFILE_MODULES = {
+    'Laborlog': 'xmlLABORLOG',
+    'Cargill': 'xmlCARGILL',
+}
+
+# Output formats of the exports (nfe_export)
+FORMATS = ('csv', 'xlsx', 'parquet')
+
+_profiles = {}
+
+
+class ClientProfile:
+    """
+    Columns, parser, post-processing and output defaults of a client.
+
+    new_table()                      -> empty InvoiceTable of the client layout
+    parse(payload)                   -> InvoiceTable of one XML (runs in the workers)
+    build_table(rows, catalog, metrics)
+                                     -> (final DataFrame or None, report or None)
+    output_columns(present)          -> columns of the final table, given the
+                                        columns with values (None: all of them)
+    typed_table(df)                  -> DataFrame with typed columns for Parquet
+
+    catalog is the file name of the EAN catalog used by build_table (PROCV),
+    or None; report is then the DataFrame of EANs missing from it, and
+    merge_reports joins the reports of several chunks. write_csv streams
+    batches straight to a CSV (clients with a fixed column layout only).
+    downloads lists the files the app offers, file_stem names them, and
+    database_fields maps the columns to the nfe_sqlite fields.
+    """
+
+    def __init__(self, name, new_table, parse, build_table, output_columns, typed_table,
+                 downloads=('csv', 'parquet'), file_stem=None, catalog=None, catalog_code=None,
+                 merge_reports=None, write_csv=None, database_fields=None):
+        self.name = name
+        self.new_table = new_table
+        self.parse = parse
+        self.build_table = build_table
+        self.output_columns = output_columns
+        self.typed_table = typed_table
+        self.downloads = tuple(downloads)
+        self.file_stem = file_stem or f"nfe_data_{name.lower()}"
+        self.catalog = catalog
+        self.catalog_code = catalog_code
+        self.merge_reports = merge_reports
+        self.write_csv = write_csv
+        self.database_fields = database_fields
+
+    def __repr__(self):
+        return f"<ClientProfile {self.name}>"
+
+    def file_name(self, formato):
+        """
+        Default output file name for a format.
+        """
+        return f"{self.file_stem}.{formato}"
+
+
+def profile_names():
+    """
+    Names of the registered clients (without importing their modules).
+    """
+    return list(PROFILE_MODULES)
+
+
+def get_profile(name):
+    """
+    Profile of a client, importing its module on first use.
+    """
+    profile = _profiles.get(name)
+    if profile is None:
+        module = PROFILE_MODULES.get(name)
+        if module is None:
+            raise ValueError(f"Unknown client: {name} (use one of {', '.join(PROFILE_MODULES)})")
+        profile = _profiles[name] = importlib.import_module(module).PROFILE
+    return profile
@@ -0,0 +1,332 @@
+"""
+Serviço HTTP local (asyncio, sem dependências extras) para converter NFe.
+
+    python nfe_server.py --porta 8765 --concorrencia 2 --fila 8
+
+    curl --data-binary @nota.xml "http://127.0.0.1:8765/converter/Laborlog"
+    curl --data-binary @notas.zip -o notas.xlsx "http://127.0.0.1:8765/converter/Cargill?formato=xlsx"
+    curl http://127.0.0.1:8765/saude
+
+POST /converter/<cliente>[?formato=csv|xlsx|parquet] recebe um XML ou um ZIP
+com vários XMLs e devolve a tabela final do cliente (PROCV para Laborlog,
+lotes expandidos para Cargill), no mesmo formato do nfe_cli.py. A resposta
+sai em partes (Transfer-Encoding: chunked): o CSV é serializado em blocos de
+ROWS_PER_CHUNK linhas conforme o cliente lê. Os cabeçalhos X-NFe-Arquivos,
+X-NFe-Falhas e X-NFe-Linhas resumem o lote.
+
+O parse roda no pool de processos do nfe_batch, fora do laço de eventos. No
+máximo --concorrencia conversões rodam ao mesmo tempo e até --fila pedidos
+esperam a vez; além disso a resposta é 503 com Retry-After, para o cliente
+tentar de novo. O corpo é lido antes de ocupar uma vaga, em até BODY_TIMEOUT
+segundos (senão 408), e os XMLs de um ZIP somam no máximo --max-mb
+descompactados (senão 413). Por padrão escuta só em 127.0.0.1.
+"""
+import argparse
+import asyncio
+import codecs
+import io
+import json
+import sys
+import zipfile
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from nfe_batch import convert_files, default_workers, new_rows
+from nfe_cli import load_catalog
+from nfe_export import ROWS_PER_CHUNK, parquet_bytes, xlsx_bytes
+from nfe_profiles import get_profile, profile_names
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Tamanho máximo do corpo do pedido (XML ou ZIP)
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+# Pedaços da resposta xlsx/parquet, já montada em memória
+RESPONSE_CHUNK_BYTES = 1024 * 1024
+
+# Segundos para o cliente mandar a linha de pedido e os cabeçalhos
+HEADER_TIMEOUT = 30
+
+# Segundos para o cliente mandar o corpo inteiro (antes de ocupar uma vaga)
+BODY_TIMEOUT = 120
+
+# Razão máxima entre o tamanho descompactado e o compactado de um XML do ZIP
+# (XMLs de NFe comprimem ~10-20x; bem acima disso é uma bomba de ZIP)
+MAX_ZIP_RATIO = 200
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def read_payloads(body, max_bytes=MAX_BODY_BYTES):
+    """
+    (nome, bytes) dos XMLs do pedido: o próprio corpo, ou cada .xml do ZIP
+    Os XMLs descompactados somam no máximo max_bytes (senão 413), conferido
+    pelo diretório do ZIP antes de extrair e de novo durante a extração
+    """
+    if not body.startswith(b'PK\x03\x04'):
+        return [('nota.xml', body)]
+    try:
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and info.filename.lower().endswith('.xml')]
+            if sum(info.file_size for info in members) > max_bytes:
+                raise HTTPError(413, f"XMLs descompactados maiores que {max_bytes} bytes")
+            for info in members:
+                if info.file_size > MAX_ZIP_RATIO * max(info.compress_size, 1):
+                    raise HTTPError(413, f"Taxa de compressão suspeita em {info.filename}")
+
+            payloads = []
+            remaining = max_bytes
+            for info in members:
+                # O tamanho declarado pode mentir: nunca lê além do que resta do orçamento
+                with archive.open(info) as member:
+                    payload = member.read(min(info.file_size, remaining) + 1)
+                if len(payload) > info.file_size or len(payload) > remaining:
+                    raise HTTPError(413, f"XMLs descompactados maiores que {max_bytes} bytes")
+                remaining -= len(payload)
+                payloads.append((info.filename, payload))
+            return payloads
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError):
+        raise HTTPError(400, "ZIP inválido")
+
+
+def convert_payloads(cliente, files, workers=None, catalogo=None):
+    """
+    Tabela final do cliente para os arquivos e a lista de falhas
+    ({'arquivo', 'erro'}); a tabela é None se nada foi extraído
+    """
+    all_data = new_rows(cliente)
+    falhas = []
+    for name, parsed_data, error in convert_files(cliente, files, workers):
+        if parsed_data:
+            all_data.extend(parsed_data)
+        else:
+            falhas.append({'arquivo': name, 'erro': error or 'nenhum item encontrado'})
+
+    if not all_data:
+        return None, falhas
+    df, _ = get_profile(cliente).build_table(all_data, load_catalog(cliente, catalogo))
+    return df, falhas
+
+
+def iter_csv(df):
+    """
+    CSV (';', utf-8 com BOM, como o download do app) em blocos de ROWS_PER_CHUNK linhas
+    """
+    yield codecs.BOM_UTF8
+    for start in range(0, max(len(df), 1), ROWS_PER_CHUNK):
+        chunk = df.iloc[start:start + ROWS_PER_CHUNK]
+        yield chunk.to_csv(index=False, sep=';', header=start == 0).encode('utf-8')
+
+
+def iter_bytes(data):
+    for start in range(0, len(data), RESPONSE_CHUNK_BYTES):
+        yield data[start:start + RESPONSE_CHUNK_BYTES]
+
+
+class ConversionServer:
+    """
+    Rotas e controle de concorrência do serviço.
+    """
+
+    def __init__(self, workers=None, concurrency=2, queue_size=8, catalogo=None, max_body=MAX_BODY_BYTES):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.catalogo = catalogo
+        self.max_body = max_body
+        self.slots = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await asyncio.wait_for(self._read_head(reader), HEADER_TIMEOUT)
+                await self._route(method, target, headers, reader, writer)
+            except HTTPError as e:
+                await self._send(writer, e.status, json.dumps({'erro': str(e)}, ensure_ascii=False).encode('utf-8'),
+                                 'application/json', e.headers)
+            except asyncio.TimeoutError:
+                await self._send(writer, 408, b'', 'text/plain')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Cliente desistiu no meio da resposta
+            pass
+        except Exception as e:
+            print(f"Erro interno: {e}", file=sys.stderr)
+            try:
+                await self._send(writer, 500, json.dumps({'erro': str(e)}, ensure_ascii=False).encode('utf-8'),
+                                 'application/json')
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _read_head(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            raise HTTPError(400, "Linha de pedido inválida")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return parts[0], parts[1], headers
+
+    async def _route(self, method, target, headers, reader, writer):
+        url = urlsplit(target)
+        path = [unquote(part) for part in url.path.split('/') if part]
+
+        if path == ['saude']:
+            if method != 'GET':
+                raise HTTPError(405, "Use GET", {'Allow': 'GET'})
+            status = {'ativos': self.active, 'na_fila': self.waiting,
+                      'concorrencia': self.concurrency, 'fila': self.queue_size}
+            await self._send(writer, 200, json.dumps(status).encode('utf-8'), 'application/json')
+            return
+
+        if len(path) != 2 or path[0] != 'converter':
+            raise HTTPError(404, "Use POST /converter/<cliente>")
+        if method != 'POST':
+            raise HTTPError(405, "Use POST", {'Allow': 'POST'})
+        clientes = {nome.lower(): nome for nome in profile_names()}
+        cliente = clientes.get(path[1].lower())
+        if cliente is None:
+            raise HTTPError(404, f"Cliente desconhecido: {path[1]} (disponíveis: {', '.join(sorted(profile_names()))})")
+        perfil = get_profile(cliente)
+        formato = parse_qs(url.query).get('formato', ['csv'])[0].lower()
+        if formato not in CONTENT_TYPES:
+            raise HTTPError(400, f"Formato não suportado: {formato}")
+
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Informe o Content-Length")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "Content-Length inválido")
+        if length > self.max_body:
+            raise HTTPError(413, f"Corpo maior que {self.max_body} bytes")
+
+        # Contrapressão: com todas as vagas ocupadas e a fila cheia, recusa antes de ler o corpo
+        if self.slots.locked() and self.waiting >= self.queue_size:
+            raise HTTPError(503, "Serviço ocupado, tente novamente", {'Retry-After': '1'})
+
+        # O corpo é lido antes de ocupar uma vaga e com prazo (408): um cliente
+        # lento ou parado nunca segura uma vaga de conversão
+        self.waiting += 1
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT)
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            files = await asyncio.to_thread(read_payloads, body, self.max_body)
+            if not files:
+                raise HTTPError(400, "Nenhum arquivo XML no pedido")
+            df, falhas = await asyncio.to_thread(convert_payloads, cliente, files, self.workers, self.catalogo)
+            if df is None:
+                raise HTTPError(422, "Nenhum dado válido foi extraído dos arquivos XML",
+                                {'X-NFe-Falhas': str(len(falhas))})
+
+            if formato == 'csv':
+                chunks = iter_csv(df)
+            elif formato == 'xlsx':
+                chunks = iter_bytes(await asyncio.to_thread(xlsx_bytes, df))
+            else:
+                chunks = iter_bytes(await asyncio.to_thread(parquet_bytes, perfil.typed_table(df)))
+
+            await self._send_stream(writer, 200, chunks, CONTENT_TYPES[formato], {
+                'Content-Disposition': f'attachment; filename="{perfil.file_name(formato)}"',
+                'X-NFe-Arquivos': str(len(files)),
+                'X-NFe-Falhas': str(len(falhas)),
+                'X-NFe-Linhas': str(len(df)),
+            })
+        finally:
+            self.active -= 1
+            self.slots.release()
+
+    def _head(self, status, content_type, headers):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                 f"Content-Type: {content_type}", "Connection: close"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+
+    async def _send(self, writer, status, body, content_type, headers=None):
+        writer.write(self._head(status, content_type, dict(headers or {}, **{'Content-Length': str(len(body))})))
+        writer.write(b'\r\n' + body)
+        await writer.drain()
+
+    async def _send_stream(self, writer, status, chunks, content_type, headers):
+        writer.write(self._head(status, content_type, dict(headers, **{'Transfer-Encoding': 'chunked'})) + b'\r\n')
+        while True:
+            try:
+                # Serializar um bloco pode levar dezenas de ms: fora do laço de eventos
+                chunk = await asyncio.to_thread(next, chunks, None)
+            except Exception as e:
+                # O status já foi enviado: em vez de um segundo status (500), a
+                # conexão cai sem o bloco final e o cliente vê a resposta incompleta
+                print(f"Erro interno durante a resposta: {e}", file=sys.stderr)
+                writer.transport.abort()
+                return
+            if chunk is None:
+                break
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                # Espera o cliente consumir antes de gerar o próximo bloco
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+
+async def serve(host, port, server, log=sys.stderr):
+    """
+    Atende até ser interrompido (Ctrl+C)
+    """
+    tcp_server = await asyncio.start_server(server.handle, host, port)
+    addresses = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in tcp_server.sockets)
+    print(f"Servindo em {addresses} (concorrência {server.concurrency}, fila {server.queue_size})", file=log)
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serviço HTTP local para converter XMLs de NFe.")
+    parser.add_argument('--host', default='127.0.0.1', help="Endereço (padrão: 127.0.0.1, só a máquina local)")
+    parser.add_argument('-p', '--porta', type=int, default=8765, help="Porta (padrão: 8765)")
+    parser.add_argument('-w', '--workers', type=int, default=default_workers(), help="Processos paralelos (padrão: NFE_WORKERS ou nº de CPUs)")
+    parser.add_argument('--concorrencia', type=int, default=2, help="Conversões simultâneas (padrão: 2)")
+    parser.add_argument('--fila', type=int, default=8, help="Pedidos aguardando vaga antes de responder 503 (padrão: 8)")
+    parser.add_argument('--max-mb', type=int, default=MAX_BODY_BYTES // (1024 * 1024), help="Tamanho máximo do pedido em MB")
+    parser.add_argument('--catalogo', help="Catálogo EAN usado no PROCV (padrão: o do perfil, ex.: laborlog.xlsx para Laborlog)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    async def run():
+        server = ConversionServer(args.workers, args.concorrencia, args.fila, args.catalogo, args.max_mb * 1024 * 1024)
+        await serve(args.host, args.porta, server)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
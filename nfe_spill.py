@@ -0,0 +1,174 @@
+"""
+Bounded-memory holding area for the parsed rows of very large uploads.
+
+A SpillStore collects the InvoiceTable of each converted file (see
+nfe_model) in an in-memory buffer. When the estimated size of the buffer
+passes its share of the memory budget, the buffer is pickled to a chunk file
+in a private temporary folder and a new one is started, so at most one
+buffer of rows is held at a time:
+
+    with SpillStore(xmlCARGILL.nova_tabela, budget_bytes=512 * 2**20) as store:
+        for table in tables:
+            store.add(table)
+        for chunk in store.chunks():     # spilled chunks, then the buffer
+            ...                          # append chunk to the CSV/XLSX
+    # the folder and every chunk file are gone here
+
+The exports then stream over chunks() one table at a time (see
+XMLtoEXCEL.export_spilled and nfe_export.write_xlsx_frames). Chunks are
+exported separately, so present_columns keeps the union of the columns with
+a value in any chunk: every chunk is written with the same columns as the
+whole table would have.
+
+The size of a table is an estimate (sys.getsizeof of a sample of its tuples
+and values); interned codes shared by many rows are counted once per row, so
+it errs on the high side.
+"""
+import os
+import pickle
+import sys
+import tempfile
+
+MB = 1024 * 1024
+
+# Default budget of the app's limited-memory mode (NFE_MEMORY_BUDGET_MB)
+DEFAULT_BUDGET_MB = int(os.environ.get('NFE_MEMORY_BUDGET_MB', 512))
+
+# Share of the budget for buffered rows; the rest is left for the file
+# payloads being converted and the DataFrame of the chunk being exported
+BUFFER_SHARE = 4
+
+# Rows measured per table by estimate_bytes
+SAMPLE_ROWS = 100
+
+CHUNK_SUFFIX = '.chunk.pickle'
+
+
+def _tuple_bytes(values):
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+
+def estimate_bytes(table):
+    """
+    Approximate memory held by the headers and rows of an InvoiceTable.
+    """
+    size = 0
+    for rows in (table.headers, table.items):
+        if rows:
+            step = max(1, len(rows) // SAMPLE_ROWS)
+            sample = rows[::step]
+            size += sum(_tuple_bytes(row) for row in sample) * len(rows) // len(sample)
+            size += sys.getsizeof(rows)
+    return size
+
+
+class SpillStore:
+    """
+    Rows of a conversion kept under a memory budget, spilling to disk chunks.
+    """
+
+    def __init__(self, new_table, budget_bytes=DEFAULT_BUDGET_MB * MB, directory=None):
+        self.new_table = new_table
+        self.budget_bytes = budget_bytes
+        self.buffer_bytes = max(1, budget_bytes // BUFFER_SHARE)
+        self.directory = directory
+        self.chunk_paths = []
+        self.rows = 0
+        self._temp = None
+        self._buffer = new_table()
+        self._buffered = 0
+        self._present = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def spilled(self):
+        """
+        Number of chunk files written to disk.
+        """
+        return len(self.chunk_paths)
+
+    def path(self, name):
+        """
+        Path of a file in the store's temporary folder (removed by close).
+        """
+        if self._temp is None:
+            self._temp = tempfile.TemporaryDirectory(prefix='nfe_spill_', dir=self.directory)
+        return os.path.join(self._temp.name, name)
+
+    def add(self, table):
+        """
+        Append the rows of an InvoiceTable, spilling the buffer to disk once
+        it passes the budget.
+        """
+        self._buffer.extend(table)
+        self.rows += len(table)
+        self._buffered += estimate_bytes(table)
+        if self._buffered >= self.buffer_bytes:
+            self.spill()
+
+    def spill(self):
+        """
+        Write the buffered rows to a new chunk file and empty the buffer.
+        """
+        if not len(self._buffer):
+            return
+        self._present.update(self._buffer.present_columns())
+        path = self.path(f'{len(self.chunk_paths):06d}{CHUNK_SUFFIX}')
+        with open(path, 'wb') as f:
+            pickle.dump(self._buffer, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.chunk_paths.append(path)
+        self._buffer = self.new_table()
+        self._buffered = 0
+
+    def chunks(self):
+        """
+        Every stored table in insertion order: the spilled chunks (read back
+        one at a time), then the buffer.
+        """
+        for path in self.chunk_paths:
+            with open(path, 'rb') as f:
+                yield pickle.load(f)
+        if len(self._buffer):
+            yield self._buffer
+
+    def head(self, count):
+        """
+        New table with the first count stored rows (for a preview), reading
+        only the chunks they are in.
+        """
+        table = self.new_table()
+        chunks = self.chunks()
+        try:
+            for chunk in chunks:
+                table.extend(chunk.head(count - len(table)))
+                if len(table) >= count:
+                    break
+        finally:
+            chunks.close()
+        return table
+
+    def present_columns(self):
+        """
+        Output columns with a value in at least one stored row, in output order.
+        """
+        present = self._present | set(self._buffer.present_columns())
+        return [column for column in self._buffer.columns if column in present]
+
+    def close(self):
+        """
+        Drop the buffer and remove the temporary folder with every chunk.
+        """
+        self._buffer = self.new_table()
+        self._buffered = 0
+        self.chunk_paths = []
+        if self._temp is not None:
+            self._temp.cleanup()
+            self._temp = None
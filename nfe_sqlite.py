@@ -0,0 +1,230 @@
+"""
+SQLite sink for converted invoices, for audit queries over past conversions.
+
+Both client profiles write into the same normalized tables, keyed by the
+44-digit access key (infNFe Id without the 'NFe' prefix):
+
+    invoices (access_key, profile, number, series, issued_at, issued_on,
+              emit_cnpj, emit_name, dest_cnpj, dest_name, total_value,
+              source, loaded_at)
+    items    (access_key, item_number, product_code, ean, description, ncm,
+              cfop, unit, quantity, unit_value, total_value)
+    lots     (access_key, item_number, position, lot, quantity, unit)
+
+with indexes on the CNPJs, the emission date (issued_on, YYYY-MM-DD), NCM and
+CFOP. The rows come from the InvoiceTable of each converted file (see
+nfe_model); the database_fields of each client profile (see nfe_profiles)
+map its columns to the database fields. Loading an invoice again replaces
+its rows, and every call to add is one transaction of executemany inserts.
+
+    SELECT i.*, n.issued_on FROM items i JOIN invoices n USING (access_key)
+    WHERE n.emit_cnpj = '...' AND i.cfop = '5102'
+      AND n.issued_on BETWEEN '2026-07-01' AND '2026-09-30'
+"""
+import math
+import sqlite3
+from datetime import datetime, timezone
+
+from nfe_model import MISSING
+from nfe_profiles import get_profile
+
+INVOICE_FIELDS = ('number', 'series', 'issued_at', 'emit_cnpj', 'emit_name', 'dest_cnpj', 'dest_name', 'total_value')
+ITEM_FIELDS = ('product_code', 'ean', 'description', 'ncm', 'cfop', 'unit', 'quantity', 'unit_value', 'total_value')
+LOT_FIELDS = ('lot', 'quantity', 'unit')
+NUMERIC_FIELDS = {'total_value', 'quantity', 'unit_value'}
+
+# Cargill rows for the infCpl lots beyond the first of a product
+EXTRA_LOT_SUFFIX = '_lote_extra'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    access_key TEXT PRIMARY KEY,
+    profile TEXT NOT NULL,
+    number TEXT,
+    series TEXT,
+    issued_at TEXT,
+    issued_on TEXT,
+    emit_cnpj TEXT,
+    emit_name TEXT,
+    dest_cnpj TEXT,
+    dest_name TEXT,
+    total_value REAL,
+    source TEXT,
+    loaded_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    access_key TEXT NOT NULL,
+    item_number INTEGER NOT NULL,
+    product_code TEXT,
+    ean TEXT,
+    description TEXT,
+    ncm TEXT,
+    cfop TEXT,
+    unit TEXT,
+    quantity REAL,
+    unit_value REAL,
+    total_value REAL,
+    PRIMARY KEY (access_key, item_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lots (
+    access_key TEXT NOT NULL,
+    item_number INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    lot TEXT,
+    quantity REAL,
+    unit TEXT,
+    PRIMARY KEY (access_key, item_number, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS invoices_emit_cnpj ON invoices (emit_cnpj, issued_on);
+CREATE INDEX IF NOT EXISTS invoices_dest_cnpj ON invoices (dest_cnpj, issued_on);
+CREATE INDEX IF NOT EXISTS invoices_issued_on ON invoices (issued_on);
+CREATE INDEX IF NOT EXISTS items_ncm ON items (ncm);
+CREATE INDEX IF NOT EXISTS items_cfop ON items (cfop);
+"""
+
+
+def _text(value):
+    if value is MISSING or value is None or value == '':
+        return None
+    if isinstance(value, float):
+        return None if math.isnan(value) else str(value)
+    return value
+
+
+def _number(value):
+    if value is MISSING or value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def normalize_access_key(value):
+    """
+    44-digit access key from an infNFe Id ('NFe3519...'), or None.
+    """
+    value = _text(value)
+    if value is None:
+        return None
+    value = value.strip()
+    if value[:3].upper() == 'NFE':
+        value = value[3:]
+    return value or None
+
+
+def _getter(index, column, numeric):
+    # Reads one field from a header/item tuple; fields the profile lacks are NULL
+    if column is None or column not in index:
+        return lambda values: None
+    position = index[column]
+    convert = _number if numeric else _text
+    return lambda values: convert(values[position])
+
+
+class InvoiceDatabase:
+    """
+    SQLite database of converted invoices, items and lots.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, profile, tables):
+        """
+        Load (InvoiceTable, source file) pairs parsed with profile, in one
+        transaction. Invoices without an access key are skipped, and an
+        invoice repeated in the batch is loaded once, from its last copy.
+        Returns the counts of invoices, items, lots and skipped invoices.
+        """
+        fields = get_profile(profile).database_fields
+        loaded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        invoices = {}
+        items = {}  # access key -> item rows, of the last copy of the invoice
+        lots = {}
+        skipped = 0
+
+        for table, source in tables:
+            header_index = {column: index for index, column in enumerate(table.header_columns)}
+            item_index = {column: index + 1 for index, column in enumerate(table.item_columns)}
+            read_key = _getter(header_index, fields['invoice']['access_key'], False)
+            read_invoice = [_getter(header_index, fields['invoice'][name], name in NUMERIC_FIELDS)
+                            for name in INVOICE_FIELDS]
+            read_number = _getter(item_index, fields['item_number'], False)
+            read_item = [_getter(item_index, fields['item'][name], name in NUMERIC_FIELDS)
+                         for name in ITEM_FIELDS]
+            read_lot = [_getter(item_index, fields['lot'][name], name in NUMERIC_FIELDS)
+                        for name in LOT_FIELDS]
+
+            keys = []
+            latest = {}  # access key -> index of its last header in this table
+            for invoice, header in enumerate(table.headers):
+                key = normalize_access_key(read_key(header))
+                keys.append(key)
+                if key is None:
+                    skipped += 1
+                    continue
+                values = [read(header) for read in read_invoice]
+                issued_at = values[2]
+                invoices[key] = (key, profile, *values, issued_at[:10] if issued_at else None, source, loaded_at)
+                # A later copy replaces the rows of the earlier ones
+                latest[key] = invoice
+                items[key] = []
+                lots[key] = []
+
+            sequence = [0] * len(keys)
+            lot_positions = {}
+            for item in table.items:
+                invoice = item[0]
+                key = keys[invoice]
+                if key is None or latest[key] != invoice:
+                    continue
+                number = read_number(item)
+                extra_lot = number is not None and number.endswith(EXTRA_LOT_SUFFIX)
+                if extra_lot:
+                    number = number[:-len(EXTRA_LOT_SUFFIX)]
+                else:
+                    sequence[invoice] += 1
+                try:
+                    number = int(number)
+                except (TypeError, ValueError):
+                    number = sequence[invoice]
+                if not extra_lot:
+                    items[key].append((key, number, *[read(item) for read in read_item]))
+
+                lot = [read(item) for read in read_lot]
+                if lot[0] is not None:
+                    position = lot_positions.get((key, number), 0) + 1
+                    lot_positions[key, number] = position
+                    lots[key].append((key, number, position, *lot))
+
+        items = [row for rows in items.values() for row in rows]
+        lots = [row for rows in lots.values() for row in rows]
+
+        with self.connection:
+            # Loading an invoice again replaces its items and lots
+            stale = [(key,) for key in invoices]
+            self.connection.executemany("DELETE FROM items WHERE access_key = ?", stale)
+            self.connection.executemany("DELETE FROM lots WHERE access_key = ?", stale)
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO invoices VALUES ({','.join('?' * 13)})", invoices.values())
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO items VALUES ({','.join('?' * 11)})", items)
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO lots VALUES ({','.join('?' * 6)})", lots)
+
+        return {'invoices': len(invoices), 'items': len(items), 'lots': len(lots), 'skipped': skipped}
@@ -0,0 +1,287 @@
+"""
+Gerador determinístico de NFe sintéticas (nfeProc, layout 4.00).
+
+A mesma semente gera sempre o mesmo documento. São configuráveis o número
+de itens, os grupos de imposto sorteados por item (por padrão ICMS00–90,
+IPITrib/IPINT, PISOutr e COFINSOutr; ICMSSN, PISAliq/PISNT e os do COFINS
+podem ser pedidos, ver *_VARIANTS), os lotes em <rastro>, os lotes no texto
+do infCpl ("-CODIGO-LOTE: 0052246201-32SAC, ...") e o número de arquivos.
+
+    python nfe_synthetic.py -n 100 --itens 50 xmls_sinteticos/
+
+Usado pelo nfe_bench.py; os arquivos também servem para testar o app e o
+nfe_cli.py sem expor notas reais.
+"""
+import argparse
+import os
+import random
+import sys
+from xml.sax.saxutils import escape
+
+NFE_NAMESPACE = 'http://www.portalfiscal.inf.br/nfe'
+
+ICMS_GROUPS = ('ICMS00', 'ICMS10', 'ICMS20', 'ICMS30', 'ICMS40', 'ICMS51', 'ICMS60', 'ICMS70', 'ICMS90')
+IPI_GROUPS = ('IPITrib', 'IPINT')
+PIS_GROUPS = ('PISOutr',)
+COFINS_GROUPS = ('COFINSOutr',)
+# Grupos aceitos além do padrão (Simples Nacional, PIS/COFINS por alíquota e não tributado)
+ICMS_VARIANTS = ICMS_GROUPS + ('ICMSSN101', 'ICMSSN102', 'ICMSSN500', 'ICMSSN900')
+PIS_VARIANTS = ('PISAliq', 'PISNT') + PIS_GROUPS
+COFINS_VARIANTS = ('COFINSAliq', 'COFINSNT') + COFINS_GROUPS
+
+# Quantidades no infCpl nos formatos vistos nas notas Cargill
+INFCPL_QUANTITIES = ('32', '8', '500', '1,300', '16.000', '2,5', '900', '12,34')
+UNITS = ('SAC', 'TAM', 'KG', 'UN')
+CFOPS = ('5102', '6102', '5405', '6108')
+UFS = ('AL', 'SP', 'MG', 'PR', 'GO')
+
+# Quantidade de EANs distintos sorteados pelos itens (ver ean_pool)
+EAN_POOL_SIZE = 500
+
+
+def ean13(base):
+    """
+    EAN-13 com dígito verificador a partir de 12 dígitos
+    """
+    digits = f"{base:012d}"[-12:]
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def ean_pool(size=EAN_POOL_SIZE):
+    """
+    EANs usados pelos itens gerados (o benchmark monta o PROCV com eles)
+    """
+    return [ean13(789100000000 + i * 7919) for i in range(size)]
+
+
+def _money(rng, low, high):
+    return f"{rng.uniform(low, high):.2f}"
+
+
+def _icms(rng, group, vprod):
+    orig = rng.choice('0125')
+    vbc = vprod
+    picms = rng.choice(('4.00', '7.00', '12.00', '18.00'))
+    vicms = f"{float(vbc) * float(picms) / 100:.2f}"
+    st = (f"<modBCST>4</modBCST><pMVAST>40.00</pMVAST><vBCST>{vbc}</vBCST>"
+          f"<pICMSST>18.00</pICMSST><vICMSST>{vicms}</vICMSST>")
+    deson = f"<vICMSDeson>{_money(rng, 1, 500)}</vICMSDeson><motDesICMS>9</motDesICMS>"
+    own = f"<modBC>3</modBC><vBC>{vbc}</vBC><pICMS>{picms}</pICMS><vICMS>{vicms}</vICMS>"
+
+    if group == 'ICMS00':
+        body = f"<CST>00</CST>{own}"
+    elif group == 'ICMSSN101':
+        body = f"<CSOSN>101</CSOSN><pCredSN>2.5600</pCredSN><vCredICMSSN>{float(vbc) * 0.0256:.2f}</vCredICMSSN>"
+    elif group == 'ICMSSN102':
+        body = f"<CSOSN>{rng.choice(('102', '103', '300', '400'))}</CSOSN>"
+    elif group == 'ICMSSN500':
+        body = "<CSOSN>500</CSOSN><vBCSTRet>0.00</vBCSTRet><pST>0.0000</pST><vICMSSTRet>0.00</vICMSSTRet>"
+    elif group == 'ICMSSN900':
+        body = f"<CSOSN>900</CSOSN>{own}"
+    elif group == 'ICMS10':
+        body = f"<CST>10</CST>{own}{st}"
+    elif group == 'ICMS20':
+        body = (f"<CST>20</CST><modBC>3</modBC><pRedBC>33.33</pRedBC><vBC>{vbc}</vBC>"
+                f"<pICMS>{picms}</pICMS><vICMS>{vicms}</vICMS>{deson}")
+    elif group == 'ICMS30':
+        body = f"<CST>30</CST>{st}{deson}"
+    elif group == 'ICMS40':
+        body = f"<CST>{rng.choice(('40', '41', '50'))}</CST>{deson}"
+    elif group == 'ICMS51':
+        body = (f"<CST>51</CST><modBC>3</modBC><vBC>{vbc}</vBC><pICMS>{picms}</pICMS>"
+                f"<vICMSOp>{vicms}</vICMSOp><pDif>100.0000</pDif><vICMSDif>{vicms}</vICMSDif><vICMS>0.00</vICMS>")
+    elif group == 'ICMS60':
+        body = "<CST>60</CST><vBCSTRet>0.00</vBCSTRet><pST>0.0000</pST><vICMSSTRet>0.00</vICMSSTRet>"
+    elif group == 'ICMS70':
+        body = (f"<CST>70</CST><modBC>3</modBC><pRedBC>33.33</pRedBC><vBC>{vbc}</vBC>"
+                f"<pICMS>{picms}</pICMS><vICMS>{vicms}</vICMS>{st}{deson}")
+    else:
+        body = f"<CST>90</CST>{own}{deson}"
+    return f"<ICMS><{group}><orig>{orig}</orig>{body}</{group}></ICMS>"
+
+
+def _ipi(group, vprod):
+    if group == 'IPITrib':
+        vipi = f"{float(vprod) * 0.05:.2f}"
+        body = f"<IPITrib><CST>50</CST><vBC>{vprod}</vBC><pIPI>5.0000</pIPI><vIPI>{vipi}</vIPI></IPITrib>"
+    else:
+        body = "<IPINT><CST>53</CST></IPINT>"
+    return f"<IPI><cEnq>999</cEnq>{body}</IPI>"
+
+
+def _pis_cofins(rng, tax, group, vprod):
+    rate = '0.6500' if tax == 'PIS' else '3.0000'
+    value = f"{float(vprod) * float(rate) / 100:.2f}"
+    p_tag, v_tag = ('pPIS', 'vPIS') if tax == 'PIS' else ('pCOFINS', 'vCOFINS')
+    if group.endswith('NT'):
+        return f"<{tax}><{group}><CST>{rng.choice(('04', '06', '07', '08', '09'))}</CST></{group}></{tax}>"
+    cst = rng.choice(('01', '02')) if group.endswith('Aliq') else rng.choice(('49', '99'))
+    return (f"<{tax}><{group}><CST>{cst}</CST><vBC>{vprod}</vBC>"
+            f"<{p_tag}>{rate}</{p_tag}><{v_tag}>{value}</{v_tag}></{group}></{tax}>")
+
+
+def _infcpl_lots(rng, codes, lots_per_product):
+    parts = []
+    for code in codes:
+        lots = ', '.join(
+            f"{rng.randint(51000000, 52999999):010d}-{rng.choice(INFCPL_QUANTITIES)}{rng.choice(UNITS[:3])}"
+            for _ in range(lots_per_product)
+        )
+        parts.append(f"-{code}-LOTE: {lots}")
+    return ''.join(parts)
+
+
+def generate_nfe(seed, items=10, icms_groups=ICMS_GROUPS, ipi_groups=IPI_GROUPS,
+                 pis_groups=PIS_GROUPS, cofins_groups=COFINS_GROUPS,
+                 rastro_lots=1, infcpl_lots=2, products=None):
+    """
+    Documento nfeProc (str) determinístico para a semente.
+
+    items: número de <det>; products: códigos distintos sorteados pelos itens
+    (padrão: metade dos itens, para haver produtos repetidos); rastro_lots:
+    lotes em <rastro> por item; infcpl_lots: lotes por produto no infCpl
+    (0 omite o infAdic). Os grupos de imposto são sorteados por item entre os
+    informados; um grupo vazio omite o imposto.
+    """
+    rng = random.Random(seed)
+    eans = ean_pool()
+    product_count = products or max(1, items // 2)
+    catalog = [str(100141400 + i) for i in range(product_count)]
+
+    number = 1000 + seed
+    key = f"3524{seed % 10**8:08d}{99888777000166:014d}55001{number:09d}1{seed % 10**8:08d}"[:43]
+    key += str(sum(int(d) for d in key) % 10)
+
+    dets = []
+    codes = []
+    total_prod = 0.0
+    for n_item in range(1, items + 1):
+        code = rng.choice(catalog)
+        if code not in codes:
+            codes.append(code)
+        qcom = f"{rng.uniform(1, 2000):.4f}"
+        vun = f"{rng.uniform(1, 200):.10f}"
+        vprod = f"{float(qcom) * float(vun):.2f}"
+        total_prod += float(vprod)
+
+        optional = ''
+        if rng.random() < 0.5:
+            optional += f"<CEST>{rng.randint(100000, 9999999):07d}</CEST>"
+        order = ''
+        if rng.random() < 0.7:
+            order = f"<xPed>4517{rng.randint(100000, 999999)}</xPed><nItemPed>{n_item * 10}</nItemPed>"
+        if rng.random() < 0.3:
+            order += f"<nFCI>{rng.randint(10**7, 10**8 - 1)}-ABCD-1234-5678-{rng.randint(10**11, 10**12 - 1)}</nFCI>"
+        rastro = ''.join(
+            f"<rastro><nLote>L{rng.randint(1, 99999):05d}</nLote><qLote>{qcom}</qLote>"
+            f"<dFab>2024-01-{rng.randint(1, 28):02d}</dFab><dVal>2025-01-{rng.randint(1, 28):02d}</dVal></rastro>"
+            for _ in range(rastro_lots)
+        )
+        unit = rng.choice(UNITS)
+        ean = rng.choice(eans) if rng.random() < 0.9 else 'SEM GTIN'
+
+        taxes = _icms(rng, rng.choice(icms_groups), vprod) if icms_groups else ''
+        if ipi_groups:
+            taxes += _ipi(rng.choice(ipi_groups), vprod)
+        if pis_groups:
+            taxes += _pis_cofins(rng, 'PIS', rng.choice(pis_groups), vprod)
+        if cofins_groups:
+            taxes += _pis_cofins(rng, 'COFINS', rng.choice(cofins_groups), vprod)
+
+        dets.append(
+            f'<det nItem="{n_item}"><prod><cProd>{code}</cProd><cEAN>{ean}</cEAN>'
+            f"<xProd>{escape(f'PRODUTO {code} & MILHO SC 25KG')}</xProd><NCM>{rng.choice(('10059010', '23099090', '12019000'))}</NCM>"
+            f"{optional}<CFOP>{rng.choice(CFOPS)}</CFOP><uCom>{unit}</uCom><qCom>{qcom}</qCom>"
+            f"<vUnCom>{vun}</vUnCom><vProd>{vprod}</vProd><cEANTrib>{ean}</cEANTrib><uTrib>{unit}</uTrib>"
+            f"<qTrib>{qcom}</qTrib><vUnTrib>{vun}</vUnTrib><indTot>1</indTot>{order}{rastro}</prod>"
+            f"<imposto><vTotTrib>0.00</vTotTrib>{taxes}</imposto></det>"
+        )
+
+    inf_adic = ''
+    if infcpl_lots:
+        inf_cpl = ("S/PED:4517516666 Produto produzido a partir de milho transgenico. "
+                   "Valor do ICMS desonerado = R$ 34989.22 - 000001 .Nao incidencia de ICMS conforme RICMS. "
+                   + _infcpl_lots(rng, codes, infcpl_lots))
+        inf_adic = f"<infAdic><infCpl>{escape(inf_cpl)}</infCpl></infAdic>"
+
+    uf = rng.choice(UFS)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<nfeProc xmlns="{NFE_NAMESPACE}" versao="4.00"><NFe xmlns="{NFE_NAMESPACE}">'
+        f'<infNFe Id="NFe{key}" versao="4.00">'
+        f"<ide><cUF>35</cUF><cNF>{seed % 10**8:08d}</cNF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod>"
+        f"<serie>{1 + seed % 9}</serie><nNF>{number}</nNF><dhEmi>2024-05-{1 + seed % 28:02d}T10:11:12-03:00</dhEmi>"
+        f"<tpNF>1</tpNF><idDest>2</idDest><cMunFG>3550308</cMunFG><tpImp>1</tpImp><tpEmis>1</tpEmis>"
+        f"<cDV>{key[-1]}</cDV><tpAmb>2</tpAmb><finNFe>1</finNFe><indFinal>0</indFinal><indPres>9</indPres>"
+        f"<procEmi>0</procEmi><verProc>SINTETICO</verProc></ide>"
+        f"<emit><CNPJ>99888777000166</CNPJ><xNome>FORNECEDOR {seed} LTDA</xNome><enderEmit><xLgr>RUA A</xLgr>"
+        f"<nro>{seed}</nro><xBairro>CENTRO</xBairro><cMun>2704302</cMun><xMun>MACEIO</xMun><UF>AL</UF>"
+        f"<CEP>57000000</CEP><cPais>1058</cPais><xPais>BRASIL</xPais></enderEmit><IE>240000000</IE><CRT>3</CRT></emit>"
+        f"<dest><CNPJ>{12345678000100 + seed % 90:014d}</CNPJ><xNome>CLIENTE {seed % 90} SA</xNome><enderDest>"
+        f"<xLgr>AV B</xLgr><nro>100</nro><xBairro>DISTRITO</xBairro><cMun>3550308</cMun><xMun>SAO PAULO</xMun>"
+        f"<UF>{uf}</UF><CEP>01000000</CEP></enderDest><indIEDest>1</indIEDest><IE>110000000</IE></dest>"
+        + ''.join(dets) +
+        f"<total><ICMSTot><vBC>{total_prod:.2f}</vBC><vICMS>0.00</vICMS><vICMSDeson>{rng.uniform(0, 999):.2f}</vICMSDeson>"
+        f"<vFCP>0.00</vFCP><vBCST>0.00</vBCST><vST>0.00</vST><vFCPST>0.00</vFCPST><vFCPSTRet>0.00</vFCPSTRet>"
+        f"<vProd>{total_prod:.2f}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>0.00</vDesc><vII>0.00</vII>"
+        f"<vIPI>0.00</vIPI><vIPIDevol>0.00</vIPIDevol><vPIS>0.00</vPIS><vCOFINS>0.00</vCOFINS><vOutro>0.00</vOutro>"
+        f"<vNF>{total_prod:.2f}</vNF></ICMSTot></total>"
+        f"<transp><modFrete>9</modFrete></transp>{inf_adic}</infNFe></NFe>"
+        f'<protNFe versao="4.00"><infProt><tpAmb>2</tpAmb><verAplic>SINTETICO</verAplic><chNFe>{key}</chNFe>'
+        f"<dhRecbto>2024-05-02T10:11:13-03:00</dhRecbto><nProt>1352400000{seed % 10**5:05d}</nProt>"
+        f"<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe></nfeProc>"
+    )
+
+
+def generate_files(folder, files=10, first_seed=0, **options):
+    """
+    Grava `files` documentos em folder (nfe_<semente>.xml) e devolve os caminhos
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for seed in range(first_seed, first_seed + files):
+        path = os.path.join(folder, f"nfe_{seed:06d}.xml")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(generate_nfe(seed, **options))
+        paths.append(path)
+    return paths
+
+
+def _groups(value, valid):
+    groups = tuple(group for group in value.split(',') if group)
+    invalid = [group for group in groups if group not in valid]
+    if invalid:
+        raise argparse.ArgumentTypeError(f"grupos inválidos: {', '.join(invalid)} (válidos: {', '.join(valid)})")
+    return groups
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Gera XMLs de NFe sintéticos e determinísticos.")
+    parser.add_argument('pasta', help="Pasta de saída")
+    parser.add_argument('-n', '--arquivos', type=int, default=10, help="Número de arquivos")
+    parser.add_argument('--semente', type=int, default=0, help="Semente do primeiro arquivo")
+    parser.add_argument('--itens', type=int, default=10, help="Itens (<det>) por nota")
+    parser.add_argument('--produtos', type=int, help="Códigos de produto distintos por nota (padrão: itens/2)")
+    parser.add_argument('--lotes-rastro', type=int, default=1, help="Lotes em <rastro> por item")
+    parser.add_argument('--lotes-infcpl', type=int, default=2, help="Lotes por produto no infCpl (0 omite)")
+    parser.add_argument('--icms', type=lambda v: _groups(v, ICMS_VARIANTS), default=ICMS_GROUPS, help="Grupos ICMS, separados por vírgula")
+    parser.add_argument('--ipi', type=lambda v: _groups(v, IPI_GROUPS), default=IPI_GROUPS, help="Grupos IPI")
+    parser.add_argument('--pis', type=lambda v: _groups(v, PIS_VARIANTS), default=PIS_GROUPS, help="Grupos PIS")
+    parser.add_argument('--cofins', type=lambda v: _groups(v, COFINS_VARIANTS), default=COFINS_GROUPS, help="Grupos COFINS")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = generate_files(
+        args.pasta, args.arquivos, args.semente, items=args.itens, products=args.produtos,
+        icms_groups=args.icms, ipi_groups=args.ipi, pis_groups=args.pis, cofins_groups=args.cofins,
+        rastro_lots=args.lotes_rastro, infcpl_lots=args.lotes_infcpl,
+    )
+    print(f"{len(paths)} arquivos gerados em {args.pasta}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Single-pass extraction of the tax groups of an NFe item (<det>/<imposto>).
+
+Each tax of an item holds exactly one group, whose tag tells the tax
+situation:
+
+    <imposto>
+      <ICMS><ICMS40>...</ICMS40></ICMS>
+      <IPI><cEnq>999</cEnq><IPINT>...</IPINT></IPI>
+      <PIS><PISOutr>...</PISOutr></PIS>
+      <COFINS><COFINSAliq>...</COFINSAliq></COFINS>
+    </imposto>
+
+Instead of searching the subtree once per candidate group (most of them
+absent), extract_taxes walks the children of <imposto> once and dispatches
+each group on its tag through a table built by compile_tax_table, then reads
+the fields of the group from its own children in the same walk: no find() or
+XPath call per group or field, on either XML backend. Groups missing from the
+table (PISST, ICMSUFDest, II...) are ignored.
+"""
+from nfe_fields import NFE_NS, nfe_tag
+
+# Every group of the NFe 4.00 layout, per tax
+ICMS_GROUPS = (
+    'ICMS00', 'ICMS02', 'ICMS10', 'ICMS15', 'ICMS20', 'ICMS30', 'ICMS40', 'ICMS51',
+    'ICMS53', 'ICMS60', 'ICMS61', 'ICMS70', 'ICMS90', 'ICMSPart', 'ICMSST',
+)
+ICMSSN_GROUPS = ('ICMSSN101', 'ICMSSN102', 'ICMSSN201', 'ICMSSN202', 'ICMSSN500', 'ICMSSN900')
+IPI_GROUPS = ('IPITrib', 'IPINT')
+PIS_GROUPS = ('PISAliq', 'PISQtde', 'PISNT', 'PISOutr')
+COFINS_GROUPS = ('COFINSAliq', 'COFINSQtde', 'COFINSNT', 'COFINSOutr')
+
+
+def compile_tax_table(specs):
+    """
+    Compile a dispatch table from {group name: field spec}.
+
+    The fields of a tax group are its direct children, so every path of the
+    specs is a single tag. Each entry is {group Clark tag: (defaults, fields)},
+    with the defaults of every column of the group and {child Clark tag:
+    ((column, convert), ...)}; groups sharing a spec (list object) share one
+    compiled entry.
+    """
+    compiled = {}
+    table = {}
+    for group, spec in specs.items():
+        entry = compiled.get(id(spec))
+        if entry is None:
+            defaults = {}
+            fields = {}
+            for column, path, type_, default in spec:
+                defaults[column] = default
+                if path is None:
+                    continue
+                if '/' in path:
+                    raise ValueError(f"Tax field {column} is not a child of its group: {path}")
+                convert = None if type_ is str else type_
+                fields[NFE_NS + path] = fields.get(NFE_NS + path, ()) + ((column, convert),)
+            entry = compiled[id(spec)] = (defaults, fields)
+        table[nfe_tag(group)] = entry
+    return table
+
+
+def extract_taxes(imposto, table, row=None):
+    """
+    Fill (and return) the row dict from every group of <imposto> found in
+    table. Each tax, group and field element is visited once.
+    """
+    if row is None:
+        row = {}
+    for tax in imposto:
+        for group in tax:
+            entry = table.get(group.tag)
+            if entry is None:
+                continue
+            defaults, fields = entry
+            row.update(defaults)
+            for child in group:
+                for column, convert in fields.get(child.tag, ()):
+                    row[column] = child.text if convert is None else convert(child.text)
+    return row
@@ -0,0 +1,355 @@
+"""
+Ingestão contínua: monitora uma pasta e converte cada NFe que chega.
+
+    python nfe_watch.py --cliente Laborlog --saida saida/ entrada/
+    python nfe_watch.py --cliente Cargill --saida saida/ -f parquet entrada/
+
+Os XMLs novos em entrada/ são convertidos em lotes com os mesmos parsers do
+app e as linhas vão para a saída do dia:
+  - csv: saida/nfe_<cliente>_<AAAA-MM-DD>.csv, acrescentado a cada lote;
+  - xlsx/parquet: um arquivo por lote em saida/<AAAA-MM-DD>/
+    (pd.read_parquet('saida/<AAAA-MM-DD>') lê o dia inteiro).
+Em seguida o XML vai para entrada/processados (ou entrada/falhas, com um
+<arquivo>.erro.txt explicando o motivo).
+
+Arquivos novos são percebidos na hora com o watchdog (inotify no Linux),
+quando instalado, e por varredura a cada --intervalo segundos em todo caso.
+
+O checkpoint (saida/.checkpoint.jsonl) registra cada lote gravado, com o
+sha256 dos XMLs. Ao reiniciar depois de uma queda, o que ficou pela metade é
+desfeito (o CSV volta ao tamanho do último lote registrado, arquivos
+temporários são apagados) e os XMLs já registrados vão direto para
+processados, sem nova conversão nem linhas duplicadas.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from nfe_batch import convert_paths, default_workers, new_rows
+from nfe_cli import ARQUIVOS_POR_LOTE, load_catalog, skip_duplicates
+from nfe_dedup import KeyIndex
+from nfe_export import write_parquet, write_xlsx
+from nfe_profiles import FORMATS, get_profile, profile_names
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+CHECKPOINT_NAME = '.checkpoint.jsonl'
+TEMP_SUFFIX = '.tmp'
+
+# Arquivos modificados há menos que isso ainda podem estar sendo copiados
+ESTAVEL_SEGUNDOS = 1.0
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def _fsync(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+class Checkpoint:
+    """
+    Registro (JSON lines, só acréscimos) dos lotes já gravados na saída.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = set()
+        self.csv_sizes = {}
+        self.parts = []
+        self.next_batch = 1
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Última linha incompleta: o lote não chegou a ser registrado
+                        continue
+                    self._apply(entry)
+
+    def _apply(self, entry):
+        # Sem 'lote', a linha só anuncia o tamanho do CSV antes de um acréscimo
+        self.hashes.update(entry.get('hashes', ()))
+        if 'lote' in entry:
+            self.next_batch = max(self.next_batch, entry['lote'] + 1)
+        if entry.get('tamanho') is not None:
+            self.csv_sizes[entry['saida']] = entry['tamanho']
+        elif entry.get('saida'):
+            self.parts.append(entry['saida'])
+
+    def commit(self, entry):
+        """
+        Acrescenta a entrada ao registro, já gravada em disco ao retornar.
+        """
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(entry)
+
+    def recover(self, saida, log=sys.stderr):
+        """
+        Desfaz a gravação interrompida de um lote não registrado.
+        """
+        for path, size in self.csv_sizes.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"Recuperação: {path} volta a {size} bytes", file=log)
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        for part in self.parts:
+            # Registrado, mas a queda foi antes de renomear o temporário
+            if not os.path.exists(part) and os.path.exists(part + TEMP_SUFFIX):
+                os.replace(part + TEMP_SUFFIX, part)
+        for raiz, _, nomes in os.walk(saida):
+            for nome in nomes:
+                if nome.endswith(TEMP_SUFFIX):
+                    os.remove(os.path.join(raiz, nome))
+
+
+def pending_files(entrada, agora=None):
+    """
+    XMLs na pasta de entrada (sem subpastas) que já terminaram de ser copiados
+    """
+    agora = agora or time.time()
+    paths = []
+    with os.scandir(entrada) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith('.xml'):
+                continue
+            try:
+                if agora - entry.stat().st_mtime >= ESTAVEL_SEGUNDOS:
+                    paths.append(entry.path)
+            except FileNotFoundError:
+                continue
+    return sorted(paths)
+
+
+def move_to(path, pasta):
+    """
+    Move o arquivo para a pasta, sem sobrescrever um de mesmo nome
+    """
+    os.makedirs(pasta, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    destino = os.path.join(pasta, base + ext)
+    n = 1
+    while os.path.exists(destino):
+        destino = os.path.join(pasta, f"{base}-{n}{ext}")
+        n += 1
+    shutil.move(path, destino)
+    return destino
+
+
+def build_table(cliente, linhas, ean_to_codigo):
+    """
+    DataFrame final do lote, sempre com todas as colunas de saída do perfil
+    (as ausentes no lote vazias, como texto), para que os lotes do dia tenham
+    o mesmo cabeçalho e o mesmo esquema no Parquet
+    """
+    perfil = get_profile(cliente)
+    df, _ = perfil.build_table(linhas, ean_to_codigo)
+    return df.reindex(columns=perfil.output_columns(), fill_value='')
+
+
+def output_path(cliente, saida, formato, lote, dia):
+    """
+    CSV do dia, ou o arquivo do lote na pasta do dia (xlsx/parquet)
+    """
+    if formato == 'csv':
+        return os.path.join(saida, f"nfe_{cliente.lower()}_{dia}.csv")
+    return os.path.join(saida, dia, f"nfe_{cliente.lower()}_{lote:06d}.{formato}")
+
+
+def append_output(df, cliente, path, formato):
+    """
+    Grava as linhas do lote e devolve o novo tamanho do CSV (None para xlsx/parquet,
+    que ficam com o sufixo TEMP_SUFFIX até o lote ser registrado)
+    """
+    if formato == 'csv':
+        novo = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, 'a', encoding='utf-8-sig', newline='') as f:
+            df.to_csv(f, index=False, sep=';', header=novo)
+            f.flush()
+            os.fsync(f.fileno())
+        return os.path.getsize(path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if formato == 'xlsx':
+        write_xlsx(df, path + TEMP_SUFFIX)
+    else:
+        write_parquet(get_profile(cliente).typed_table(df), path + TEMP_SUFFIX)
+    _fsync(path + TEMP_SUFFIX)
+    return None
+
+
+def process_batch(cliente, paths, args, checkpoint, index, log=sys.stderr):
+    """
+    Converte um lote de XMLs, grava a saída, registra o checkpoint e move os arquivos.
+    Devolve o número de linhas gravadas.
+    """
+    processados = os.path.join(args.entrada, args.processados)
+    falhas = os.path.join(args.entrada, args.falhas)
+
+    # Já gravados antes de uma queda: só falta tirá-los da entrada
+    hashes = {path: _sha256(path) for path in paths}
+    for path in [path for path in paths if hashes[path] in checkpoint.hashes]:
+        print(f"Já convertido: {path}", file=log)
+        move_to(path, processados)
+    paths = [path for path in paths if hashes[path] not in checkpoint.hashes]
+
+    novos, chaves = skip_duplicates(cliente, paths, index, log)
+    for path in set(paths) - set(novos):
+        move_to(path, processados)
+
+    linhas = new_rows(cliente)
+    convertidos = []
+    for path, parsed_data, error in convert_paths(cliente, novos, args.workers):
+        if parsed_data:
+            linhas.extend(parsed_data)
+            convertidos.append(path)
+        else:
+            erro = error or 'nenhum item encontrado'
+            print(f"Falha ao analisar o arquivo {path}: {erro}", file=log)
+            destino = move_to(path, falhas)
+            with open(destino + '.erro.txt', 'w', encoding='utf-8') as f:
+                f.write(erro + '\n')
+
+    if not convertidos:
+        return 0
+
+    ean_to_codigo = load_catalog(cliente, args.catalogo, log)
+    df = build_table(cliente, linhas, ean_to_codigo)
+    lote = checkpoint.next_batch
+    path = output_path(cliente, args.saida, args.formato, lote, datetime.now().strftime('%Y-%m-%d'))
+    if args.formato == 'csv':
+        # Tamanho antes do acréscimo: uma queda no meio da gravação é desfeita até aqui
+        checkpoint.commit({'saida': path, 'tamanho': os.path.getsize(path) if os.path.exists(path) else 0})
+
+    entry = {
+        'saida': path,
+        'tamanho': append_output(df, cliente, path, args.formato),
+        'lote': lote,
+        'hora': datetime.now().isoformat(timespec='seconds'),
+        'linhas': len(df),
+        'arquivos': [os.path.basename(path) for path in convertidos],
+        'hashes': [hashes[path] for path in convertidos],
+    }
+    checkpoint.commit(entry)
+    if entry['tamanho'] is None:
+        os.replace(entry['saida'] + TEMP_SUFFIX, entry['saida'])
+    if index is not None:
+        index.add(cliente, [(chaves[path], path) for path in convertidos])
+
+    for path in convertidos:
+        move_to(path, processados)
+    print(f"Lote {lote}: {len(convertidos)} arquivo(s), {len(df)} linhas em {entry['saida']}", file=log)
+    return len(df)
+
+
+class _Wakeup(FileSystemEventHandler if Observer else object):
+    # Acorda o laço principal a cada arquivo criado, movido ou fechado na entrada
+    def __init__(self, event):
+        self.event = event
+
+    def on_any_event(self, event):
+        self.event.set()
+
+
+def watch(args, log=sys.stderr, stop=None):
+    """
+    Laço principal: converte o que estiver pendente e espera novos arquivos
+    (até stop ser sinalizado, ou uma única vez com args.uma_vez)
+    """
+    stop = stop or threading.Event()
+    os.makedirs(args.saida, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(args.saida, CHECKPOINT_NAME))
+    checkpoint.recover(args.saida, log)
+    index = KeyIndex(args.indice_chaves) if args.indice_chaves else None
+
+    wakeup = threading.Event()
+    observer = None
+    if Observer is not None and not args.uma_vez:
+        observer = Observer()
+        observer.schedule(_Wakeup(wakeup), args.entrada, recursive=False)
+        observer.start()
+    print(f"Monitorando {args.entrada} ({'watchdog' if observer else 'varredura'}, "
+          f"a cada {args.intervalo:g} s)", file=log)
+
+    try:
+        while not stop.is_set():
+            wakeup.clear()
+            paths = pending_files(args.entrada)
+            for inicio in range(0, len(paths), ARQUIVOS_POR_LOTE):
+                try:
+                    process_batch(args.cliente, paths[inicio:inicio + ARQUIVOS_POR_LOTE], args, checkpoint, index, log)
+                except Exception as e:
+                    # Disco cheio, arquivo removido no meio do lote...: desfaz e tenta na próxima volta
+                    print(f"Erro no lote: {e}", file=log)
+                    checkpoint.recover(args.saida, log)
+                    break
+            if args.uma_vez:
+                break
+            # Um arquivo ainda sendo copiado é revisto assim que ficar estável
+            wakeup.wait(args.intervalo)
+            if wakeup.is_set():
+                stop.wait(ESTAVEL_SEGUNDOS)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if index is not None:
+            index.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Monitora uma pasta e converte as NFe que chegam.")
+    parser.add_argument('entrada', help="Pasta monitorada (XMLs no primeiro nível)")
+    parser.add_argument('-c', '--cliente', choices=sorted(profile_names()), required=True, help="Perfil do cliente")
+    parser.add_argument('-o', '--saida', required=True, help="Pasta das saídas diárias e do checkpoint")
+    parser.add_argument('-f', '--formato', choices=FORMATS, default='csv', help="Formato de saída (padrão: csv)")
+    parser.add_argument('-w', '--workers', type=int, default=default_workers(), help="Processos paralelos (padrão: NFE_WORKERS ou nº de CPUs)")
+    parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos entre varreduras da pasta (padrão: 2)")
+    parser.add_argument('--processados', default='processados', help="Subpasta dos XMLs convertidos")
+    parser.add_argument('--falhas', default='falhas', help="Subpasta dos XMLs que não puderam ser convertidos")
+    parser.add_argument('--catalogo', help="Catálogo EAN usado no PROCV (padrão: o do perfil, ex.: laborlog.xlsx para Laborlog)")
+    parser.add_argument('--indice-chaves', default=os.environ.get('NFE_INDEX_DB'),
+                        help="SQLite com as chaves de acesso já convertidas; essas notas são ignoradas (padrão: NFE_INDEX_DB)")
+    parser.add_argument('--uma-vez', action='store_true', help="Converte o que estiver na pasta e termina")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.entrada):
+        print(f"Pasta não encontrada: {args.entrada}", file=sys.stderr)
+        return 1
+
+    stop = threading.Event()
+    # SIGTERM (systemd, docker stop) termina o lote atual e sai
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        watch(args, stop=stop)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
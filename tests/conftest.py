@@ -0,0 +1,32 @@
+import glob
+import os
+import sys
+
+import pytest
+
+# The modules live flat at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+@pytest.fixture
+def fixture_paths():
+    """
+    Paths of the small NFe fixtures (nfe_synthetic documents with lots).
+    """
+    return sorted(glob.glob(os.path.join(FIXTURES, '*.xml')))
+
+
+@pytest.fixture
+def payloads(fixture_paths):
+    """
+    (file name, bytes) of every fixture.
+    """
+    result = []
+    for path in fixture_paths:
+        with open(path, 'rb') as f:
+            result.append((os.path.basename(path), f.read()))
+    return result
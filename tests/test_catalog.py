@@ -0,0 +1,65 @@
+"""
+Persisted EAN -> CÓD. LABORLOG index of the catalog workbook (nfe_catalog).
+"""
+import json
+import os
+import pickle
+import shutil
+
+import pytest
+
+import nfe_catalog
+from conftest import ROOT
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    path = tmp_path / 'laborlog.xlsx'
+    shutil.copy(os.path.join(ROOT, 'laborlog.xlsx'), path)
+    nfe_catalog.clear_cache()
+    builds = []
+    build_index = nfe_catalog._build_index
+
+    def counted(*args):
+        builds.append(args[0])
+        return build_index(*args)
+
+    monkeypatch.setattr(nfe_catalog, '_build_index', counted)
+    yield str(path), builds
+    nfe_catalog.clear_cache()
+
+
+def test_index_is_persisted_as_json(workbook):
+    path, builds = workbook
+    mapping, registros = nfe_catalog.load_ean_index(path)
+
+    with open(path + nfe_catalog.INDEX_SUFFIX, encoding='utf-8') as f:
+        persisted = json.load(f)
+    nfe_catalog.clear_cache()
+    reloaded = nfe_catalog.load_ean_index(path)
+
+    assert mapping and registros
+    assert persisted['mapping'] == mapping
+    assert reloaded == (mapping, registros)
+    assert len(builds) == 1
+
+
+def test_untrusted_index_file_is_rebuilt(workbook):
+    path, builds = workbook
+    expected = nfe_catalog.load_ean_index(path)
+    nfe_catalog.clear_cache()
+
+    class Payload:
+        # Would run on pickle.load; the JSON reader never unpickles
+        def __reduce__(self):
+            return (os.remove, (path,))
+
+    index_path = path + nfe_catalog.INDEX_SUFFIX
+    for content in (pickle.dumps(Payload()), b'{"version": 2, "mapping": []}', b'{'):
+        with open(index_path, 'wb') as f:
+            f.write(content)
+        assert nfe_catalog.load_ean_index(path) == expected
+        nfe_catalog.clear_cache()
+
+    assert os.path.exists(path)
+    assert len(builds) == 4
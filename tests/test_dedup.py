@@ -0,0 +1,74 @@
+"""
+Access-key pre-scan and duplicate split (nfe_dedup).
+"""
+import re
+
+import nfe_dedup
+from nfe_dedup import ALREADY_CONVERTED, REPEATED_IN_BATCH, KeyIndex, access_key, split_duplicates
+
+
+def _key(payload):
+    # Independent of the pre-scan regex: the Id attribute of infNFe
+    return re.search(rb'<infNFe Id="([^"]+)"', payload).group(1).decode('ascii')
+
+
+def _keyed(files):
+    return [(name, access_key(payload)) for name, payload in files]
+
+
+def test_prescan_finds_access_key(payloads, fixture_paths):
+    for (name, payload), path in zip(payloads, fixture_paths):
+        assert access_key(payload) == _key(payload), name
+        assert nfe_dedup.read_access_key(path) == _key(payload), name
+
+
+def test_prescan_reads_past_first_bytes(payloads):
+    _, payload = payloads[0]
+    declaration, _, document = payload.partition(b'?>')
+    padded = declaration + b'?><!--' + b' ' * nfe_dedup.PRESCAN_BYTES + b'-->' + document
+
+    assert access_key(padded) == _key(payload)
+
+
+def test_repeated_in_batch_keeps_first_file(payloads):
+    (first, payload), *others = payloads
+    files = [(first, payload), *others, ('reenviada.xml', payload)]
+
+    keep, skipped = split_duplicates('Cargill', _keyed(files))
+
+    assert keep == list(range(len(payloads)))
+    assert skipped == [{'arquivo': 'reenviada.xml', 'chave': _key(payload),
+                        'motivo': REPEATED_IN_BATCH, 'original': first}]
+
+
+def test_key_in_index_is_skipped(payloads, tmp_path):
+    (name, payload), *_ = payloads
+    with KeyIndex(str(tmp_path / 'chaves.sqlite')) as index:
+        index.add('Cargill', [(_key(payload), 'antiga.xml')])
+
+    with KeyIndex(str(tmp_path / 'chaves.sqlite')) as index:
+        keep, skipped = split_duplicates('Cargill', _keyed(payloads), index)
+        # Keys are recorded per client profile
+        other_keep, other_skipped = split_duplicates('Laborlog', _keyed(payloads), index)
+        # Keys the caller converts again are not taken from the index
+        again_keep, again_skipped = split_duplicates('Cargill', _keyed(payloads), index,
+                                                     converted={_key(payload)})
+
+    assert keep == list(range(1, len(payloads)))
+    assert skipped == [{'arquivo': name, 'chave': _key(payload), 'motivo': ALREADY_CONVERTED, 'original': None}]
+    assert (other_keep, other_skipped) == (list(range(len(payloads))), [])
+    assert (again_keep, again_skipped) == (list(range(len(payloads))), [])
+
+
+def test_file_without_key_is_kept(payloads, tmp_path):
+    _, payload = payloads[0]
+    without_key = payload.replace(b' Id="NFe', b' Ref="NFe', 1)
+    files = [('sem_chave.xml', without_key), ('sem_chave_2.xml', without_key), ('vazio.xml', b'')]
+
+    with KeyIndex(str(tmp_path / 'chaves.sqlite')) as index:
+        index.add('Cargill', [(None, 'ignorada.xml')])
+        keep, skipped = split_duplicates('Cargill', _keyed(files), index)
+
+    assert [key for _, key in _keyed(files)] == [None, None, None]
+    assert keep == [0, 1, 2]
+    assert skipped == []
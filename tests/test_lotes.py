@@ -0,0 +1,82 @@
+"""
+Lot parsing of the Cargill infCpl (xmlCARGILL.parse_lote_info).
+"""
+import random
+import re
+import time
+
+import pytest
+
+from xmlCARGILL import parse_lote_info
+
+SAMPLE = (
+    "Valor do ICMS desonerado = R$ 34989.22 - 000001 .Nao incidencia de ICMS. "
+    "-100141432-LOTE: 0052246201-32SAC, 0052246203-8SAC-100141447-LOTE: 0052132134-500SAC, "
+    "0052132136-1,300SAC, 0052132139-900SAC-100141493-LOTE: 0051890670-10SAC, 0051924544-10SAC"
+    "-100142227-LOTE: 0051612259-16.000TAM-100142397-LOTE: 0051428952-700SAC"
+)
+
+
+def reference_lote_info(inf_cpl_text):
+    # The original split/match/findall implementation, kept as the oracle
+    lote_info = {}
+    lote_section_match = re.search(r'(-\d+-LOTE:.*)', inf_cpl_text, re.DOTALL)
+    if not lote_section_match:
+        return lote_info
+    produtos_parts = re.split(r'(?=-\d+-LOTE:)', lote_section_match.group(1))
+    for parte in [p.strip() for p in produtos_parts if p.strip()]:
+        match = re.match(r'-(\d+)-LOTE:\s*(.+?)(?=-\d+-LOTE:|$)', parte, re.DOTALL)
+        if not match:
+            continue
+        lotes = lote_info.setdefault(match.group(1), [])
+        for numero_lote, quantidade_str, unidade in re.findall(r'(\d+)-([0-9,.]+)([A-Z]{2,3})',
+                                                               match.group(2).strip()):
+            try:
+                if re.match(r'^\d+,\d{3}$', quantidade_str):
+                    quantidade = float(quantidade_str.replace(',', ''))
+                elif re.match(r'^\d+\.\d{3}$', quantidade_str):
+                    quantidade = float(quantidade_str.replace('.', ''))
+                elif ',' in quantidade_str:
+                    quantidade = float(quantidade_str.replace(',', '.'))
+                elif '.' in quantidade_str:
+                    quantidade = float(quantidade_str.replace('.', ''))
+                else:
+                    quantidade = float(quantidade_str)
+            except ValueError:
+                quantidade = 0.0
+            lotes.append({'lote': numero_lote, 'quantidade': quantidade, 'unidade': unidade})
+    return lote_info
+
+
+def test_sample_lots():
+    lote_info = parse_lote_info(SAMPLE)
+    assert list(lote_info) == ['100141432', '100141447', '100141493', '100142227', '100142397']
+    assert [lote['quantidade'] for lote in lote_info['100141447']] == [500.0, 1300.0, 900.0]
+    assert lote_info['100142227'] == [{'lote': '0051612259', 'quantidade': 16000.0, 'unidade': 'TAM'}]
+    assert lote_info == reference_lote_info(SAMPLE)
+
+
+def test_matches_reference_on_random_fragments():
+    rng = random.Random(12)
+    pieces = ['-', '1', '23', '0052246201', '-LOTE:', 'LOTE', ':', ' ', ', ', ',', '.', '300',
+              'SAC', 'KG', 'TAMX', 'x', '\n', '-100141432-LOTE: ', '-8SAC', '1,300']
+    for _ in range(5000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 30)))
+        assert parse_lote_info(text) == reference_lote_info(text), text
+
+
+@pytest.mark.parametrize('tail', [
+    '1' * 200_000,                  # one long digit run without '-'
+    '1-' + '1,' * 100_000,          # long quantity without a unit
+    '-1' * 100_000,                 # many product-like markers
+])
+def test_long_inf_cpl_is_linear(tail):
+    # The quadratic pattern took seconds on 20k digits; 200k must stay well under one
+    text = '-100141432-LOTE: ' + tail
+    start = time.perf_counter()
+    parse_lote_info(text)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_lot_number_is_the_whole_digit_run():
+    assert parse_lote_info('-1-LOTE: 123456-7SAC') == {'1': [{'lote': '123456', 'quantidade': 7.0, 'unidade': 'SAC'}]}
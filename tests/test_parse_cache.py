@@ -0,0 +1,83 @@
+"""
+Disk tier of the parsed-rows cache (nfe_parse_cache).
+"""
+import os
+import pickle
+
+import pytest
+
+import nfe_parse_cache
+from nfe_model import MISSING, InvoiceTable
+from nfe_profiles import get_profile
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    previous = nfe_parse_cache.CACHE_DIR
+    nfe_parse_cache.clear_cache()
+    nfe_parse_cache.configure(directory=str(tmp_path))
+    yield tmp_path
+    nfe_parse_cache.configure(directory=previous or '')
+    nfe_parse_cache.clear_cache()
+
+
+def _same(table, expected):
+    assert type(table) is InvoiceTable
+    assert (table.header_columns, table.item_columns, table.columns) == \
+        (expected.header_columns, expected.item_columns, expected.columns)
+    assert table.headers == expected.headers
+    assert table.items == expected.items
+    assert table.present_columns() == expected.present_columns()
+
+
+@pytest.mark.parametrize('cliente', ['Laborlog', 'Cargill'])
+def test_disk_entry_restores_table(cliente, payloads, cache_dir):
+    profile = get_profile(cliente)
+    for _, payload in payloads:
+        table = profile.parse(payload)
+        key = nfe_parse_cache.content_key(cliente, payload)
+        nfe_parse_cache.put(key, table)
+        nfe_parse_cache.clear_cache()
+
+        _same(nfe_parse_cache.get(key), table)
+        # Read back from disk into the memory tier
+        _same(nfe_parse_cache.get(key), table)
+
+
+def test_disk_entry_keeps_missing_values(cache_dir):
+    table = InvoiceTable(('nota',), ('codigo', 'valor', 'lote'), shared=('codigo',))
+    invoice = table.add_invoice({'nota': '1'})
+    table.add_item(invoice, {'codigo': '5102', 'valor': 1.5})
+    table.add_item(invoice, {'codigo': '5102', 'valor': None, 'lote': 'L1'})
+    nfe_parse_cache.put('chave', table)
+    nfe_parse_cache.clear_cache()
+
+    cached = nfe_parse_cache.get('chave')
+
+    _same(cached, table)
+    assert cached.items[0][3] is MISSING
+    # Shared codes are interned again
+    assert cached.items[0][1] is cached.items[1][1]
+
+
+def test_untrusted_disk_entry_is_a_miss(payloads, cache_dir):
+    profile = get_profile('Cargill')
+    _, payload = payloads[0]
+    key = nfe_parse_cache.content_key('Cargill', payload)
+    marker = cache_dir / 'executado'
+
+    class Payload:
+        # Would run on pickle.loads; the disk tier never unpickles
+        def __reduce__(self):
+            return (os.mkdir, (str(marker),))
+
+    path = cache_dir / (key + nfe_parse_cache.CACHE_SUFFIX)
+    for content in (pickle.dumps(Payload()), b'{"version": 0}', b'{"version": %d, "headers": 1}'
+                    % nfe_parse_cache.CACHE_VERSION):
+        path.write_bytes(content)
+        assert nfe_parse_cache.get(key) is None
+
+    assert not marker.exists()
+    nfe_parse_cache.put(key, profile.parse(payload))
+    nfe_parse_cache.clear_cache()
+    _same(nfe_parse_cache.get(key), profile.parse(payload))
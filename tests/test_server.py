@@ -0,0 +1,199 @@
+"""
+Local HTTP conversion service (nfe_server), served on 127.0.0.1.
+"""
+import asyncio
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+import nfe_cli
+import nfe_server
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, payload in files:
+            archive.writestr(name, payload)
+    return buffer.getvalue()
+
+
+def _serve(scenario, **options):
+    # Runs scenario(port) against a ConversionServer on an ephemeral port
+    async def main():
+        server = nfe_server.ConversionServer(workers=1, **options)
+        tcp_server = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        async with tcp_server:
+            return await scenario(tcp_server.sockets[0].getsockname()[1])
+    return asyncio.run(main())
+
+
+class Response:
+    def __init__(self, raw):
+        head, _, rest = raw.partition(b'\r\n\r\n')
+        status_line, *lines = head.decode('latin-1').split('\r\n')
+        self.status = int(status_line.split(' ')[1])
+        self.headers = {}
+        for line in lines:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        self.chunks = []
+        # complete: the body ended as announced (terminal chunk, or Content-Length)
+        if self.headers.get('transfer-encoding') == 'chunked':
+            self.complete = False
+            while rest:
+                size, _, rest = rest.partition(b'\r\n')
+                size = int(size, 16)
+                if size == 0:
+                    self.complete = True
+                    break
+                self.chunks.append(rest[:size])
+                rest = rest[size + 2:]
+            self.body = b''.join(self.chunks)
+        else:
+            self.body = rest
+            self.complete = len(rest) == int(self.headers.get('content-length', len(rest)))
+
+
+async def _request(port, method, path, body=b'', length=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+    if method == 'POST':
+        head += f"Content-Length: {len(body) if length is None else length}\r\n"
+    writer.write(head.encode('latin-1') + b'\r\n' + body)
+    await writer.drain()
+    raw = b''
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            raw += data
+    except ConnectionResetError:
+        # Aborted by the server: keep what arrived before the reset
+        pass
+    writer.close()
+    return Response(raw)
+
+
+async def _health(port):
+    return json.loads((await _request(port, 'GET', '/saude')).body)
+
+
+def _cli_output(cliente, fixture_paths, tmp_path):
+    saida = tmp_path / f'cli_{cliente}.csv'
+    assert nfe_cli.main(['-c', cliente, '-o', str(saida), '-w', '1', *fixture_paths]) == 0
+    return saida.read_bytes()
+
+
+@pytest.mark.parametrize('cliente', ['Laborlog', 'Cargill'])
+def test_zip_upload_matches_cli(cliente, payloads, fixture_paths, tmp_path, monkeypatch):
+    # Small blocks, so the response is sent in several chunks
+    monkeypatch.setattr(nfe_server, 'ROWS_PER_CHUNK', 2)
+    response = _serve(lambda port: _request(port, 'POST', f'/converter/{cliente.lower()}', _zip(payloads)))
+
+    assert response.status == 200
+    assert response.complete
+    assert len(response.chunks) > 2
+    assert response.body == _cli_output(cliente, fixture_paths, tmp_path)
+    assert response.headers['x-nfe-arquivos'] == str(len(payloads))
+    assert response.headers['x-nfe-falhas'] == '0'
+
+
+def test_broken_xml_is_reported(payloads):
+    broken = ('quebrada.xml', payloads[0][1][:len(payloads[0][1]) // 2])
+
+    async def scenario(port):
+        return (await _request(port, 'POST', '/converter/Cargill', _zip([*payloads, broken])),
+                await _request(port, 'POST', '/converter/Cargill', broken[1]))
+    batch, alone = _serve(scenario)
+
+    assert batch.status == 200 and batch.complete
+    assert batch.headers['x-nfe-arquivos'] == str(len(payloads) + 1)
+    assert batch.headers['x-nfe-falhas'] == '1'
+    assert alone.status == 422
+    assert alone.headers['x-nfe-falhas'] == '1'
+
+
+def test_error_while_streaming_aborts_response(payloads, monkeypatch, capsys):
+    iter_csv = nfe_server.iter_csv
+
+    def failing_csv(df):
+        chunks = iter_csv(df)
+        yield next(chunks)
+        yield next(chunks)
+        raise ValueError("serialization failed")
+
+    monkeypatch.setattr(nfe_server, 'ROWS_PER_CHUNK', 2)
+    monkeypatch.setattr(nfe_server, 'iter_csv', failing_csv)
+    response = _serve(lambda port: _request(port, 'POST', '/converter/Cargill', _zip(payloads)))
+
+    # The 200 was already sent: no terminal chunk, so the client sees a broken transfer
+    assert response.status == 200
+    assert response.chunks
+    assert not response.complete
+    assert 'serialization failed' in capsys.readouterr().err
+
+
+def test_zip_bomb_is_rejected():
+    bomb = _zip([('bomba.xml', b'\0' * (8 * 1024 * 1024))])
+    response = _serve(lambda port: _request(port, 'POST', '/converter/Cargill', bomb))
+
+    assert len(bomb) < 64 * 1024
+    assert response.status == 413
+
+
+def test_oversized_archive_is_rejected(payloads):
+    archive = _zip(payloads)
+    unpacked = sum(len(payload) for _, payload in payloads)
+
+    async def scenario(port):
+        return (await _request(port, 'POST', '/converter/Cargill', archive),
+                await _request(port, 'POST', '/converter/Cargill', b'', length=unpacked + 1))
+    # The archive fits the limit, the XMLs in it do not
+    unpacked_too_big, body_too_big = _serve(scenario, max_body=unpacked - 1)
+
+    assert len(archive) < unpacked - 1
+    assert unpacked_too_big.status == 413
+    assert body_too_big.status == 413
+
+
+def test_busy_server_queues_then_rejects(payloads, monkeypatch):
+    release = threading.Event()
+    convert_payloads = nfe_server.convert_payloads
+
+    def held_convert(*args):
+        release.wait(10)
+        return convert_payloads(*args)
+
+    monkeypatch.setattr(nfe_server, 'convert_payloads', held_convert)
+    body = _zip(payloads)
+
+    async def wait_for(port, **expected):
+        for _ in range(200):
+            status = await _health(port)
+            if all(status[name] == value for name, value in expected.items()):
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"server state never reached {expected}: {status}")
+
+    async def scenario(port):
+        try:
+            first = asyncio.ensure_future(_request(port, 'POST', '/converter/Cargill', body))
+            await wait_for(port, ativos=1)
+            second = asyncio.ensure_future(_request(port, 'POST', '/converter/Cargill', body))
+            await wait_for(port, ativos=1, na_fila=1)
+            rejected = await _request(port, 'POST', '/converter/Cargill', body)
+        finally:
+            release.set()
+        return rejected, await first, await second
+
+    rejected, first, second = _serve(scenario, concurrency=1, queue_size=1)
+
+    assert rejected.status == 503
+    assert rejected.headers['retry-after'] == '1'
+    assert first.status == second.status == 200
+    assert first.body == second.body
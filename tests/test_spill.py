@@ -0,0 +1,136 @@
+"""
+Limited-memory exports (nfe_spill.SpillStore) against the normal mode.
+"""
+import io
+import os
+import re
+
+import openpyxl
+import pytest
+
+import nfe_parse_cache
+from nfe_export import write_xlsx, write_xlsx_frames
+from nfe_profiles import get_profile
+from nfe_spill import SpillStore
+
+
+def _catalog(profile, tables):
+    if profile.catalog is None:
+        return None
+    # Every other EAN of the fixtures has a code, so both PROCV outcomes occur
+    eans = sorted({row['item_ean'] for table in tables for row in table})
+    return {ean: f"LAB{index:05d}" for index, ean in enumerate(eans[::2])}
+
+
+def _convert(profile, payloads):
+    tables = [profile.parse(payload) for _, payload in payloads]
+    whole = profile.new_table()
+    for table in tables:
+        whole.extend(table)
+    return tables, whole
+
+
+def _without_pis(payloads):
+    # The last file leaves the PIS columns empty, so its chunk alone has
+    # fewer columns with values than the whole conversion
+    *others, (name, payload) = payloads
+    return [*others, (name, re.sub(rb'<PIS>.*?</PIS>', b'', payload, flags=re.S))]
+
+
+def _spilled_frames(profile, store, catalog):
+    # The chunk loop of XMLtoEXCEL.export_spilled
+    columns = profile.output_columns(store.present_columns())
+    for table in store.chunks():
+        df, _ = profile.build_table(table, catalog)
+        if df is not None:
+            yield df.reindex(columns=columns)
+
+
+def _sheet_values(target):
+    workbook = openpyxl.load_workbook(target, read_only=True)
+    try:
+        return [row for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+@pytest.fixture(params=['Laborlog', 'Cargill'])
+def profile(request):
+    return get_profile(request.param)
+
+
+def test_every_file_is_spilled(profile, payloads, tmp_path):
+    tables, whole = _convert(profile, payloads)
+
+    # A one-byte budget spills the buffer on every add
+    with SpillStore(profile.new_table, budget_bytes=1, directory=tmp_path) as store:
+        for table in tables:
+            store.add(table)
+
+        assert store.spilled == len(tables)
+        assert len(store) == len(whole)
+        assert [row for chunk in store.chunks() for row in chunk] == list(whole)
+        assert store.present_columns() == whole.present_columns()
+        assert list(store.head(5)) == list(whole.head(5))
+
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('variant', [list, _without_pis])
+def test_spilled_csv_matches_normal_mode(profile, payloads, variant, tmp_path):
+    tables, whole = _convert(profile, variant(payloads))
+    catalog = _catalog(profile, tables)
+    expected, _ = profile.build_table(whole, catalog)
+
+    with SpillStore(profile.new_table, budget_bytes=1, directory=tmp_path) as store:
+        for table in tables:
+            store.add(table)
+        parts = [df.to_csv(index=False, sep=';', header=index == 0)
+                 for index, df in enumerate(_spilled_frames(profile, store, catalog))]
+
+    assert len(parts) == len(tables)
+    assert ''.join(parts) == expected.to_csv(index=False, sep=';')
+
+
+def test_spilled_xlsx_matches_normal_mode(payloads, tmp_path):
+    profile = get_profile('Cargill')
+    tables, whole = _convert(profile, _without_pis(payloads))
+    expected, _ = profile.build_table(whole, None)
+    normal = io.BytesIO()
+    write_xlsx(expected, normal)
+
+    spilled = tmp_path / profile.file_name('xlsx')
+    with SpillStore(profile.new_table, budget_bytes=1, directory=tmp_path) as store:
+        for table in tables:
+            store.add(table)
+        columns = profile.output_columns(store.present_columns())
+        write_xlsx_frames(_spilled_frames(profile, store, None), spilled, columns)
+
+    assert _sheet_values(spilled) == _sheet_values(normal)
+
+
+class _Upload:
+    # The part of streamlit's UploadedFile used by convert_uploads_spilling
+    def __init__(self, name, payload):
+        self.name = name
+        self._payload = payload
+
+    def getbuffer(self):
+        return memoryview(self._payload)
+
+
+def test_spilled_conversion_skips_parse_cache(profile, payloads, tmp_path, monkeypatch):
+    XMLtoEXCEL = pytest.importorskip('XMLtoEXCEL')
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(nfe_parse_cache, 'CACHE_DIR', str(cache_dir))
+    nfe_parse_cache.clear_cache()
+    _, whole = _convert(profile, payloads)
+
+    uploads = [_Upload(name, payload) for name, payload in payloads]
+    with SpillStore(profile.new_table, budget_bytes=1, directory=tmp_path) as store:
+        assert XMLtoEXCEL.convert_uploads_spilling(profile.name, uploads, 1, store)
+        assert [row for chunk in store.chunks() for row in chunk] == list(whole)
+
+    # Rows held by the cache would be outside the budget of the store
+    assert not nfe_parse_cache._cache
+    assert not cache_dir.exists()
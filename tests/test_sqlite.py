@@ -0,0 +1,125 @@
+"""
+SQLite sink of converted invoices (nfe_sqlite.InvoiceDatabase).
+"""
+import pytest
+
+import nfe_synthetic
+from nfe_profiles import get_profile
+from nfe_sqlite import InvoiceDatabase
+
+
+def _counts(database):
+    return {table: database.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('invoices', 'items', 'lots')}
+
+
+def _rows(database, table):
+    return database.connection.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall()
+
+
+@pytest.fixture
+def database(tmp_path):
+    with InvoiceDatabase(str(tmp_path / 'notas.sqlite')) as database:
+        yield database
+
+
+@pytest.mark.parametrize('cliente', ['Laborlog', 'Cargill'])
+def test_loading_again_replaces_invoices(cliente, payloads, database):
+    profile = get_profile(cliente)
+    tables = [(profile.parse(payload), name) for name, payload in payloads]
+
+    first = database.add(cliente, tables)
+    counts = _counts(database)
+    items, lots = _rows(database, 'items'), _rows(database, 'lots')
+    again = database.add(cliente, tables)
+
+    assert first == again
+    assert first['skipped'] == 0
+    assert counts == {'invoices': len(payloads), 'items': first['items'], 'lots': first['lots']}
+    assert _counts(database) == counts
+    assert (_rows(database, 'items'), _rows(database, 'lots')) == (items, lots)
+
+
+def _copies(profile):
+    # The access key depends only on the seed: two copies with different items
+    older = profile.parse(nfe_synthetic.generate_nfe(5, items=6).encode('utf-8'))
+    newer = profile.parse(nfe_synthetic.generate_nfe(5, items=3).encode('utf-8'))
+    return older, newer
+
+
+def _alone(cliente, table, source, tmp_path):
+    # Counts and rows of the table loaded by itself into a new database
+    with InvoiceDatabase(str(tmp_path / 'alone.sqlite')) as alone:
+        return alone.add(cliente, [(table, source)]), _rows(alone, 'items'), _rows(alone, 'lots')
+
+
+@pytest.mark.parametrize('cliente', ['Laborlog', 'Cargill'])
+def test_reloaded_invoice_drops_old_rows(cliente, database, tmp_path):
+    profile = get_profile(cliente)
+    older, newer = _copies(profile)
+
+    database.add(cliente, [(older, 'antiga.xml')])
+    database.add(cliente, [(newer, 'nova.xml')])
+
+    expected, items, lots = _alone(cliente, newer, 'nova.xml', tmp_path)
+    assert _counts(database) == {'invoices': 1, 'items': expected['items'], 'lots': expected['lots']}
+    assert (_rows(database, 'items'), _rows(database, 'lots')) == (items, lots)
+
+
+@pytest.mark.parametrize('cliente', ['Laborlog', 'Cargill'])
+@pytest.mark.parametrize('same_table', [False, True])
+def test_repeated_key_keeps_last_copy(cliente, same_table, database, tmp_path):
+    profile = get_profile(cliente)
+    older, newer = _copies(profile)
+    if same_table:
+        table = profile.new_table()
+        table.extend(older)
+        table.extend(newer)
+        batch = [(table, 'notas.xml')]
+    else:
+        batch = [(older, 'antiga.xml'), (newer, 'nova.xml')]
+
+    counts = database.add(cliente, batch)
+
+    expected, expected_items, expected_lots = _alone(cliente, newer, batch[-1][1], tmp_path)
+    assert counts == expected
+    assert expected['items'] == 3 and expected['lots']
+    assert _rows(database, 'items') == expected_items
+    assert _rows(database, 'lots') == expected_lots
+
+
+def test_extra_lots_follow_first_lot(payloads, database):
+    profile = get_profile('Cargill')
+    tables = [(profile.parse(payload), name) for name, payload in payloads]
+    # infCpl lots of each item, in row order: the first on the item row, the rest on '_lote_extra' rows
+    expected = {}
+    for table, name in tables:
+        for row in table:
+            number = int(row['item_nfe'].split('_')[0])
+            if row.get('infadic_lote'):
+                expected.setdefault((name, number), []).append(row['infadic_lote'])
+
+    counts = database.add('Cargill', tables)
+
+    lots = {}
+    for source, number, position, lot in database.connection.execute(
+            "SELECT source, item_number, position, lot FROM lots JOIN invoices USING (access_key) "
+            "ORDER BY access_key, item_number, position"):
+        lots.setdefault((source, number), []).append((position, lot))
+    assert any(len(values) > 1 for values in expected.values())
+    assert lots == {item: list(enumerate(values, 1)) for item, values in expected.items()}
+    # Extra lot rows add lots, not items
+    assert counts['items'] == sum(1 for table, _ in tables for row in table
+                                  if not row['item_nfe'].endswith('_lote_extra'))
+
+
+def test_invoice_without_access_key_is_skipped(payloads, database):
+    profile = get_profile('Cargill')
+    (name, payload), *others = payloads
+    without_key = profile.parse(payload.replace(b' Id="NFe', b' Ref="NFe', 1))
+
+    counts = database.add('Cargill', [(without_key, name), *((profile.parse(p), n) for n, p in others)])
+
+    assert counts['skipped'] == 1
+    assert counts['invoices'] == len(others)
+    assert _counts(database)['invoices'] == len(others)
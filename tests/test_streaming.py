@@ -0,0 +1,83 @@
+"""
+Streaming (iterparse) and tree parsing give the same rows, on every XML
+backend of nfe_xml.
+"""
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import nfe_xml
+import xmlCARGILL
+import xmlLABORLOG
+
+PARSERS = {
+    'Laborlog': xmlLABORLOG.parse_nfe_table,
+    'Cargill': xmlCARGILL.parse_nfe_tabela,
+}
+
+
+@pytest.fixture(autouse=True, params=nfe_xml.BACKENDS)
+def backend(request):
+    if request.param not in nfe_xml.available_backends():
+        pytest.skip(f"{request.param} is not installed")
+    previous = nfe_xml.backend()
+    nfe_xml.set_backend(request.param)
+    yield request.param
+    nfe_xml.set_backend(previous)
+
+
+@pytest.mark.parametrize('cliente', PARSERS)
+def test_backend_matches_etree(cliente, payloads, backend):
+    parse = PARSERS[cliente]
+    for name, payload in payloads:
+        for streaming in (False, True):
+            rows = list(parse(payload, streaming=streaming))
+            nfe_xml.set_backend('etree')
+            try:
+                expected = list(parse(payload, streaming=False))
+            finally:
+                nfe_xml.set_backend(backend)
+
+            assert rows == expected, (name, streaming)
+
+
+@pytest.mark.parametrize('cliente', PARSERS)
+def test_streaming_matches_tree(cliente, payloads):
+    parse = PARSERS[cliente]
+    for name, payload in payloads:
+        tree = parse(payload, streaming=False)
+        streamed = parse(payload, streaming=True)
+
+        assert list(streamed) == list(tree), name
+        assert streamed.headers == tree.headers, name
+
+
+def test_streaming_keeps_extra_lot_rows(payloads):
+    # Lots past the first of a product become extra rows at the end of the invoice
+    def extra_rows(streaming):
+        return [row for _, payload in payloads
+                for row in xmlCARGILL.parse_nfe_tabela(payload, streaming=streaming)
+                if row['item_nfe'].endswith('_lote_extra')]
+
+    extra = extra_rows(streaming=True)
+    assert extra
+    assert extra == extra_rows(streaming=False)
+
+
+@pytest.mark.parametrize('cut', ['middle', 'after_items'])
+def test_streaming_rolls_back_malformed_document(payloads, cut):
+    (_, first), (_, second), *_ = payloads
+    end = second.rfind(b'</det>') + len(b'</det>')
+    broken = second[:end // 2] if cut == 'middle' else second[:end]
+
+    table = xmlCARGILL.parse_nfe_tabela(first, streaming=True)
+    before = (list(table), list(table.headers))
+    with pytest.raises(ET.ParseError):
+        xmlCARGILL.parse_nfe_tabela(broken, table, streaming=True)
+
+    assert (list(table), list(table.headers)) == before
+    # The table is still usable, with the same content as a clean run
+    xmlCARGILL.parse_nfe_tabela(second, table, streaming=True)
+    clean = xmlCARGILL.parse_nfe_tabela(first, streaming=False)
+    xmlCARGILL.parse_nfe_tabela(second, clean, streaming=False)
+    assert list(table) == list(clean)
@@ -0,0 +1,112 @@
+"""
+Cargill tax columns from every ICMS, IPI, PIS and COFINS group (nfe_taxes).
+"""
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import nfe_synthetic
+import xmlCARGILL
+
+NS = '{%s}' % nfe_synthetic.NFE_NAMESPACE
+NO_TAXES = {'icms_groups': (), 'ipi_groups': (), 'pis_groups': (), 'cofins_groups': ()}
+TAX_COLUMNS = {
+    'ICMS': ('icms_origem', 'icms_cst', 'icms_desonerado', 'motivo_desoneracao'),
+    'IPI': ('ipi_cst',),
+    'PIS': ('pis_cst', 'pis_base_calculo', 'pis_aliquota', 'pis_valor'),
+    'COFINS': ('cofins_cst', 'cofins_base_calculo', 'cofins_aliquota', 'cofins_valor'),
+}
+
+# Rows of generate_nfe(21, items=3, icms_groups=('ICMS40',), ipi_groups=('IPINT',))
+# as parsed before the dispatch table (ICMS40, IPINT, PISOutr and COFINSOutr only)
+BASELINE = [
+    {'icms_origem': '5', 'icms_cst': '40', 'icms_desonerado': 73.32, 'motivo_desoneracao': '9',
+     'ipi_cst': '53', 'pis_cst': '99', 'pis_base_calculo': 70429.08, 'pis_aliquota': 0.65,
+     'pis_valor': 457.79, 'cofins_cst': '99', 'cofins_base_calculo': 70429.08,
+     'cofins_aliquota': 3.0, 'cofins_valor': 2112.87},
+    {'icms_origem': '5', 'icms_cst': '50', 'icms_desonerado': 76.4, 'motivo_desoneracao': '9',
+     'ipi_cst': '53', 'pis_cst': '49', 'pis_base_calculo': 180616.63, 'pis_aliquota': 0.65,
+     'pis_valor': 1174.01, 'cofins_cst': '49', 'cofins_base_calculo': 180616.63,
+     'cofins_aliquota': 3.0, 'cofins_valor': 5418.5},
+    {'icms_origem': '5', 'icms_cst': '40', 'icms_desonerado': 14.39, 'motivo_desoneracao': '9',
+     'ipi_cst': '53', 'pis_cst': '49', 'pis_base_calculo': 125774.09, 'pis_aliquota': 0.65,
+     'pis_valor': 817.53, 'cofins_cst': '49', 'cofins_base_calculo': 125774.09,
+     'cofins_aliquota': 3.0, 'cofins_valor': 3773.22},
+]
+
+
+def _parse(**groups):
+    # No lots in the infCpl: one row per item
+    document = nfe_synthetic.generate_nfe(3, items=4, infcpl_lots=0, **dict(NO_TAXES, **groups))
+    rows = list(xmlCARGILL.ler_xml(document.encode('utf-8')))
+    root = ET.fromstring(document)
+    # The single group of each tax, per item: {tax: {field: text}}
+    items = [{tax.tag[len(NS):]: {field.tag[len(NS):]: field.text for field in tax[-1]}
+              for tax in det.find(NS + 'imposto') if tax.tag != NS + 'vTotTrib'}
+             for det in root.iter(NS + 'det')]
+    assert len(rows) == len(items)
+    return rows, items
+
+
+def _taxes(row, tax):
+    # Columns of the tax the row has a value for
+    return {column: row[column] for column in TAX_COLUMNS[tax] if column in row}
+
+
+def _number(fields, name):
+    return float(fields[name]) if name in fields else 0.0
+
+
+@pytest.mark.parametrize('group', nfe_synthetic.ICMS_VARIANTS)
+def test_icms_group(group):
+    rows, items = _parse(icms_groups=(group,))
+
+    for row, taxes in zip(rows, items):
+        fields = taxes['ICMS']
+        if group.startswith('ICMSSN'):
+            # Simples Nacional: the CSOSN goes to the CST column
+            expected = {'icms_origem': fields['orig'], 'icms_cst': fields['CSOSN']}
+        else:
+            expected = {'icms_origem': fields['orig'], 'icms_cst': fields['CST'],
+                        'icms_desonerado': _number(fields, 'vICMSDeson'),
+                        'motivo_desoneracao': fields.get('motDesICMS', '')}
+        assert _taxes(row, 'ICMS') == expected
+        for tax in ('IPI', 'PIS', 'COFINS'):
+            assert _taxes(row, tax) == {}
+
+
+@pytest.mark.parametrize('group', nfe_synthetic.IPI_GROUPS)
+def test_ipi_group(group):
+    rows, items = _parse(ipi_groups=(group,))
+
+    for row, taxes in zip(rows, items):
+        assert _taxes(row, 'IPI') == {'ipi_cst': taxes['IPI']['CST']}
+        for tax in ('PIS', 'COFINS'):
+            assert _taxes(row, tax) == {}
+
+
+@pytest.mark.parametrize('tax, group', [('PIS', group) for group in nfe_synthetic.PIS_VARIANTS]
+                         + [('COFINS', group) for group in nfe_synthetic.COFINS_VARIANTS])
+def test_pis_cofins_group(tax, group):
+    rows, items = _parse(**{f'{tax.lower()}_groups': (group,)})
+    prefix = tax.lower() + '_'
+
+    for row, taxes in zip(rows, items):
+        fields = taxes[tax]
+        # NT groups only have the CST: the values keep their 0.0 default
+        assert _taxes(row, tax) == {
+            f'{prefix}cst': fields['CST'],
+            f'{prefix}base_calculo': _number(fields, 'vBC'),
+            f'{prefix}aliquota': _number(fields, f'p{tax}'),
+            f'{prefix}valor': _number(fields, f'v{tax}'),
+        }
+        other = 'COFINS' if tax == 'PIS' else 'PIS'
+        assert _taxes(row, 'IPI') == _taxes(row, other) == {}
+
+
+def test_icms40_and_ipint_match_baseline():
+    document = nfe_synthetic.generate_nfe(21, items=3, icms_groups=('ICMS40',), ipi_groups=('IPINT',))
+    rows = list(xmlCARGILL.ler_xml(document.encode('utf-8')))
+
+    columns = BASELINE[0].keys()
+    assert [{column: row[column] for column in columns} for row in rows] == BASELINE
@@ -0,0 +1,137 @@
+"""
+Watch-folder checkpoint and crash recovery (nfe_watch).
+"""
+import glob
+import io
+import os
+import shutil
+import time
+
+import pytest
+
+import nfe_watch
+
+
+class Crash(BaseException):
+    # Not an Exception: like a killed process, watch() does not catch it
+    pass
+
+
+@pytest.fixture(autouse=True)
+def one_file_per_batch(monkeypatch):
+    monkeypatch.setattr(nfe_watch, 'ARQUIVOS_POR_LOTE', 1)
+
+
+def _inbox(fixture_paths, folder):
+    entrada = folder / 'entrada'
+    entrada.mkdir()
+    past = time.time() - 60
+    for path in fixture_paths:
+        destino = entrada / os.path.basename(path)
+        shutil.copy(path, destino)
+        # Old enough to count as fully copied
+        os.utime(destino, (past, past))
+    return entrada
+
+
+def _run(entrada, saida, formato='csv'):
+    args = nfe_watch.build_parser().parse_args(
+        [str(entrada), '-c', 'Cargill', '-o', str(saida), '-f', formato, '-w', '1', '--uma-vez'])
+    nfe_watch.watch(args, log=io.StringIO())
+
+
+def _outputs(saida):
+    # {path relative to saida: bytes} of the output files
+    outputs = {}
+    for path in sorted(glob.glob(os.path.join(saida, '**', 'nfe_*'), recursive=True)):
+        with open(path, 'rb') as f:
+            outputs[os.path.relpath(path, saida)] = f.read()
+    return outputs
+
+
+@pytest.fixture
+def clean_outputs(fixture_paths, tmp_path_factory):
+    def run(formato):
+        folder = tmp_path_factory.mktemp('clean')
+        _run(_inbox(fixture_paths, folder), folder / 'saida', formato)
+        return _outputs(folder / 'saida')
+    return run
+
+
+def test_clean_run_converts_every_file(fixture_paths, tmp_path):
+    entrada = _inbox(fixture_paths, tmp_path)
+    _run(entrada, tmp_path / 'saida')
+
+    assert not glob.glob(str(entrada / '*.xml'))
+    assert len(glob.glob(str(entrada / 'processados' / '*.xml'))) == len(fixture_paths)
+    assert nfe_watch.Checkpoint(str(tmp_path / 'saida' / nfe_watch.CHECKPOINT_NAME)).next_batch == 4
+
+
+def test_crash_while_appending_csv_is_undone(fixture_paths, tmp_path, monkeypatch, clean_outputs):
+    entrada = _inbox(fixture_paths, tmp_path)
+    saida = tmp_path / 'saida'
+    append_output = nfe_watch.append_output
+    calls = []
+
+    def crash_on_second_batch(df, cliente, path, formato):
+        calls.append(path)
+        if len(calls) == 2:
+            # Half of the batch reached the file when the process died
+            with open(path, 'a', encoding='utf-8', newline='') as f:
+                f.write(df.to_csv(index=False, sep=';', header=False)[:50])
+            raise Crash()
+        return append_output(df, cliente, path, formato)
+
+    monkeypatch.setattr(nfe_watch, 'append_output', crash_on_second_batch)
+    with pytest.raises(Crash):
+        _run(entrada, saida)
+    monkeypatch.setattr(nfe_watch, 'append_output', append_output)
+
+    _run(entrada, saida)
+
+    assert _outputs(saida) == clean_outputs('csv')
+    assert len(glob.glob(str(entrada / 'processados' / '*.xml'))) == len(fixture_paths)
+
+
+def test_crash_before_moving_inputs_does_not_duplicate_rows(fixture_paths, tmp_path, monkeypatch, clean_outputs):
+    entrada = _inbox(fixture_paths, tmp_path)
+    saida = tmp_path / 'saida'
+    move_to = nfe_watch.move_to
+
+    def crash(path, pasta):
+        # The batch is written and registered, the XML is still in the inbox
+        raise Crash()
+
+    monkeypatch.setattr(nfe_watch, 'move_to', crash)
+    with pytest.raises(Crash):
+        _run(entrada, saida)
+    monkeypatch.setattr(nfe_watch, 'move_to', move_to)
+    assert len(glob.glob(str(entrada / '*.xml'))) == len(fixture_paths)
+
+    _run(entrada, saida)
+
+    assert _outputs(saida) == clean_outputs('csv')
+    assert not glob.glob(str(entrada / '*.xml'))
+
+
+def test_crash_before_renaming_batch_file_is_completed(fixture_paths, tmp_path, monkeypatch, clean_outputs):
+    entrada = _inbox(fixture_paths, tmp_path)
+    saida = tmp_path / 'saida'
+    replace = os.replace
+
+    def crash_on_batch_file(src, dst):
+        if src.endswith(nfe_watch.TEMP_SUFFIX):
+            raise Crash()
+        replace(src, dst)
+
+    monkeypatch.setattr(nfe_watch.os, 'replace', crash_on_batch_file)
+    with pytest.raises(Crash):
+        _run(entrada, saida, 'xlsx')
+    monkeypatch.setattr(nfe_watch.os, 'replace', replace)
+    assert glob.glob(str(saida / '*' / ('*' + nfe_watch.TEMP_SUFFIX)))
+
+    _run(entrada, saida, 'xlsx')
+
+    outputs = _outputs(saida)
+    assert sorted(outputs) == sorted(clean_outputs('xlsx'))
+    assert not glob.glob(str(saida / '**' / ('*' + nfe_watch.TEMP_SUFFIX)), recursive=True)
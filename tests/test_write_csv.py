@@ -0,0 +1,59 @@
+"""
+Chunked Laborlog CSV export (xmlLABORLOG.write_csv).
+"""
+import io
+
+import xmlLABORLOG
+
+
+def _tables(payloads):
+    return [xmlLABORLOG.parse_nfe_table(payload) for _, payload in payloads]
+
+
+def _catalog(tables):
+    # Every other EAN of the fixtures has a code, so both PROCV outcomes occur
+    eans = sorted({row['item_ean'] for table in tables for row in table})
+    return {ean: f"LAB{index:05d}" for index, ean in enumerate(eans[::2])}
+
+
+def _whole(tables):
+    whole = xmlLABORLOG.new_table()
+    for table in tables:
+        whole.extend(table)
+    return whole
+
+
+def test_chunked_csv_is_byte_identical(payloads):
+    tables = _tables(payloads)
+    catalog = _catalog(tables)
+    expected = xmlLABORLOG.build_dataframe(_whole(tables), catalog).to_csv(index=False, sep=';')
+
+    out = io.StringIO()
+    rows = xmlLABORLOG.write_csv(tables, out, catalog)
+
+    assert out.getvalue() == expected
+    assert rows == sum(len(table) for table in tables)
+
+
+def test_chunked_csv_file_matches_download(payloads, tmp_path):
+    tables = _tables(payloads)
+    catalog = _catalog(tables)
+    expected = xmlLABORLOG.build_dataframe(_whole(tables), catalog).to_csv(index=False, sep=';')
+
+    path = tmp_path / 'nfe_data_laborlog.csv'
+    with open(path, 'w', encoding='utf-8-sig', newline='') as out:
+        # Empty chunks are skipped without writing a second header
+        xmlLABORLOG.write_csv([xmlLABORLOG.new_table(), *tables], out, catalog)
+
+    assert path.read_bytes() == expected.encode('utf-8-sig')
+
+
+def test_chunked_report_matches_whole_batch(payloads):
+    tables = _tables(payloads)
+    catalog = _catalog(tables)
+    _, expected = xmlLABORLOG.build_dataframe(_whole(tables), catalog, report=True)
+
+    _, report = xmlLABORLOG.write_csv(tables, io.StringIO(), catalog, report=True)
+
+    assert not expected.empty
+    assert report.equals(expected)
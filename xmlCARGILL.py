@@ -1,166 +1,377 @@
 import xml.etree.ElementTree as ET
-import pandas as pd
+import io
 import re
-from datetime import datetime
+import sys
+import nfe_taxes
+import nfe_xml
+from nfe_export import typed_columns, write_xlsx
+from nfe_fields import compile_fields, extract_fields, nfe_tag, plan_columns
+from nfe_lazy import lazy_import
+from nfe_metrics import stage
+from nfe_model import InvoiceTable
+from nfe_profiles import ClientProfile
+
+# O pandas só é importado quando um DataFrame é montado (não no parse)
+pd = lazy_import('pandas')
+
+# Campos por seção: (coluna, caminho relativo, tipo, padrão)
+# As colunas de uma seção só entram na linha quando a seção existe no XML
+CAMPOS_IDE = [
+    ('numero_nfe', 'nNF', str, ''),
+    ('serie', 'serie', str, ''),
+    ('data_emissao', 'dhEmi', str, ''),
+    ('cfop_geral', 'natOp', str, ''),
+]
+
+CAMPOS_EMIT = [
+    ('emit_cnpj', 'CNPJ', str, ''),
+    ('emit_nome', 'xNome', str, ''),
+]
+
+CAMPOS_DEST = [
+    ('dest_cnpj', 'CNPJ', str, ''),
+    ('dest_nome', 'xNome', str, ''),
+]
+
+CAMPOS_TOTAL = [
+    ('valor_total_nfe', 'vNF', float, 0.0),
+    ('icms_desonerado_total', 'vICMSDeson', float, 0.0),
+]
+
+CAMPOS_PROD = [
+    ('codigo_produto', 'cProd', str, ''),
+    ('descricao_produto', 'xProd', str, ''),
+    ('ncm', 'NCM', str, ''),
+    ('cfop', 'CFOP', str, ''),
+    ('unidade_comercial', 'uCom', str, ''),
+    ('quantidade_comercial', 'qCom', float, 0.0),
+    ('valor_unitario_comercial', 'vUnCom', float, 0.0),
+    ('valor_produto', 'vProd', float, 0.0),
+    ('pedido_compra', 'xPed', str, ''),
+    ('item_pedido', 'nItemPed', str, ''),
+    # Campos CEST e FCI (podem não existir)
+    ('cest', 'CEST', str, ''),
+    ('fci', 'nFCI', str, ''),
+]
+
+CAMPOS_ICMS = [
+    ('icms_origem', 'orig', str, ''),
+    ('icms_cst', 'CST', str, ''),
+    ('icms_desonerado', 'vICMSDeson', float, 0.0),
+    ('motivo_desoneracao', 'motDesICMS', str, ''),
+]
+
+# Simples Nacional: o CSOSN ocupa a coluna do CST
+CAMPOS_ICMSSN = [
+    ('icms_origem', 'orig', str, ''),
+    ('icms_cst', 'CSOSN', str, ''),
+]
+
+CAMPOS_IPI = [
+    ('ipi_cst', 'CST', str, ''),
+]
+
+CAMPOS_PIS = [
+    ('pis_cst', 'CST', str, ''),
+    ('pis_base_calculo', 'vBC', float, 0.0),
+    ('pis_aliquota', 'pPIS', float, 0.0),
+    ('pis_valor', 'vPIS', float, 0.0),
+]
+
+CAMPOS_COFINS = [
+    ('cofins_cst', 'CST', str, ''),
+    ('cofins_base_calculo', 'vBC', float, 0.0),
+    ('cofins_aliquota', 'pCOFINS', float, 0.0),
+    ('cofins_valor', 'vCOFINS', float, 0.0),
+]
+
+# Ordem das colunas na saída (incluindo as colunas de infAdic)
+COLUNAS_ORDENADAS = [
+    'numero_nfe', 'serie', 'data_emissao', 'emit_cnpj', 'emit_nome',
+    'dest_cnpj', 'dest_nome', 'valor_total_nfe', 'icms_desonerado_total',
+    'item_nfe', 'codigo_produto', 'descricao_produto', 'ncm', 'cest', 'fci',
+    'cfop', 'unidade_comercial', 'quantidade_comercial', 'valor_unitario_comercial',
+    'valor_produto', 'pedido_compra', 'item_pedido',
+    'infadic_produto', 'infadic_lote', 'infadic_qtd', 'infadic_unidade',
+    'icms_origem', 'icms_cst', 'icms_desonerado', 'motivo_desoneracao',
+    'ipi_cst', 'pis_cst', 'pis_base_calculo', 'pis_aliquota', 'pis_valor',
+    'cofins_cst', 'cofins_base_calculo', 'cofins_aliquota', 'cofins_valor'
+]
+
+# Colunas numéricas (campos float dos specs + quantidade do lote) e colunas
+# de poucos valores, codificadas como dicionário no Parquet
+COLUNAS_NUMERICAS = [
+    coluna
+    for campos in (CAMPOS_TOTAL, CAMPOS_PROD, CAMPOS_ICMS, CAMPOS_IPI, CAMPOS_PIS, CAMPOS_COFINS)
+    for coluna, _, tipo, _ in campos if tipo is float
+] + ['infadic_qtd']
+COLUNAS_DICIONARIO = [
+    'emit_cnpj', 'emit_nome', 'dest_cnpj', 'dest_nome', 'cfop', 'ncm',
+    'unidade_comercial', 'infadic_unidade', 'icms_origem', 'icms_cst',
+    'motivo_desoneracao', 'ipi_cst', 'pis_cst', 'cofins_cst',
+]
+
+# Planos de extração compilados uma única vez: (caminho da seção, plano)
+PLANOS_GERAIS = [
+    (nfe_tag('ide'), compile_fields(CAMPOS_IDE)),
+    (nfe_tag('emit'), compile_fields(CAMPOS_EMIT)),
+    (nfe_tag('dest'), compile_fields(CAMPOS_DEST)),
+    (nfe_tag('total/ICMSTot'), compile_fields(CAMPOS_TOTAL)),
+]
+# Grupos de imposto: {grupo: campos} e a tabela de despacho do nfe_taxes.extract_taxes
+CAMPOS_IMPOSTOS = {
+    **{grupo: CAMPOS_ICMS for grupo in nfe_taxes.ICMS_GROUPS},
+    **{grupo: CAMPOS_ICMSSN for grupo in nfe_taxes.ICMSSN_GROUPS},
+    **{grupo: CAMPOS_IPI for grupo in nfe_taxes.IPI_GROUPS},
+    **{grupo: CAMPOS_PIS for grupo in nfe_taxes.PIS_GROUPS},
+    **{grupo: CAMPOS_COFINS for grupo in nfe_taxes.COFINS_GROUPS},
+}
+TABELA_IMPOSTOS = nfe_taxes.compile_tax_table(CAMPOS_IMPOSTOS)
+# Lotes no infCpl: "-CODIGO-LOTE:" abre o produto e cada "LOTE-QUANTIDADEUNIDADE" é um lote
+# O número do lote só começa no início de uma sequência de dígitos: sem o
+# (?<!\d), uma sequência longa sem "-" seria tentada a partir de cada dígito
+# (tempo quadrático no tamanho do infCpl); o resultado é o mesmo
+RE_PRODUTO_LOTE = re.compile(r'-(\d+)-LOTE:')
+RE_LOTES = re.compile(r'-(\d+)-LOTE:|(?<!\d)(\d+)-([0-9,.]+)([A-Z]{2,3})')
+RE_MILHAR = re.compile(r'\d+[,.]\d{3}')
+RE_NAO_BRANCO = re.compile(r'\S')
+
+PLANO_PROD = compile_fields(CAMPOS_PROD)
+# Layout da InvoiceTable: dados gerais uma vez por nota, o resto por linha;
+# as colunas fora de COLUNAS_ORDENADAS (ex.: cfop_geral) vão para o fim
+COLUNAS_GERAIS = tuple(coluna for _, plano in PLANOS_GERAIS for coluna in plan_columns(plano))
+COLUNAS_ITEM = tuple(dict.fromkeys([
+    'item_nfe', *plan_columns(PLANO_PROD),
+    *(coluna for campos in (CAMPOS_ICMS, CAMPOS_ICMSSN, CAMPOS_IPI, CAMPOS_PIS, CAMPOS_COFINS)
+      for coluna, _, _, _ in campos),
+    'infadic_produto', 'infadic_lote', 'infadic_qtd', 'infadic_unidade',
+]))
+COLUNAS_TABELA = tuple(COLUNAS_ORDENADAS) + tuple(
+    coluna for coluna in COLUNAS_GERAIS + COLUNAS_ITEM if coluna not in COLUNAS_ORDENADAS)
+# Id do infNFe: guardado na tabela para o nfe_sqlite, fora das linhas exportadas
+COLUNA_CHAVE = 'chave_acesso'
+TAG_PROD = nfe_tag('prod')
+TAG_IMPOSTO = nfe_tag('imposto')
+TAG_INF_NFE = nfe_tag('infNFe')
+TAG_DET = nfe_tag('det')
+TAG_INF_CPL = nfe_tag('infAdic/infCpl')
+# Elementos tratados pelo iter_nfe_xml (além da raiz do documento)
+TAGS_STREAMING = [TAG_INF_NFE, TAG_DET]
+
+def _fonte_xml(xml_source):
+    """
+    Bytes (conteúdo do upload) são lidos direto da memória, sem decode nem
+    arquivo temporário; caminhos e objetos de arquivo seguem para o parser
+    """
+    if isinstance(xml_source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(xml_source)
+    return xml_source
 
-def parse_nfe_xml(xml_file_path):
+def parse_nfe_xml(xml_source, streaming=None):
     """
     Parse XML NFe e extrai dados dos produtos com informações de lote
+    xml_source pode ser o conteúdo em bytes, um objeto de arquivo ou um caminho
+    Com streaming=True o XML é lido de forma incremental (ver iter_nfe_xml);
+    com None, só a partir de nfe_xml.STREAMING_MIN_BYTES
+    Devolve uma lista de dicts (uma linha cada); ver parse_nfe_tabela
+    """
+    return list(parse_nfe_tabela(xml_source, streaming=streaming))
+
+def nova_tabela():
+    """
+    InvoiceTable vazia no layout de COLUNAS_TABELA
     """
+    return InvoiceTable(COLUNAS_GERAIS + (COLUNA_CHAVE,), COLUNAS_ITEM, COLUNAS_TABELA,
+                        shared=COLUNAS_DICIONARIO)
 
-    # Parse do XML
-    tree = ET.parse(xml_file_path)
-    root = tree.getroot()
+def parse_nfe_tabela(xml_source, tabela=None, streaming=None):
+    """
+    Igual ao parse_nfe_xml, mas acrescenta a nota a uma InvoiceTable (ver
+    nfe_model): os dados gerais são guardados uma vez e cada linha como tupla
+    Devolve a tabela
+    """
+    if tabela is None:
+        tabela = nova_tabela()
+    if streaming is None:
+        streaming = nfe_xml.prefer_streaming(xml_source, text_is_path=True)
+    if streaming:
+        _ler_streaming(xml_source, tabela)
+    else:
+        nfe_info, itens, lote_info = _ler_arvore(xml_source)
+        _montar_linhas(nfe_info, itens, lote_info, tabela)
+    return tabela
+
+def iter_nfe_xml(xml_source):
+    """
+    Versão incremental (iterparse) do parse_nfe_xml
+
+    Cada <det> vira uma linha da tabela assim que fecha e sua subárvore é
+    liberada, então a memória não cresce com a árvore do documento inteiro.
+    Os dados gerais (ide/emit/dest/total) são lidos uma única vez. Como o
+    total e o infAdic (lotes) vêm depois dos produtos no layout da NFe, eles
+    são aplicados às linhas já guardadas ao final do documento, com o mesmo
+    conteúdo do parse_nfe_xml.
+    """
+    yield from parse_nfe_tabela(xml_source, streaming=True)
 
-    # Namespaces do XML
-    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+def _ler_arvore(xml_source):
+    # Parse do XML (ElementTree ou lxml, ver nfe_xml)
+    root = nfe_xml.parse(_fonte_xml(xml_source))
 
     # Dados gerais da NFe
-    nfe_info = {}
-    ide = root.find('.//nfe:ide', ns)
-    emit = root.find('.//nfe:emit', ns)
-    dest = root.find('.//nfe:dest', ns)
-    total = root.find('.//nfe:total/nfe:ICMSTot', ns)
-    inf_adic = root.find('.//nfe:infAdic', ns)
-
-    if ide is not None:
-        nfe_info['numero_nfe'] = ide.find('nfe:nNF', ns).text if ide.find('nfe:nNF', ns) is not None else ''
-        nfe_info['serie'] = ide.find('nfe:serie', ns).text if ide.find('nfe:serie', ns) is not None else ''
-        nfe_info['data_emissao'] = ide.find('nfe:dhEmi', ns).text if ide.find('nfe:dhEmi', ns) is not None else ''
-        nfe_info['cfop_geral'] = ide.find('nfe:natOp', ns).text if ide.find('nfe:natOp', ns) is not None else ''
-
-    if emit is not None:
-        nfe_info['emit_cnpj'] = emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else ''
-        nfe_info['emit_nome'] = emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else ''
-
-    if dest is not None:
-        nfe_info['dest_cnpj'] = dest.find('nfe:CNPJ', ns).text if dest.find('nfe:CNPJ', ns) is not None else ''
-        nfe_info['dest_nome'] = dest.find('nfe:xNome', ns).text if dest.find('nfe:xNome', ns) is not None else ''
-
-    if total is not None:
-        nfe_info['valor_total_nfe'] = float(total.find('nfe:vNF', ns).text) if total.find('nfe:vNF', ns) is not None else 0.0
-        nfe_info['icms_desonerado_total'] = float(total.find('nfe:vICMSDeson', ns).text) if total.find('nfe:vICMSDeson', ns) is not None else 0.0
+    inf_nfe = root.find('.//' + TAG_INF_NFE)
+    if inf_nfe is None:
+        inf_nfe = root
+    nfe_info = _dados_gerais(inf_nfe)
 
     # Extrair informações de lote das informações adicionais
-    lote_info = {}
-    if inf_adic is not None:
-        inf_cpl = inf_adic.find('nfe:infCpl', ns)
-        if inf_cpl is not None:
-            lote_info = parse_lote_info(inf_cpl.text)
+    lote_info = _lotes_inf_adic(inf_nfe)
+
+    # Iterar sobre os produtos
+    itens = [_dados_produto(produto) for produto in root.iter(TAG_DET)]
 
-    # Lista para armazenar dados dos produtos
-    produtos_data = []
+    return nfe_info, itens, lote_info
 
-    # Primeiro, criar uma cópia dos lotes para cada produto para poder processar múltiplas linhas
-    lote_info_expandido = {}
-    for codigo, lotes in lote_info.items():
-        lote_info_expandido[codigo] = lotes.copy()
+def _ler_streaming(xml_source, tabela):
+    # Cada produto entra na tabela quando o <det> fecha; os dados gerais e os
+    # lotes do infCpl, que vêm depois dos produtos, são aplicados no final
+    root = inf_nfe = None
+    nota = tabela.add_invoice(())
+    inicio = len(tabela)
+    primeiras, posicoes = {}, {}
 
-    # Iterar sobre os produtos
-    produtos = root.findall('.//nfe:det', ns)
-
-    for produto in produtos:
-        item_data = nfe_info.copy()  # Copia dados gerais
-
-        # Dados do produto
-        prod = produto.find('nfe:prod', ns)
-        if prod is not None:
-            item_data['item_nfe'] = produto.get('nItem', '')
-            item_data['codigo_produto'] = prod.find('nfe:cProd', ns).text if prod.find('nfe:cProd', ns) is not None else ''
-
-            item_data['descricao_produto'] = prod.find('nfe:xProd', ns).text if prod.find('nfe:xProd', ns) is not None else ''
-            item_data['ncm'] = prod.find('nfe:NCM', ns).text if prod.find('nfe:NCM', ns) is not None else ''
-            item_data['cfop'] = prod.find('nfe:CFOP', ns).text if prod.find('nfe:CFOP', ns) is not None else ''
-            item_data['unidade_comercial'] = prod.find('nfe:uCom', ns).text if prod.find('nfe:uCom', ns) is not None else ''
-            item_data['quantidade_comercial'] = float(prod.find('nfe:qCom', ns).text) if prod.find('nfe:qCom', ns) is not None else 0.0
-            item_data['valor_unitario_comercial'] = float(prod.find('nfe:vUnCom', ns).text) if prod.find('nfe:vUnCom', ns) is not None else 0.0
-            item_data['valor_produto'] = float(prod.find('nfe:vProd', ns).text) if prod.find('nfe:vProd', ns) is not None else 0.0
-            item_data['pedido_compra'] = prod.find('nfe:xPed', ns).text if prod.find('nfe:xPed', ns) is not None else ''
-            item_data['item_pedido'] = prod.find('nfe:nItemPed', ns).text if prod.find('nfe:nItemPed', ns) is not None else ''
-
-            # Campos CEST e FCI (podem não existir)
-            cest = prod.find('nfe:CEST', ns)
-            item_data['cest'] = cest.text if cest is not None else ''
-
-            fci = prod.find('nfe:nFCI', ns)
-            item_data['fci'] = fci.text if fci is not None else ''
-
-        # Dados de impostos
-        imposto = produto.find('nfe:imposto', ns)
-        if imposto is not None:
-            # ICMS
-            icms = imposto.find('.//nfe:ICMS40', ns)
-            if icms is not None:
-                item_data['icms_origem'] = icms.find('nfe:orig', ns).text if icms.find('nfe:orig', ns) is not None else ''
-                item_data['icms_cst'] = icms.find('nfe:CST', ns).text if icms.find('nfe:CST', ns) is not None else ''
-                item_data['icms_desonerado'] = float(icms.find('nfe:vICMSDeson', ns).text) if icms.find('nfe:vICMSDeson', ns) is not None else 0.0
-                item_data['motivo_desoneracao'] = icms.find('nfe:motDesICMS', ns).text if icms.find('nfe:motDesICMS', ns) is not None else ''
-
-            # IPI
-            ipi = imposto.find('.//nfe:IPINT', ns)
-            if ipi is not None:
-                item_data['ipi_cst'] = ipi.find('nfe:CST', ns).text if ipi.find('nfe:CST', ns) is not None else ''
-
-            # PIS
-            pis = imposto.find('.//nfe:PISOutr', ns)
-            if pis is not None:
-                item_data['pis_cst'] = pis.find('nfe:CST', ns).text if pis.find('nfe:CST', ns) is not None else ''
-                item_data['pis_base_calculo'] = float(pis.find('nfe:vBC', ns).text) if pis.find('nfe:vBC', ns) is not None else 0.0
-                item_data['pis_aliquota'] = float(pis.find('nfe:pPIS', ns).text) if pis.find('nfe:pPIS', ns) is not None else 0.0
-                item_data['pis_valor'] = float(pis.find('nfe:vPIS', ns).text) if pis.find('nfe:vPIS', ns) is not None else 0.0
-
-            # COFINS
-            cofins = imposto.find('.//nfe:COFINSOutr', ns)
-            if cofins is not None:
-                item_data['cofins_cst'] = cofins.find('nfe:CST', ns).text if cofins.find('nfe:CST', ns) is not None else ''
-                item_data['cofins_base_calculo'] = float(cofins.find('nfe:vBC', ns).text) if cofins.find('nfe:vBC', ns) is not None else 0.0
-                item_data['cofins_aliquota'] = float(cofins.find('nfe:pCOFINS', ns).text) if cofins.find('nfe:pCOFINS', ns) is not None else 0.0
-                item_data['cofins_valor'] = float(cofins.find('nfe:vCOFINS', ns).text) if cofins.find('nfe:vCOFINS', ns) is not None else 0.0
-
-        # Adicionar informações de lote (inicializar com valores vazios)
-        item_data['infadic_produto'] = ''
-        item_data['infadic_lote'] = ''
-        item_data['infadic_qtd'] = ''
-        item_data['infadic_unidade'] = ''
-
-        # Buscar informações de lote
-        codigo_produto = item_data.get('codigo_produto', '')
-
-        if codigo_produto in lote_info_expandido and lote_info_expandido[codigo_produto]:
-            # Pega o primeiro lote disponível para este produto
-            lote_data = lote_info_expandido[codigo_produto].pop(0)
-            item_data['infadic_produto'] = codigo_produto
-            item_data['infadic_lote'] = lote_data['lote']
-            item_data['infadic_qtd'] = lote_data['quantidade']
-            item_data['infadic_unidade'] = lote_data['unidade']
-
-        produtos_data.append(item_data)
-
-    # Processar lotes restantes - criar linhas adicionais para produtos que têm mais lotes
-    for codigo_produto, lotes_restantes in lote_info_expandido.items():
-        for lote_data in lotes_restantes:
-            # Encontrar um produto base para copiar os dados
-            produto_base = None
-            for item in produtos_data:
-                if item.get('codigo_produto') == codigo_produto:
-                    produto_base = item.copy()
-                    break
-
-            if produto_base:
-                # Atualizar com dados do lote adicional
-                produto_base['infadic_produto'] = codigo_produto
-                produto_base['infadic_lote'] = lote_data['lote']
-                produto_base['infadic_qtd'] = lote_data['quantidade']
-                produto_base['infadic_unidade'] = lote_data['unidade']
-                # Limpar dados comerciais para não duplicar valores
-                produto_base['quantidade_comercial'] = 0.0
-                produto_base['valor_unitario_comercial'] = 0.0
-                produto_base['valor_produto'] = 0.0
-                produto_base['item_nfe'] = f"{produto_base.get('item_nfe', '')}_lote_extra"
-
-                produtos_data.append(produto_base)
-
-    return produtos_data
+    try:
+        for event, elem in nfe_xml.iterparse(_fonte_xml(xml_source), events=('start', 'end'), tags=TAGS_STREAMING):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                elif inf_nfe is None and elem.tag == TAG_INF_NFE:
+                    inf_nfe = elem
+                continue
+
+            if elem.tag == TAG_DET:
+                _adicionar_item(tabela, nota, _dados_produto(elem), primeiras, posicoes)
+
+                # Liberar a subárvore do produto já processado
+                elem.clear()
+                if inf_nfe is not None and len(inf_nfe) and inf_nfe[-1] is elem:
+                    del inf_nfe[-1]
+
+        if inf_nfe is None:
+            inf_nfe = root
+        tabela.set_invoice(nota, _dados_gerais(inf_nfe))
+        _distribuir_lotes(tabela, nota, _lotes_inf_adic(inf_nfe), primeiras, posicoes)
+    except BaseException:
+        # XML inválido no meio do documento: a tabela volta ao que era antes
+        del tabela.items[inicio:]
+        del tabela.headers[nota:]
+        raise
+
+def _dados_gerais(inf_nfe):
+    """
+    Dados gerais da NFe, comuns a todas as linhas de produto (e a chave de
+    acesso, que não vai para as linhas)
+    """
+    nfe_info = {COLUNA_CHAVE: inf_nfe.get('Id', '')}
+    for caminho, plano in PLANOS_GERAIS:
+        secao = inf_nfe.find(caminho)
+        if secao is not None:
+            extract_fields(plano, secao, nfe_info)
+    return nfe_info
+
+def _lotes_inf_adic(inf_nfe):
+    """
+    Lotes informados no infCpl (ver parse_lote_info)
+    """
+    inf_cpl = inf_nfe.find(TAG_INF_CPL)
+    if inf_cpl is None:
+        return {}
+    return parse_lote_info(inf_cpl.text)
+
+def _dados_produto(produto):
+    """
+    Extrai os dados de produto e impostos de um elemento <det>
+    (sem os dados gerais da NFe nem as colunas de lote)
+    """
+    item_data = {}
+
+    # Dados do produto
+    prod = produto.find(TAG_PROD)
+    if prod is not None:
+        item_data['item_nfe'] = produto.get('nItem', '')
+        extract_fields(PLANO_PROD, prod, item_data)
+
+    # Dados de impostos: uma passada pelos grupos de ICMS/ICMSSN, IPI, PIS e COFINS
+    imposto = produto.find(TAG_IMPOSTO)
+    if imposto is not None:
+        nfe_taxes.extract_taxes(imposto, TABELA_IMPOSTOS, item_data)
+
+    return item_data
+
+def _montar_linhas(nfe_info, itens, lote_info, tabela):
+    """
+    Acrescenta a nota à tabela: os dados gerais uma vez e uma linha por
+    produto, distribuindo os lotes do infCpl e criando linhas adicionais
+    para os lotes que sobrarem
+    """
+    nota = tabela.add_invoice(nfe_info)
+    primeiras, posicoes = {}, {}
+    for item in itens:
+        _adicionar_item(tabela, nota, item.copy(), primeiras, posicoes)
+    _distribuir_lotes(tabela, nota, lote_info, primeiras, posicoes)
+    return tabela
+
+def _adicionar_item(tabela, nota, item_data, primeiras, posicoes):
+    """
+    Acrescenta a linha de um produto (só os dados do produto; os gerais ficam
+    na nota) com as colunas de lote vazias, guardando a posição da linha por
+    código de produto para o _distribuir_lotes
+    """
+    item_data['infadic_produto'] = ''
+    item_data['infadic_lote'] = ''
+    item_data['infadic_qtd'] = ''
+    item_data['infadic_unidade'] = ''
+
+    codigo_produto = item_data.get('codigo_produto', '')
+    posicoes.setdefault(codigo_produto, []).append(len(tabela))
+    # Primeira linha de cada código de produto (base das linhas de lote extra)
+    primeiras.setdefault(codigo_produto, item_data)
+    tabela.add_item(nota, item_data)
+
+def _distribuir_lotes(tabela, nota, lote_info, primeiras, posicoes):
+    """
+    Cada linha de um produto recebe o próximo lote do seu código, na ordem
+    do infCpl; os lotes que sobrarem viram linhas adicionais
+    """
+    for codigo_produto, lotes in lote_info.items():
+        linhas = posicoes.get(codigo_produto, ())
+        for posicao, lote_data in zip(linhas, lotes):
+            tabela.update_item(posicao, {
+                'infadic_produto': codigo_produto,
+                'infadic_lote': lote_data['lote'],
+                'infadic_qtd': lote_data['quantidade'],
+                'infadic_unidade': lote_data['unidade'],
+            })
+
+        # Produto base para copiar os dados (lotes sem produto na nota são ignorados)
+        produto = primeiras.get(codigo_produto)
+        if produto is None:
+            continue
+
+        for lote_data in lotes[len(linhas):]:
+            produto_base = produto.copy()
+            # Atualizar com dados do lote adicional
+            produto_base['infadic_produto'] = codigo_produto
+            produto_base['infadic_lote'] = lote_data['lote']
+            produto_base['infadic_qtd'] = lote_data['quantidade']
+            produto_base['infadic_unidade'] = lote_data['unidade']
+            # Limpar dados comerciais para não duplicar valores
+            produto_base['quantidade_comercial'] = 0.0
+            produto_base['valor_unitario_comercial'] = 0.0
+            produto_base['valor_produto'] = 0.0
+            produto_base['item_nfe'] = f"{produto_base.get('item_nfe', '')}_lote_extra"
+
+            tabela.add_item(nota, produto_base)
 
 def parse_lote_info(inf_cpl_text):
     """
@@ -169,92 +380,123 @@ def parse_lote_info(inf_cpl_text):
     """
     lote_info = {}
 
-    # Encontrar a seção específica de lotes que começa com "-" seguido de código
-    lote_section_match = re.search(r'(-\d+-LOTE:.*)', inf_cpl_text, re.DOTALL)
-    if not lote_section_match:
+    # A seção de lotes começa no primeiro "-CODIGO-LOTE:"
+    inicio = RE_PRODUTO_LOTE.search(inf_cpl_text)
+    if not inicio:
         return lote_info
 
-    lote_section = lote_section_match.group(1)
-
-    # Dividir por produtos usando regex que identifica o padrão "-CODIGO-LOTE:"
-    produtos_parts = re.split(r'(?=-\d+-LOTE:)', lote_section)
-    produtos_parts = [p.strip() for p in produtos_parts if p.strip()]
-
-    for parte in produtos_parts:
-        # Extrair código do produto e dados dos lotes
-        match = re.match(r'-(\d+)-LOTE:\s*(.+?)(?=-\d+-LOTE:|$)', parte, re.DOTALL)
-        if not match:
+    # Uma única varredura: cada match é um novo produto ou um lote do produto atual
+    lotes = None
+    pendente = None  # (código, fim do marcador) de produto ainda sem lote
+    for match in RE_LOTES.finditer(inf_cpl_text, inicio.start()):
+        codigo_produto = match.group(1)
+        if codigo_produto is not None:
+            _registrar_sem_lotes(lote_info, inf_cpl_text, pendente, match.start())
+            pendente = (codigo_produto, match.end())
+            lotes = None
             continue
 
-        codigo_produto = match.group(1)
-        dados_lotes = match.group(2).strip()
-
-        if codigo_produto not in lote_info:
-            lote_info[codigo_produto] = []
-
-        # Processar os lotes usando regex para encontrar todos os padrões LOTE-QUANTIDADEUNIDADE
-        # Padrão: números-lote-quantidadewithcomma+UNIDADE
-        lote_pattern = r'(\d+)-([0-9,.]+)([A-Z]{2,3})'
-        lotes_encontrados = re.findall(lote_pattern, dados_lotes)
-        
-        for numero_lote, quantidade_str, unidade in lotes_encontrados:
-
-            # Processar quantidade
-            try:
-                # Se tem vírgula seguida de exatamente 3 dígitos, é separador de milhares
-                if re.match(r'^\d+,\d{3}$', quantidade_str):
-                    quantidade = float(quantidade_str.replace(',', ''))
-                elif re.match(r'^\d+\.\d{3}$', quantidade_str):
-                    quantidade = float(quantidade_str.replace('.', ''))
-                elif ',' in quantidade_str and not re.match(r'^\d+,\d{3}$', quantidade_str):
-                    quantidade = float(quantidade_str.replace(',', '.'))
-                elif '.' in quantidade_str and not re.match(r'^\d+\.\d{3}$', quantidade_str):
-                    quantidade = float(quantidade_str.replace('.', ''))
-                else:
-                    # Número simples
-                    quantidade = float(quantidade_str)
-
-            except ValueError:
-                quantidade = 0.0
-
-            lote_info[codigo_produto].append({
-                'lote': numero_lote,
-                'quantidade': quantidade,
-                'unidade': unidade
-            })
+        if lotes is None:
+            codigo_produto, _ = pendente
+            lotes = lote_info.setdefault(codigo_produto, [])
+            pendente = None
 
+        numero_lote, quantidade_str, unidade = match.group(2, 3, 4)
+        lotes.append({
+            'lote': numero_lote,
+            'quantidade': _quantidade_lote(quantidade_str),
+            'unidade': unidade
+        })
+
+    _registrar_sem_lotes(lote_info, inf_cpl_text, pendente, len(inf_cpl_text))
     return lote_info
 
-def main():
+def _registrar_sem_lotes(lote_info, texto, pendente, fim):
+    # Produto cujo trecho não trouxe nenhum lote: entra com lista vazia se o
+    # trecho não estiver em branco
+    if pendente is None:
+        return
+    codigo_produto, inicio = pendente
+    if RE_NAO_BRANCO.search(texto, inicio, fim):
+        lote_info.setdefault(codigo_produto, [])
+
+def _quantidade_lote(quantidade_str):
+    """
+    Quantidade do lote: "1,300" e "16.000" (3 dígitos após o separador) são
+    milhares; com vírgula em outra posição ela é o separador decimal
+    """
+    try:
+        if RE_MILHAR.fullmatch(quantidade_str):
+            return float(quantidade_str.replace(',', '').replace('.', ''))
+        if ',' in quantidade_str:
+            return float(quantidade_str.replace(',', '.'))
+        if '.' in quantidade_str:
+            return float(quantidade_str.replace('.', ''))
+        # Número simples
+        return float(quantidade_str)
+    except ValueError:
+        return 0.0
+
+def montar_dataframe(produtos_data):
+    """
+    DataFrame com as linhas extraídas (lista de dicts ou InvoiceTable), na
+    ordem de COLUNAS_ORDENADAS
+    """
+    if isinstance(produtos_data, InvoiceTable):
+        # Os dados gerais só são repetidos por linha aqui
+        df = pd.DataFrame(produtos_data.column_data())
+    else:
+        df = pd.DataFrame(produtos_data)
+
+    # Reordenar colunas (apenas as que existem)
+    colunas_existentes = [col for col in COLUNAS_ORDENADAS if col in df.columns]
+    return df[colunas_existentes]
+
+def colunas_saida(presentes=None):
+    """
+    Gancho do perfil: colunas de COLUNAS_ORDENADAS (na ordem de saída) entre
+    as colunas com valores; todas quando presentes é None
+    """
+    if presentes is None:
+        return list(COLUNAS_ORDENADAS)
+    presentes = set(presentes)
+    return [col for col in COLUNAS_ORDENADAS if col in presentes]
+
+def ler_xml(payload):
+    """
+    Gancho do perfil: InvoiceTable de um XML (árvore, ou streaming para
+    XMLs grandes)
+    """
+    return parse_nfe_tabela(payload)
+
+def montar_tabela_final(produtos_data, catalogo=None, metrics=None):
+    """
+    Gancho do perfil: (DataFrame final, sem relatório); Cargill não usa catálogo
+    """
+    with stage(metrics, 'dataframe') as record:
+        df = montar_dataframe(produtos_data)
+        record['rows'] = len(df)
+    return df, None
+
+def tabela_tipada(df):
+    """
+    DataFrame final com tipos para o Parquet: valores numéricos (inclusive
+    infadic_qtd) como float e CNPJ/CFOP/CST como dicionário
+    """
+    return typed_columns(df, COLUNAS_NUMERICAS, COLUNAS_DICIONARIO)
+
+def main(xml_file_path='nfe.xml'):
     """
     Função principal para executar o parser
+    Para converter vários arquivos de uma vez use o nfe_cli.py
     """
-    # Caminho do arquivo XML (altere conforme necessário)
-    xml_file_path = 'nfe.xml'  # Substitua pelo caminho do seu arquivo
 
     try:
         # Parse do XML
         produtos_data = parse_nfe_xml(xml_file_path)
 
-        # Criar DataFrame
-        df = pd.DataFrame(produtos_data)
-
-        # Definir ordem das colunas (incluindo as novas colunas de infAdic)
-        colunas_ordenadas = [
-            'numero_nfe', 'serie', 'data_emissao', 'emit_cnpj', 'emit_nome',
-            'dest_cnpj', 'dest_nome', 'valor_total_nfe', 'icms_desonerado_total',
-            'item_nfe', 'codigo_produto', 'descricao_produto', 'ncm', 'cest', 'fci',
-            'cfop', 'unidade_comercial', 'quantidade_comercial', 'valor_unitario_comercial',
-            'valor_produto', 'pedido_compra', 'item_pedido',
-            'infadic_produto', 'infadic_lote', 'infadic_qtd', 'infadic_unidade',
-            'icms_origem', 'icms_cst', 'icms_desonerado', 'motivo_desoneracao',
-            'ipi_cst', 'pis_cst', 'pis_base_calculo', 'pis_aliquota', 'pis_valor',
-            'cofins_cst', 'cofins_base_calculo', 'cofins_aliquota', 'cofins_valor'
-        ]
-
-        # Reordenar colunas (apenas as que existem)
-        colunas_existentes = [col for col in colunas_ordenadas if col in df.columns]
-        df = df[colunas_existentes]
+        # Criar DataFrame na ordem das colunas
+        df = montar_dataframe(produtos_data)
 
         # Exibir resultado
         print("Dados extraídos da NFe:")
@@ -276,7 +518,7 @@ def main():
 
         # Salvar em arquivo Excel
         output_file = 'nfe_dados_completos.xlsx'
-        df.to_excel(output_file, index=False, engine='openpyxl')
+        write_xlsx(df, output_file, sheet_name='Sheet1')
         print(f"\nDados salvos em: {output_file}")
 
         # Salvar em CSV também
@@ -316,12 +558,8 @@ def test_with_xml_string():
     <!-- Cole aqui o XML completo da NFe -->
     </nfeProc>'''
 
-    # Salvar XML em arquivo temporário para teste
-    with open('temp_nfe.xml', 'w', encoding='utf-8') as f:
-        f.write(xml_content)
-
-    # Parse do arquivo temporário
-    return parse_nfe_xml('temp_nfe.xml')
+    # Parse direto da memória, sem arquivo temporário
+    return parse_nfe_xml(xml_content.encode('utf-8'))
 
 # Função para testar apenas o parsing de lotes
 def test_lote_parsing():
@@ -336,9 +574,37 @@ def test_lote_parsing():
     print("Resultado:", result)
     return result
 
+# Coluna da tabela por campo do nfe_sqlite; None: não existe no layout
+# As linhas '_lote_extra' (lotes além do primeiro de um produto) viram só lotes
+CAMPOS_BANCO = {
+    'invoice': {
+        'access_key': COLUNA_CHAVE, 'number': 'numero_nfe', 'series': 'serie',
+        'issued_at': 'data_emissao', 'emit_cnpj': 'emit_cnpj', 'emit_name': 'emit_nome',
+        'dest_cnpj': 'dest_cnpj', 'dest_name': 'dest_nome', 'total_value': 'valor_total_nfe',
+    },
+    'item_number': 'item_nfe',
+    'item': {
+        'product_code': 'codigo_produto', 'ean': None, 'description': 'descricao_produto',
+        'ncm': 'ncm', 'cfop': 'cfop', 'unit': 'unidade_comercial', 'quantity': 'quantidade_comercial',
+        'unit_value': 'valor_unitario_comercial', 'total_value': 'valor_produto',
+    },
+    'lot': {'lot': 'infadic_lote', 'quantity': 'infadic_qtd', 'unit': 'infadic_unidade'},
+}
+
+PROFILE = ClientProfile(
+    'Cargill',
+    new_table=nova_tabela,
+    parse=ler_xml,
+    build_table=montar_tabela_final,
+    output_columns=colunas_saida,
+    typed_table=tabela_tipada,
+    downloads=('xlsx', 'csv', 'parquet'),
+    database_fields=CAMPOS_BANCO,
+)
+
 if __name__ == "__main__":
     # Descomente a linha abaixo para testar apenas o parsing de lotes
     # test_lote_parsing()
 
-    # Execução normal
-    df_result = main()
+    # Execução normal (caminho do XML opcional na linha de comando)
+    df_result = main(*sys.argv[1:2])
@@ -0,0 +1,601 @@
+"""
+Laborlog NFe parser: one row per <det> with the invoice header fields, plus
+the PROCV (EAN -> CÓD. LABORLOG) and CSV formatting stages.
+
+Kept free of Streamlit so it can run in worker processes; the app reports the
+exceptions raised here (see XMLtoEXCEL.parse_nfe_xml).
+"""
+import io
+import nfe_xml
+from nfe_export import typed_columns
+from nfe_fields import NFE_NS, compile_fields, extract_fields, nfe_tag, plan_columns
+from nfe_lazy import lazy_import
+from nfe_metrics import stage
+from nfe_model import InvoiceTable
+from nfe_profiles import ClientProfile
+
+# Only the DataFrame stages need pandas; parsing (e.g. in the workers) does not
+pd = lazy_import('pandas')
+
+# Invoice (header) fields, relative to <infNFe>: (column, path, type, default)
+INVOICE_FIELDS = [
+    ('nf_numnota', 'ide/nNF', str, ""),
+    ('nf_serie', 'ide/serie', str, ""),
+    ('nf_dt_emissao', None, str, ""),    # Ensure empty
+    ('nf_hora', None, str, ""),          # Ensure empty
+    ('nf_dt_entrada', None, str, ""),    # Ensure empty
+    ('nf_horaentrada', None, str, ""),   # Ensure empty
+    ('nf_cfop', None, str, ""),          # Will be filled from items
+    ('nf_obs', None, str, ""),
+    ('nf_base_icms', 'total/ICMSTot/vBC', str, "0"),
+    ('nf_valor_icms', 'total/ICMSTot/vICMS', str, "0"),
+    ('nf_valor_total', 'total/ICMSTot/vNF', str, "0"),
+    ('nf_valor_total_prod', 'total/ICMSTot/vProd', str, "0"),
+
+    # Client information
+    ('cli_razao', None, str, ""),        # Ensure empty
+    ('cli_cnpj', None, str, ""),         # Ensure empty
+    ('cli_ie', None, str, ""),           # Ensure empty
+    ('cli_endereco', None, str, ""),     # Ensure empty
+    ('cli_bairro', None, str, ""),       # Ensure empty
+    ('cli_cidade', None, str, ""),       # Ensure empty
+    ('cli_uf', None, str, ""),           # Ensure empty
+    ('cli_cep', None, str, ""),          # Ensure empty
+
+    # Supplier (fornecedor) information
+    ('forn_razao', 'emit/xNome', str, ""),
+    ('forn_cnpj', 'emit/CNPJ', str, ""),
+    ('forn_ie', 'emit/IE', str, ""),
+    ('forn_endereco', 'emit/enderEmit/xLgr', str, ""),
+    ('forn_bairro', 'emit/enderEmit/xBairro', str, ""),
+    ('forn_cidade', 'emit/enderEmit/xMun', str, ""),
+    ('forn_uf', 'emit/enderEmit/UF', str, ""),
+    ('forn_cep', 'emit/enderEmit/CEP', str, ""),
+]
+
+# Item fields, relative to <det>
+ITEM_FIELDS = [
+    ('item_codigo', 'prod/cProd', str, ""),
+    ('item_ean', 'prod/cEAN', str, ""),  # Armazenar o EAN para uso posterior no PROCV
+    ('item_descricao', 'prod/xProd', str, ""),
+    ('item_ncm', 'prod/NCM', str, ""),
+    ('item_un', 'prod/uCom', str, ""),
+    ('item_qtde', 'prod/qCom', str, "0"),
+    ('item_lote', 'prod/rastro/nLote', str, ""),
+    ('item_serial', None, str, ""),      # Ensure empty
+    ('item_modelo', None, str, ""),      # Ensure empty
+    ('item_valor_unit', 'prod/vUnCom', str, "0"),
+    ('item_valor_total', 'prod/vProd', str, "0"),
+    ('item_valor_icms', None, str, ""),  # Ensure empty
+    ('item_valor_ipi', None, str, ""),   # Ensure empty
+    ('item_aliq_icms', None, str, ""),   # Ensure empty
+    ('item_aliq_ipi', None, str, ""),    # Ensure empty
+]
+
+INVOICE_PLAN = compile_fields(INVOICE_FIELDS)
+ITEM_PLAN = compile_fields(ITEM_FIELDS)
+CFOP_TAG = nfe_tag('prod/CFOP')
+
+# Decimal columns: written with ',' in the CSV, typed in Parquet
+NUMERIC_COLUMNS = [
+    'nf_base_icms', 'nf_valor_icms', 'nf_valor_total', 
+    'nf_valor_total_prod', 'item_valor_unit', 'item_valor_total', 
+    'item_qtde', 'item_valor_icms', 'item_valor_ipi', 
+    'item_aliq_icms', 'item_aliq_ipi'
+]
+
+# Low-cardinality columns, dictionary-encoded in Parquet
+DICTIONARY_COLUMNS = [
+    'nf_cfop', 'cli_cnpj', 'cli_uf', 'forn_cnpj', 'forn_uf', 'forn_cidade',
+    'item_ncm', 'item_un',
+]
+
+# Row layout of the parsed data ({**invoice_data, **item})
+INVOICE_COLUMNS = plan_columns(INVOICE_PLAN)
+ITEM_COLUMNS = plan_columns(ITEM_PLAN)
+COLUMNS = INVOICE_COLUMNS + ITEM_COLUMNS
+# Fields kept in the InvoiceTable for nfe_sqlite but not part of the Laborlog
+# layout (besides nf_chave, the infNFe Id, and item_cfop)
+RECORD_FIELDS = [
+    ('nf_dh_emissao', 'ide/dhEmi', str, ""),
+    ('dest_cnpj', 'dest/CNPJ', str, ""),
+    ('dest_razao', 'dest/xNome', str, ""),
+]
+RECORD_PLAN = compile_fields(RECORD_FIELDS)
+RECORD_COLUMNS = ('nf_chave',) + plan_columns(RECORD_PLAN)
+
+# InvoiceTable layout: nf_cfop is the invoice CFOP known when the item was
+# read, so it is kept per item
+INVOICE_TABLE_COLUMNS = tuple(column for column in INVOICE_COLUMNS if column != 'nf_cfop')
+TABLE_HEADER_COLUMNS = INVOICE_TABLE_COLUMNS + RECORD_COLUMNS
+TABLE_ITEM_COLUMNS = ('nf_cfop',) + ITEM_COLUMNS + ('item_cfop',)
+ICMSTOT_TAG = nfe_tag('ICMSTot')
+
+# Elements _iter_invoice_items acts on (besides the document root)
+STREAM_TAGS = [nfe_tag(tag) for tag in ('NFe', 'infNFe', 'det', 'total')]
+
+def parse_nfe_xml(xml_content, streaming=False):
+    """
+    Parse NFe XML content and extract relevant data.
+    With streaming=True the document is read incrementally (see iter_nfe_xml).
+    Raises ET.ParseError for malformed XML and ValueError when no NFe is found.
+    """
+    if streaming:
+        return list(iter_nfe_xml(xml_content))
+
+    # Define namespace
+    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+    
+    # Parse XML content
+    root = nfe_xml.fromstring(xml_content)
+    
+    # Find NFe element
+    if 'nfeProc' in root.tag:
+        nfe = root.find('.//nfe:NFe', ns)
+    else:
+        nfe = root if 'NFe' in root.tag else None
+    
+    if nfe is None:
+        raise ValueError("NFe not found in XML")
+    
+    # Extract infNFe data
+    inf_nfe = nfe.find('.//nfe:infNFe', ns)
+    if inf_nfe is None:
+        raise ValueError("infNFe not found in XML")
+    
+    # Extract general invoice information
+    invoice_data = extract_fields(INVOICE_PLAN, inf_nfe)
+    
+    # Extract items
+    items = []
+    for det in inf_nfe.findall('.//nfe:det', ns):
+        cfop, item = _parse_item(det)
+        if cfop and not invoice_data['nf_cfop']:
+            invoice_data['nf_cfop'] = cfop
+        
+        items.append({**invoice_data, **item})
+    
+    return items
+
+def iter_nfe_xml(xml_source):
+    """
+    Stream NFe items using incremental parsing, one row per <det>.
+
+    Each <det> is converted as soon as it closes and its subtree is cleared,
+    so memory stays bounded by the rows instead of the whole document tree.
+    The header (ide/emit/total) is captured once; because <total> follows the
+    items in the NFe layout, rows are released when it closes.
+    Raises ET.ParseError for malformed XML and ValueError when no NFe is found.
+    """
+    for invoice_data, items, _ in _iter_invoice_items(xml_source):
+        for nf_cfop, _, item in items:
+            row = {**invoice_data, **item}
+            row['nf_cfop'] = nf_cfop
+            yield row
+
+def new_table():
+    """
+    Empty InvoiceTable with the COLUMNS layout.
+    """
+    return InvoiceTable(TABLE_HEADER_COLUMNS, TABLE_ITEM_COLUMNS, COLUMNS, shared=DICTIONARY_COLUMNS)
+
+def parse_nfe_table(xml_source, table=None, streaming=None):
+    """
+    Parse into an InvoiceTable (see nfe_model): the header is stored once
+    per invoice and each item as a tuple. The tree is built unless streaming
+    is True, or None and the document reaches nfe_xml.STREAMING_MIN_BYTES.
+    Returns the table; raises like iter_nfe_xml.
+    """
+    if table is None:
+        table = new_table()
+    if streaming is None:
+        streaming = nfe_xml.prefer_streaming(xml_source)
+    invoices = _iter_invoice_items(xml_source) if streaming else _tree_invoice_items(xml_source)
+    current = invoice = None
+
+    for invoice_data, pending, inf_nfe in invoices:
+        if invoice_data is not current:
+            current = invoice_data
+            record = extract_fields(RECORD_PLAN, inf_nfe)
+            record['nf_chave'] = inf_nfe.get('Id', "")
+            invoice = table.add_invoice((*map(invoice_data.__getitem__, INVOICE_TABLE_COLUMNS),
+                                         *map(record.__getitem__, RECORD_COLUMNS)))
+        for nf_cfop, cfop, item in pending:
+            table.add_item(invoice, (nf_cfop, *map(item.__getitem__, ITEM_COLUMNS), cfop))
+
+    return table
+
+def _tree_invoice_items(xml_source):
+    # Same output as _iter_invoice_items, from the whole document tree
+    if isinstance(xml_source, (str, bytes, bytearray)):
+        root = nfe_xml.fromstring(xml_source)
+    else:
+        root = nfe_xml.parse(xml_source)
+
+    if 'nfeProc' in root.tag:
+        nfe = root.find('.//' + NFE_NS + 'NFe')
+    else:
+        nfe = root if 'NFe' in root.tag else None
+    if nfe is None:
+        raise ValueError("NFe not found in XML")
+    inf_nfe = nfe.find('.//' + NFE_NS + 'infNFe')
+    if inf_nfe is None:
+        raise ValueError("infNFe not found in XML")
+
+    nf_cfop = ""
+    items = []
+    for det in inf_nfe.iter(NFE_NS + 'det'):
+        cfop, item = _parse_item(det)
+        if cfop and not nf_cfop:
+            nf_cfop = cfop
+        items.append((nf_cfop, cfop, item))
+    if items:
+        yield extract_fields(INVOICE_PLAN, inf_nfe), items, inf_nfe
+
+def _iter_invoice_items(xml_source):
+    # Yields (invoice_data, [(nf_cfop, item CFOP, item), ...], infNFe element)
+    # as soon as the header is known
+    if isinstance(xml_source, str):
+        xml_source = io.StringIO(xml_source)
+    elif isinstance(xml_source, (bytes, bytearray)):
+        xml_source = io.BytesIO(xml_source)
+
+    root = nfe = inf_nfe = None
+    inf_nfe_open = False
+    invoice_data = None
+    nf_cfop = ""
+    pending = []  # (nf_cfop, cfop, item) waiting for the invoice totals
+
+    for event, elem in nfe_xml.iterparse(xml_source, events=('start', 'end'), tags=STREAM_TAGS):
+        tag = elem.tag
+        if event == 'start':
+            if root is None:
+                # Same root rules as the tree-based parser
+                root = elem
+                if 'nfeProc' not in tag:
+                    if 'NFe' not in tag:
+                        raise ValueError("NFe not found in XML")
+                    nfe = root
+            elif nfe is None:
+                if tag == NFE_NS + 'NFe':
+                    nfe = elem
+            elif inf_nfe is None and tag == NFE_NS + 'infNFe':
+                inf_nfe = elem
+                inf_nfe_open = True
+            continue
+
+        if not inf_nfe_open:
+            continue
+
+        if tag == NFE_NS + 'det':
+            cfop, item = _parse_item(elem)
+            if cfop and not nf_cfop:
+                nf_cfop = cfop
+
+            # Release the finished item subtree
+            elem.clear()
+            if len(inf_nfe) and inf_nfe[-1] is elem:
+                del inf_nfe[-1]
+
+            if invoice_data is None:
+                pending.append((nf_cfop, cfop, item))
+            else:
+                yield invoice_data, [(nf_cfop, cfop, item)], inf_nfe
+        elif tag == NFE_NS + 'total':
+            # ide/emit come before <total>, so the header is complete here
+            if invoice_data is None and elem.find(ICMSTOT_TAG) is not None:
+                invoice_data = extract_fields(INVOICE_PLAN, inf_nfe)
+                if pending:
+                    yield invoice_data, pending, inf_nfe
+                pending = []
+        elif elem is inf_nfe:
+            inf_nfe_open = False
+
+    if nfe is None:
+        raise ValueError("NFe not found in XML")
+    if inf_nfe is None:
+        raise ValueError("infNFe not found in XML")
+
+    # Invoice without ICMSTot: header values fall back to their defaults
+    if pending:
+        yield extract_fields(INVOICE_PLAN, inf_nfe), pending, inf_nfe
+
+def _parse_item(det):
+    """
+    Extract the item fields of one <det> element.
+    Returns the item CFOP (used for nf_cfop) and the item dict.
+    """
+    # CFOP for invoice
+    cfop_tag = det.find(CFOP_TAG)
+    cfop = cfop_tag.text if cfop_tag is not None else ""
+
+    # Extract product data
+    item = extract_fields(ITEM_PLAN, det)
+    
+    return cfop, item
+
+def read_catalog(path):
+    """
+    Load the laborlog.xlsx catalog, keeping EAN and CÓD. LABORLOG as text.
+    """
+    return pd.read_excel(path, dtype={'EAN': str, 'CÓD. LABORLOG': str})
+
+def ean_mapping(laborlog_df):
+    """
+    Build the PROCV dictionary: EAN -> CÓD. LABORLOG.
+    Prefer nfe_catalog.load_ean_index, which caches the result per workbook.
+    """
+    valid = laborlog_df['EAN'].notna() & laborlog_df['CÓD. LABORLOG'].notna()
+    ean_to_codigo = {}
+    for ean, codigo in zip(laborlog_df.loc[valid, 'EAN'], laborlog_df.loc[valid, 'CÓD. LABORLOG']):
+        ean_to_codigo[str(ean).strip()] = str(codigo).strip()
+    return ean_to_codigo
+
+def apply_procv(df, ean_to_codigo):
+    """
+    Replace item_codigo by the CÓD. LABORLOG of the item EAN.
+    Items whose EAN is missing from the catalog get "ERRO"; status_procv tells
+    which rows were found.
+    """
+    # Adicionar uma coluna para mostrar quais códigos EAN foram encontrados/não encontrados
+    df['status_procv'] = ''
+
+    if ean_to_codigo:
+        if 'item_ean' in df.columns:
+            # Um único map sobre a coluna inteira em vez de percorrer linha a linha
+            eans = df['item_ean'].fillna('').astype(str)
+            codigos = eans.str.strip().map(ean_to_codigo)
+            encontrado = (eans != '') & codigos.notna()
+        else:
+            codigos = pd.Series(None, index=df.index, dtype=object)
+            encontrado = pd.Series(False, index=df.index)
+
+        # Se o EAN não existe ou está vazio, definir como "ERRO"
+        df['item_codigo'] = codigos.where(encontrado, "ERRO")
+        df['status_procv'] = encontrado.map({True: 'Encontrado', False: 'Não encontrado'})
+
+    return df
+
+def unmatched_eans(df):
+    """
+    EANs of a PROCV'd DataFrame that are missing from the catalog, with the
+    number of items and a sample description, most frequent first.
+    """
+    columns = ['item_ean', 'item_descricao', 'ocorrencias']
+    if 'status_procv' not in df.columns or 'item_ean' not in df.columns:
+        return pd.DataFrame(columns=columns)
+
+    missing = df.loc[df['status_procv'] == 'Não encontrado', ['item_ean', 'item_descricao']]
+    missing = missing.assign(item_ean=missing['item_ean'].fillna('').astype(str).str.strip())
+    report = missing.groupby('item_ean', sort=False).agg(
+        item_descricao=('item_descricao', 'first'),
+        ocorrencias=('item_descricao', 'size'),
+    ).reset_index()
+    return _sort_unmatched(report)[columns]
+
+def merge_unmatched(reports):
+    """
+    Combine unmatched_eans reports of several chunks into one.
+    """
+    reports = [report for report in reports if len(report)]
+    if not reports:
+        return unmatched_eans(pd.DataFrame())
+    report = pd.concat(reports, ignore_index=True).groupby('item_ean', sort=False).agg(
+        item_descricao=('item_descricao', 'first'),
+        ocorrencias=('ocorrencias', 'sum'),
+    ).reset_index()
+    return _sort_unmatched(report)
+
+def _sort_unmatched(report):
+    # Most frequent first, ties by EAN so chunked and whole-batch reports agree
+    return report.sort_values(['ocorrencias', 'item_ean'], ascending=[False, True]).reset_index(drop=True)
+
+def build_dataframe(all_data, ean_to_codigo, report=False, metrics=None):
+    """
+    Turn the parsed rows (row dicts or an InvoiceTable) into
+    the final Laborlog table: PROCV by EAN, then the CSV column layout from
+    format_table.
+    With report=True returns (table, unmatched_eans report). metrics
+    (nfe_metrics.Metrics) times the dataframe, procv and format stages.
+    """
+    # Converter dados para DataFrame (InvoiceTable: cabeçalho repetido por
+    # item só aqui)
+    with stage(metrics, 'dataframe') as record:
+        if isinstance(all_data, InvoiceTable):
+            df = pd.DataFrame(all_data.column_data(), columns=list(all_data.columns))
+        else:
+            df = pd.DataFrame(all_data)
+        record['rows'] = len(df)
+
+    # Aplicar o PROCV utilizando o EAN para cada linha
+    with stage(metrics, 'procv') as record:
+        df = apply_procv(df, ean_to_codigo)
+        unmatched = unmatched_eans(df) if report else None
+        record['rows'] = len(df)
+
+    # Remover colunas temporárias antes de gerar o CSV final
+    if 'item_ean' in df.columns:
+        df = df.drop('item_ean', axis=1)
+    if 'status_procv' in df.columns:
+        df = df.drop('status_procv', axis=1)
+
+    # Gerar CSV com as colunas na ordem especificada
+    with stage(metrics, 'format') as record:
+        final_df = format_table(df) if len(df) else None
+        record['rows'] = len(df)
+    if report:
+        return final_df, unmatched
+    return final_df
+
+def write_csv(chunks, out, ean_to_codigo, report=False, metrics=None):
+    """
+    Streaming CSV export of the Laborlog table.
+
+    chunks yields parsed rows (InvoiceTable or row dicts), e.g.
+    one per batch of files; each one goes through build_dataframe and is
+    appended to the text file out right away, so memory is bounded by the
+    chunk instead of the whole batch. The output is byte-identical to build_dataframe(...)
+    .to_csv(sep=';') over all the rows; open out with encoding='utf-8-sig'
+    and newline='' to get the download format.
+    Returns the number of rows written, or (rows, unmatched_eans report)
+    with report=True. metrics gets the build_dataframe stages and 'export_csv'
+    per chunk.
+    """
+    total = 0
+    reports = []
+    for rows in chunks:
+        if not len(rows):
+            continue
+        df, unmatched = build_dataframe(rows, ean_to_codigo, report=True, metrics=metrics)
+        if df is None:
+            continue
+        with stage(metrics, 'export_csv') as record:
+            out.write(df.to_csv(index=False, sep=';', header=total == 0))
+            record['rows'] = len(df)
+        total += len(df)
+        if report:
+            reports.append(unmatched)
+
+    if report:
+        return total, merge_unmatched(reports)
+    return total
+
+def typed_table(df):
+    """
+    Final table with typed columns for Parquet: decimals back to numbers,
+    CNPJ/UF/CFOP dictionary-encoded.
+    """
+    return typed_columns(df, NUMERIC_COLUMNS, DICTIONARY_COLUMNS, decimal_comma=True)
+
+def generate_csv(data):
+    """
+    Convert parsed data to CSV format with specific column order.
+    """
+    if not data:
+        return None
+    
+    return format_table(pd.DataFrame(data))
+
+# Column order of the final CSV
+CSV_COLUMNS = [
+    'nf_numnota',      # Número da Nota Fiscal
+    'nf_serie',        # Série da Nota Fiscal
+    'nf_dt_emissao',   # Data de Emissão
+    'nf_hora',         # Hora de Emissão
+    'nf_dt_entrada',   # Data de Entrada
+    'nf_horaentrada',  # Hora de Entrada
+    'nf_cfop',         # CFOP
+    'nf_obs',          # Observações
+    'nf_base_icms',    # Base ICMS
+    'nf_valor_icms',   # Valor ICMS
+    'nf_valor_total',  # Valor Total
+    'nf_valor_total_prod', # Valor Total dos Produtos
+    'cli_razao',       # Razão Social do Cliente
+    'cli_cnpj',        # CNPJ do Cliente
+    'cli_ie',          # Inscrição Estadual do Cliente
+    'cli_endereco',    # Endereço do Cliente
+    'cli_bairro',      # Bairro do Cliente
+    'cli_cidade',      # Cidade do Cliente
+    'cli_uf',          # UF do Cliente
+    'cli_cep',         # CEP do Cliente
+    'forn_razao',      # Razão Social do Fornecedor
+    'forn_cnpj',       # CNPJ do Fornecedor
+    'forn_ie',         # Inscrição Estadual do Fornecedor
+    'forn_endereco',   # Endereço do Fornecedor
+    'forn_bairro',     # Bairro do Fornecedor
+    'forn_cidade',     # Cidade do Fornecedor
+    'forn_uf',         # UF do Fornecedor
+    'forn_cep',        # CEP do Fornecedor
+    'item_codigo',     # Código do Item
+    'item_descricao',  # Descrição do Item
+    'item_ncm',        # NCM do Item
+    'item_un',         # Unidade do Item
+    'item_qtde',       # Quantidade do Item
+    'item_lote',       # Lote do Item
+    'item_serial',     # Serial do Item
+    'item_modelo',     # Modelo do Item
+    'item_valor_unit', # Valor Unitário do Item
+    'item_valor_total',# Valor Total do Item
+    'item_valor_icms', # Valor ICMS do Item
+    'item_valor_ipi',  # Valor IPI do Item
+    'item_aliq_icms',  # Alíquota ICMS do Item
+    'item_aliq_ipi'    # Alíquota IPI do Item
+]
+
+def format_table(df):
+    """
+    Apply the CSV column order and text/decimal formatting to a DataFrame.
+    """
+    # Select only the specified columns
+    columns = CSV_COLUMNS
+    
+    # Ensure all columns exist (with empty values if needed)
+    for col in columns:
+        if col not in df.columns:
+            df[col] = ""
+    
+    # Reorder columns to ensure they appear in the CSV in the correct order
+    df = df[columns]
+    
+    # Ensure specific columns are treated as text
+    text_columns = [
+        'forn_razao', 
+        'forn_endereco', 'forn_bairro', 'forn_cidade', 
+        'item_descricao', 'cli_razao', 'cli_cnpj', 'cli_ie', 
+        'cli_endereco', 'cli_bairro', 'cli_cidade'
+    ]
+    for col in text_columns:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    
+    # Format numeric columns to replace '.' with ',' for decimal separator
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            # Replace '.' with ',' without changing the structure of the number
+            df[col] = df[col].astype(str).str.replace('.', ',', regex=False)
+    
+    return df
+
+def build_final_table(all_data, ean_to_codigo=None, metrics=None):
+    """
+    Profile hook: build_dataframe with the report of EANs missing from the catalog.
+    """
+    return build_dataframe(all_data, ean_to_codigo or {}, report=True, metrics=metrics)
+
+def output_columns(present=None):
+    """
+    Profile hook: the CSV layout is fixed, whatever columns have values.
+    """
+    return list(CSV_COLUMNS)
+
+# Table column per nfe_sqlite field; None: not available in the layout.
+# item_number None numbers the items of each invoice in order.
+DATABASE_FIELDS = {
+    'invoice': {
+        'access_key': 'nf_chave', 'number': 'nf_numnota', 'series': 'nf_serie',
+        'issued_at': 'nf_dh_emissao', 'emit_cnpj': 'forn_cnpj', 'emit_name': 'forn_razao',
+        'dest_cnpj': 'dest_cnpj', 'dest_name': 'dest_razao', 'total_value': 'nf_valor_total',
+    },
+    'item_number': None,
+    'item': {
+        'product_code': 'item_codigo', 'ean': 'item_ean', 'description': 'item_descricao',
+        'ncm': 'item_ncm', 'cfop': 'item_cfop', 'unit': 'item_un', 'quantity': 'item_qtde',
+        'unit_value': 'item_valor_unit', 'total_value': 'item_valor_total',
+    },
+    'lot': {'lot': 'item_lote', 'quantity': None, 'unit': None},
+}
+
+PROFILE = ClientProfile(
+    'Laborlog',
+    new_table=new_table,
+    parse=parse_nfe_table,
+    build_table=build_final_table,
+    output_columns=output_columns,
+    typed_table=typed_table,
+    downloads=('csv', 'parquet'),
+    catalog='laborlog.xlsx',
+    catalog_code='CÓD. LABORLOG',
+    merge_reports=merge_unmatched,
+    write_csv=write_csv,
+    database_fields=DATABASE_FIELDS,
+)